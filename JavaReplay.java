@@ -0,0 +1,189 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.BufferedReader;
+import java.io.ByteArrayInputStream;
+import java.io.FileDescriptor;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.nio.file.Files;
+import java.nio.file.NoSuchFileException;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.security.Permission;
+import java.util.HashMap;
+import java.util.Map;
+
+/**
+ * Replays inputs through the `main` of one class without starting a JVM per input.
+ *
+ * <p>Every request on stdin is one line
+ *
+ * <pre>&lt;timeout ms&gt;\t&lt;input&gt;\t&lt;stdout file&gt;\t&lt;stderr file&gt;</pre>
+ *
+ * and runs `main` once with `System.in`, `System.out` and `System.err` redirected to the files,
+ * answered with `ok &lt;exit status&gt;` or `timeout` on stdout. `ready` is printed once the class
+ * is loaded. Each run gets a fresh class loader, so static fields start over as they would in a
+ * new JVM, only the class files are read once. `System.exit` ends the run with its status instead
+ * of the JVM. A run that can't be stopped after its timeout takes the JVM down with it, the
+ * caller starts a new one.
+ *
+ * <p>Usage: java -cp &lt;dir of JavaReplay.class&gt; JavaReplay &lt;class dir&gt; &lt;class name&gt;
+ */
+public class JavaReplay {
+  // how long a timed out run gets to die after Thread.stop
+  static final long STOP_GRACE_MS = 1000;
+
+  /** Thrown in place of `System.exit` of the target. */
+  static class ExitException extends SecurityException {
+    final int status;
+
+    ExitException(int status) {
+      super("System.exit(" + status + ")");
+      this.status = status;
+    }
+  }
+
+  static class NoExitSecurityManager extends SecurityManager {
+    // threads the target starts inherit it
+    static final InheritableThreadLocal<Boolean> inTarget =
+        new InheritableThreadLocal<Boolean>() {
+          @Override
+          protected Boolean initialValue() {
+            return false;
+          }
+        };
+
+    @Override
+    public void checkPermission(Permission perm) {}
+
+    @Override
+    public void checkPermission(Permission perm, Object context) {}
+
+    @Override
+    public void checkExit(int status) {
+      if (inTarget.get()) {
+        throw new ExitException(status);
+      }
+    }
+  }
+
+  /** Defines the classes of one directory from bytes read once for all runs. */
+  static class TargetLoader extends ClassLoader {
+    final Path classDir;
+    final Map<String, byte[]> classes;
+
+    TargetLoader(Path classDir, Map<String, byte[]> classes) {
+      super(JavaReplay.class.getClassLoader());
+      this.classDir = classDir;
+      this.classes = classes;
+    }
+
+    @Override
+    protected Class<?> findClass(String name) throws ClassNotFoundException {
+      byte[] bytes;
+      synchronized (classes) {
+        bytes = classes.get(name);
+        if (bytes == null) {
+          try {
+            bytes = Files.readAllBytes(classDir.resolve(name.replace('.', '/') + ".class"));
+          } catch (NoSuchFileException e) {
+            throw new ClassNotFoundException(name);
+          } catch (IOException e) {
+            throw new ClassNotFoundException(name, e);
+          }
+          classes.put(name, bytes);
+        }
+      }
+      return defineClass(name, bytes, 0, bytes.length);
+    }
+  }
+
+  static Path classDir;
+  static String className;
+  static final Map<String, byte[]> classes = new HashMap<>();
+
+  static Method loadMain() throws Exception {
+    return new TargetLoader(classDir, classes)
+        .loadClass(className)
+        .getMethod("main", String[].class);
+  }
+
+  /** Runs `main` once, returns the reply or null if it timed out and can't be stopped. */
+  static String run(long timeout, String input, String stdout, String stderr) throws Exception {
+    final Method main = loadMain();
+    final int[] status = {0};
+    try (InputStream in = new BufferedInputStream(new FileInputStream(input));
+        PrintStream out = new PrintStream(new BufferedOutputStream(new FileOutputStream(stdout)));
+        PrintStream err = new PrintStream(new BufferedOutputStream(new FileOutputStream(stderr)))) {
+      System.setIn(in);
+      System.setOut(out);
+      System.setErr(err);
+      Thread runner =
+          new Thread(
+              () -> {
+                NoExitSecurityManager.inTarget.set(true);
+                try {
+                  main.invoke(null, (Object) new String[0]);
+                } catch (InvocationTargetException e) {
+                  Throwable cause = e.getCause();
+                  if (cause instanceof ExitException) {
+                    status[0] = ((ExitException) cause).status;
+                  } else {
+                    // what the default handler of a new JVM prints
+                    err.print("Exception in thread \"main\" ");
+                    cause.printStackTrace(err);
+                    status[0] = 1;
+                  }
+                } catch (Throwable e) {
+                  e.printStackTrace(err);
+                  status[0] = 1;
+                }
+              },
+              "main");
+      runner.setContextClassLoader(main.getDeclaringClass().getClassLoader());
+      runner.start();
+      runner.join(timeout);
+      if (runner.isAlive()) {
+        runner.stop();
+        runner.join(STOP_GRACE_MS);
+        return runner.isAlive() ? null : "timeout";
+      }
+    }
+    return "ok " + status[0];
+  }
+
+  public static void main(String[] args) throws Exception {
+    classDir = Paths.get(args[0]);
+    className = args[1];
+    BufferedReader requests = new BufferedReader(new InputStreamReader(System.in));
+    PrintStream control = new PrintStream(new FileOutputStream(FileDescriptor.out), true);
+    PrintStream log = new PrintStream(new FileOutputStream(FileDescriptor.err), true);
+    loadMain();
+    System.setIn(new ByteArrayInputStream(new byte[0]));
+    System.setSecurityManager(new NoExitSecurityManager());
+    control.println("ready");
+
+    String line;
+    while ((line = requests.readLine()) != null) {
+      String[] request = line.split("\t");
+      String reply;
+      try {
+        reply = run(Long.parseLong(request[0]), request[1], request[2], request[3]);
+      } catch (Exception e) {
+        log.println("JavaReplay: " + line + ": " + e);
+        reply = "ok 1";
+      }
+      control.println(reply == null ? "timeout" : reply);
+      if (reply == null) {
+        Runtime.getRuntime().halt(1);
+      }
+    }
+    Runtime.getRuntime().halt(0);
+  }
+}
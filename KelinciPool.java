@@ -0,0 +1,213 @@
+import java.io.BufferedReader;
+import java.io.ByteArrayInputStream;
+import java.io.DataInputStream;
+import java.io.File;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.reflect.Field;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.InetAddress;
+import java.net.ServerSocket;
+import java.net.Socket;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.file.Files;
+import java.security.Permission;
+import java.util.Arrays;
+
+/**
+ * A Kelinci server that stays up across target classes.
+ *
+ * <p>It answers the requests of Kelinci's `fuzzerside/interface` on the port it is started with,
+ * the same way `edu.cmu.sv.kelinci.Kelinci` does, but the target is set on stdin with
+ *
+ * <pre>load &lt;instrumented class dir&gt; &lt;class name&gt;</pre>
+ *
+ * which answers `ok` or `error &lt;reason&gt;` on stdout. Every target is loaded in its own class
+ * loader, so nothing of the previous one is left, while `edu.cmu.sv.kelinci.Mem` comes from the
+ * pool's class path and is shared with all of them.
+ *
+ * <p>Usage: java -cp kelinci.jar:. KelinciPool &lt;port&gt; [timeout ms]
+ */
+public class KelinciPool {
+  // the statuses and modes of Kelinci's protocol
+  static final byte STATUS_SUCCESS = 0;
+  static final byte STATUS_TIMEOUT = 1;
+  static final byte STATUS_CRASH = 2;
+  static final byte STATUS_COMM_ERROR = 4;
+  static final byte MODE_LOCAL = 1;
+
+  static volatile URLClassLoader loader;
+  static volatile Method targetMain;
+  static byte[] mem;
+  static Field prevLocation;
+  static long timeout = 300000;
+
+  /** Keeps `System.exit` of a target from taking down the server. */
+  static class NoExitSecurityManager extends SecurityManager {
+    static final ThreadLocal<Boolean> inTarget = ThreadLocal.withInitial(() -> false);
+
+    @Override
+    public void checkPermission(Permission perm) {}
+
+    @Override
+    public void checkPermission(Permission perm, Object context) {}
+
+    @Override
+    public void checkExit(int status) {
+      if (inTarget.get()) {
+        throw new SecurityException("System.exit(" + status + ") of the target");
+      }
+    }
+  }
+
+  static String load(String classDir, String className) throws Exception {
+    URLClassLoader previous = loader;
+    URLClassLoader next =
+        new URLClassLoader(
+            new URL[] {new File(classDir).toURI().toURL()}, KelinciPool.class.getClassLoader());
+    try {
+      Method main = next.loadClass(className).getMethod("main", String[].class);
+      targetMain = main;
+      loader = next;
+    } catch (Exception | LinkageError e) {
+      next.close();
+      return "error " + e;
+    }
+    if (previous != null) {
+      previous.close();
+    }
+    return "ok";
+  }
+
+  static byte run(File input) {
+    Arrays.fill(mem, (byte) 0);
+    try {
+      if (prevLocation != null) {
+        prevLocation.setInt(null, 0);
+      }
+    } catch (IllegalAccessException e) {
+      // the bitmap is still cleared
+    }
+    final Method main = targetMain;
+    final byte[] status = {STATUS_SUCCESS};
+    Thread runner =
+        new Thread(
+            () -> {
+              NoExitSecurityManager.inTarget.set(true);
+              try (InputStream in = Files.newInputStream(input.toPath())) {
+                System.setIn(in);
+                main.invoke(null, (Object) new String[] {input.getAbsolutePath()});
+              } catch (InvocationTargetException e) {
+                if (!(e.getCause() instanceof SecurityException)) {
+                  status[0] = STATUS_CRASH;
+                }
+              } catch (Throwable e) {
+                status[0] = STATUS_CRASH;
+              }
+            });
+    runner.setContextClassLoader(loader);
+    runner.start();
+    try {
+      runner.join(timeout);
+    } catch (InterruptedException e) {
+      Thread.currentThread().interrupt();
+    }
+    if (runner.isAlive()) {
+      runner.stop();
+      return STATUS_TIMEOUT;
+    }
+    return status[0];
+  }
+
+  static void serve(Socket socket, File tmp) throws IOException {
+    try (Socket s = socket) {
+      DataInputStream in = new DataInputStream(s.getInputStream());
+      OutputStream out = s.getOutputStream();
+      int mode = in.read();
+      byte[] size = new byte[4];
+      in.readFully(size);
+      int length =
+          (size[0] & 0xff) | (size[1] & 0xff) << 8 | (size[2] & 0xff) << 16 | (size[3] & 0xff) << 24;
+      byte[] payload = new byte[length];
+      in.readFully(payload);
+      if (targetMain == null) {
+        out.write(STATUS_COMM_ERROR);
+        return;
+      }
+      File input = tmp;
+      if (mode == MODE_LOCAL) {
+        input = new File(new String(payload, "UTF-8").trim());
+      } else {
+        Files.write(tmp.toPath(), payload);
+      }
+      byte status = run(input);
+      out.write(status);
+      out.write(mem, 0, mem.length);
+      out.flush();
+    }
+  }
+
+  public static void main(String[] args) throws Exception {
+    int port = Integer.parseInt(args[0]);
+    if (args.length > 1) {
+      timeout = Long.parseLong(args[1]);
+    }
+    Class<?> memClass = Class.forName("edu.cmu.sv.kelinci.Mem");
+    mem = (byte[]) memClass.getField("mem").get(null);
+    try {
+      prevLocation = memClass.getField("prev_location");
+    } catch (NoSuchFieldException e) {
+      prevLocation = null;
+    }
+
+    // stdin and stdout are the control channel, targets get the input and print into the void
+    BufferedReader commands = new BufferedReader(new InputStreamReader(System.in));
+    PrintStream control = new PrintStream(new FileOutputStream(FileDescriptor.out), true);
+    System.setOut(
+        new PrintStream(
+            new OutputStream() {
+              @Override
+              public void write(int b) {}
+
+              @Override
+              public void write(byte[] b, int off, int len) {}
+            }));
+    System.setIn(new ByteArrayInputStream(new byte[0]));
+    System.setSecurityManager(new NoExitSecurityManager());
+
+    File tmp = File.createTempFile("kelinci-pool-", ".input");
+    tmp.deleteOnExit();
+    ServerSocket server = new ServerSocket(port, 16, InetAddress.getLoopbackAddress());
+    Thread acceptor =
+        new Thread(
+            () -> {
+              while (true) {
+                try {
+                  serve(server.accept(), tmp);
+                } catch (IOException e) {
+                  // the interface reconnects for the next input
+                }
+              }
+            });
+    acceptor.setDaemon(true);
+    acceptor.start();
+
+    String line;
+    while ((line = commands.readLine()) != null) {
+      String[] command = line.trim().split(" ");
+      if (command.length == 3 && command[0].equals("load")) {
+        control.println(load(command[1], command[2]));
+      } else {
+        control.println("error unknown command " + line);
+      }
+    }
+    System.exit(0);
+  }
+}
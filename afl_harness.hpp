@@ -0,0 +1,70 @@
+// Entry point for programs built in AFL deferred forkserver or persistent mode.
+// The wrapper source written by scripts/harness.py renames the program's own
+// `main` to `afl_user_main`, includes the program and then this file.
+//
+//  AFL_HARNESS_PERSISTENT  run `afl_user_main` in a `__AFL_LOOP`,
+//                          otherwise only defer the forkserver
+//  AFL_HARNESS_MAIN_ARGS   `afl_user_main` takes (argc, argv)
+#include <stdio.h>
+#include <sys/mman.h>
+#include <unistd.h>
+
+#include <iostream>
+
+#ifdef main
+#undef main
+#endif
+
+#ifdef AFL_HARNESS_MAIN_ARGS
+#define AFL_HARNESS_CALL_MAIN() afl_user_main(argc, argv)
+#else
+#define AFL_HARNESS_CALL_MAIN() afl_user_main()
+#endif
+
+#ifndef AFL_HARNESS_LOOP_COUNT
+#define AFL_HARNESS_LOOP_COUNT 1000
+#endif
+
+#if defined(AFL_HARNESS_PERSISTENT) && defined(__AFL_FUZZ_TESTCASE_LEN)
+__AFL_FUZZ_INIT();
+
+static int afl_harness_stdin = -1;
+
+// Point fd 0 and `stdin` at a fresh copy of the test case.
+static void afl_harness_reset_stdin(const unsigned char *buf, ssize_t len) {
+  if (afl_harness_stdin < 0) {
+    afl_harness_stdin = memfd_create("afl_harness_stdin", 0);
+    dup2(afl_harness_stdin, 0);
+  }
+  ftruncate(afl_harness_stdin, 0);
+  if (len > 0) {
+    pwrite(afl_harness_stdin, buf, len, 0);
+  }
+  // fd 0 shares the file offset with `afl_harness_stdin`,
+  // fseek also drops whatever stdio buffered from the last input.
+  clearerr(stdin);
+  fseek(stdin, 0, SEEK_SET);
+  std::cin.clear();
+}
+
+int main(int argc, char **argv) {
+  __AFL_INIT();
+  unsigned char *buf = __AFL_FUZZ_TESTCASE_BUF;
+  while (__AFL_LOOP(AFL_HARNESS_LOOP_COUNT)) {
+    afl_harness_reset_stdin(buf, __AFL_FUZZ_TESTCASE_LEN);
+    AFL_HARNESS_CALL_MAIN();
+    std::cout.flush();
+    fflush(stdout);
+    fflush(stderr);
+  }
+  return 0;
+}
+#else
+int main(int argc, char **argv) {
+#ifdef __AFL_HAVE_MANUAL_CONTROL
+  // static initializers already ran, fork from here
+  __AFL_INIT();
+#endif
+  return AFL_HARNESS_CALL_MAIN();
+}
+#endif
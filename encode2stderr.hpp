@@ -1,3 +1,6 @@
+#ifndef ENCODE2STDERR_HPP
+#define ENCODE2STDERR_HPP
+
 
 #include <assert.h>
 #include <stdarg.h>
@@ -76,3 +79,5 @@ int scanf_alt(const char *fmt, const char *names, Args const &...args) {
 // so alway replace it
 #define GETS_ALT(str) fgets(str, sizeof(str), stdin)
 #endif
+
+#endif // ENCODE2STDERR_HPP
@@ -1,3 +1,6 @@
+#ifndef FUNCTION_EMBEDDING_HEADER_HPP
+#define FUNCTION_EMBEDDING_HEADER_HPP
+
 #include <bits/stdc++.h>
 
 // C++ headers
@@ -29,3 +32,5 @@
 #endif
 
 using namespace std;
+
+#endif // FUNCTION_EMBEDDING_HEADER_HPP
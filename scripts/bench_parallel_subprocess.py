@@ -0,0 +1,73 @@
+# Measure how many short jobs per second `parallel_subprocess` can schedule.
+# Uses `/bin/true` as a stand-in for `run_one_file` children.
+from common import *
+import argparse
+import subprocess
+import time
+
+
+def legacy_parallel_subprocess(iter, jobs, subprocess_creator, on_exit=None):
+    """The `os.wait` + full-set polling loop `parallel_subprocess` used to run."""
+    ret = {}
+    processes = set()
+    for input in iter:
+        processes.add((subprocess_creator(input), input))
+        if len(processes) >= jobs:
+            os.wait()
+            exited_processes = [(p, i) for p, i in processes if p.poll() is not None]
+            for p, i in exited_processes:
+                processes.remove((p, i))
+                if on_exit is not None:
+                    ret[i] = on_exit(p)
+    for p, i in processes:
+        p.wait()
+        if on_exit is not None:
+            ret[i] = on_exit(p)
+    return ret
+
+
+def true_creator(_):
+    return subprocess.Popen(
+        ["/bin/true"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def bench(scheduler, num: int, jobs: int) -> Tuple[float, int]:
+    start = time.perf_counter()
+    ret = scheduler(range(num), jobs, true_creator, lambda p: p.returncode)
+    elapsed = time.perf_counter() - start
+    return num / elapsed, len(ret)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel_subprocess")
+    parser.add_argument(
+        "-n", "--num", type=int, help="Number of jobs to run.", default=10000
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="Number of parallel jobs.", default=CORES
+    )
+    parser.add_argument(
+        "--legacy",
+        action="store_true",
+        help="Also run the os.wait based scheduler for comparison.",
+    )
+    args = parser.parse_args()
+    jobs = int(args.jobs)
+
+    schedulers = [("parallel_subprocess", parallel_subprocess)]
+    if args.legacy:
+        schedulers.append(("os.wait + poll", legacy_parallel_subprocess))
+
+    for name, scheduler in schedulers:
+        rate, collected = bench(scheduler, args.num, jobs)
+        print(
+            f"{name}: {rate:.1f} jobs/sec "
+            f"({collected}/{args.num} exit statuses collected, {jobs} jobs)"
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    main()
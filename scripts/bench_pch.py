@@ -0,0 +1,75 @@
+# Compare compile time of a sample of programs with and without the precompiled prelude.
+# Usage: python3 scripts/bench_pch.py -w POJ104 -n 200
+import dataset
+from dataset import *
+import argparse
+import shutil
+import tempfile
+import time
+
+
+def compiled(p: subprocess.Popen) -> bool:
+    p.communicate()
+    return p.returncode == 0
+
+
+def time_compile(files: List[Tuple[str, str]], jobs: int, use_pch: bool) -> Tuple[float, int]:
+    dataset.USE_PCH = use_pch
+    start = time.perf_counter()
+    ret = parallel_subprocess(
+        files,
+        jobs,
+        lambda r: compile_one_file(r, lang="C/C++"),
+        compiled,
+    )
+    return time.perf_counter() - start, sum(ret.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark precompiled headers")
+    parser.add_argument(
+        "-w", "--workdir", type=str, required=True, help="Workdir with src/ in it."
+    )
+    parser.add_argument(
+        "-n", "--num", type=int, help="Number of programs to compile.", default=100
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="Number of threads to use.", default=CORES
+    )
+    parser.add_argument("--encode", action="store_true")
+    args = parser.parse_args()
+    dataset.ENCODE_INPUT = args.encode
+
+    srcdir = path.join(path.abspath(args.workdir), "src")
+    sources = [
+        path.join(srcdir, i, p)
+        for i in os.listdir(srcdir)
+        for p in os.listdir(path.join(srcdir, i))
+        if p.endswith(".cpp")
+    ]
+    random.seed(0)
+    sources = random.sample(sources, min(args.num, len(sources)))
+
+    encode = ["_ENCODE_INPUT_"] if args.encode else []
+    for macros in [[], ["_NO_MATH_H_"]]:
+        if not build_pch(macros + encode):
+            exit(1)
+
+    outdir = tempfile.mkdtemp()
+    try:
+        files = [(src, path.join(outdir, str(n))) for n, src in enumerate(sources)]
+        for use_pch in [False, True]:
+            elapsed, ok = time_compile(files, int(args.jobs), use_pch)
+            print(
+                f"{'with' if use_pch else 'without'} PCH: {elapsed:.2f}s "
+                f"for {len(files)} programs ({ok} compiled, "
+                f"{len(files) / elapsed:.2f} programs/sec, {args.jobs} jobs)"
+            )
+    finally:
+        shutil.rmtree(outdir)
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    main()
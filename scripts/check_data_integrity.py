@@ -4,6 +4,7 @@ from multiprocessing import Pool
 from functools import reduce
 from typing import NewType, List
 from common import EMBDING_HOME, CORES
+from pack import PackReader, get_pack_path
 
 
 def check_io(input_file_names: List[str], output_file_names: List[str]) -> str:
@@ -35,10 +36,16 @@ def check_integrity(dir_name: str) -> str:
     err_msg = ""
 
     try:
-        input_files = set(
-            map(lambda s: s.split(".csv")[0], os.listdir(dir_name + "/input_csv"))
-        )
-        output_files = set(os.listdir(dir_name + "/output"))
+        if os.path.isfile(get_pack_path(dir_name)):
+            with PackReader(get_pack_path(dir_name)) as pack:
+                names = pack.names()
+                input_files = set(q for q in names if pack.has(q, "input_csv"))
+                output_files = set(q for q in names if pack.has(q, "output"))
+        else:
+            input_files = set(
+                map(lambda s: s.split(".csv")[0], os.listdir(dir_name + "/input_csv"))
+            )
+            output_files = set(os.listdir(dir_name + "/output"))
         queue_files = set(
             filter(lambda f: f[0] != ".", os.listdir(dir_name + "/queue"))
         )
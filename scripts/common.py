@@ -2,10 +2,14 @@ import logging
 from logging import error, info, warning
 import os
 from os import path
-from typing import Iterable, Callable, Set, Tuple, TypeVar, Optional, Dict
+from typing import Iterable, Callable, Set, Tuple, TypeVar, Optional, Dict, List, Generic
+from typing import Deque
+from collections import deque
 import subprocess
 from tqdm import tqdm
 import socket
+import selectors
+import time
 
 AFL = os.getenv("AFL")
 if AFL == None:
@@ -28,14 +32,64 @@ if CORES == None:
 
     CORES = multiprocessing.cpu_count()
     warning(f"CORES not set, default to all cores. (nproc = {CORES})")
+CORES = int(CORES)
 
 EMBDING_HOME = os.getenv("EMBDING_HOME")
 if EMBDING_HOME == None:
     error("EMBDING_HOME not set, please tell me where the code is.")
     exit(1)
 
+# Headers every preprocessed C/C++ source includes, in order.
+# Sources include them instead of inlining them so the build can use a PCH.
+PRELUDE_HEADERS = ["header.hpp", "encode2stderr.hpp"]
+
+
+def get_prelude() -> str:
+    return "".join(f'#include "{h}"\n' for h in PRELUDE_HEADERS)
+
+
+def starts_with_prelude(src: str) -> bool:
+    """
+    Whether `src` exists and includes the prelude, sources preprocessed
+    before it was introduced have the headers pasted in instead.
+    """
+    prelude = get_prelude()
+    try:
+        with open(src, "r", errors="replace") as f:
+            return f.read(len(prelude)) == prelude
+    except OSError:
+        return False
+
+
+def format_one_file(src: str):
+    return subprocess.Popen(
+        [f"{LLVM}/bin/clang-format", src],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+
+def format_code(code: str) -> str:
+    """clang-format `code` through a pipe instead of a file."""
+    return subprocess.run(
+        [f"{LLVM}/bin/clang-format", "--assume-filename=main.cpp"],
+        input=code.encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    ).stdout.decode()
+
+
+def format_files_in_place(files: Iterable[str]):
+    return subprocess.Popen(
+        [f"{LLVM}/bin/clang-format", "-i", *files],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
 __T = TypeVar("__T")
 __R = TypeVar("__R")
+_Input = TypeVar("_Input")
 
 
 def unreachable(s: str = ""):
@@ -43,6 +97,125 @@ def unreachable(s: str = ""):
     exit(1)
 
 
+class ChildReaper(Generic[_Input]):
+    """
+    Waits for child processes by pid instead of `os.wait`.
+    Each `Popen` is registered with the input it was created for,
+    `wait` blocks until at least one of them exits and reaps only those,
+    so every `Popen` gets its own exit status.
+
+    Uses a pidfd per child when the kernel supports it,
+    otherwise falls back to `os.waitid` with `WNOWAIT`.
+    """
+
+    def __init__(self):
+        self.children: Dict[int, Tuple[subprocess.Popen, _Input]] = {}
+        self.use_pidfd = ChildReaper.pidfd_supported()
+        self.selector = selectors.DefaultSelector() if self.use_pidfd else None
+
+    @staticmethod
+    def pidfd_supported() -> bool:
+        if not hasattr(os, "pidfd_open"):
+            return False
+        try:
+            os.close(os.pidfd_open(os.getpid()))
+            return True
+        except OSError:
+            return False
+
+    def __len__(self):
+        return len(self.children)
+
+    def add(self, p: subprocess.Popen, input: _Input):
+        self.children[p.pid] = (p, input)
+        if self.use_pidfd:
+            fd = os.pidfd_open(p.pid)
+            self.selector.register(fd, selectors.EVENT_READ, p.pid)
+
+    def _reap(self, pid: int) -> Tuple[subprocess.Popen, _Input]:
+        p, input = self.children.pop(pid)
+        p.wait()
+        return p, input
+
+    def wait(self, timeout: Optional[float] = None) -> List[Tuple[subprocess.Popen, _Input]]:
+        """
+        Wait for at least one child to exit, or `timeout` seconds to pass.
+        Returns the exited children with their inputs.
+        """
+        if len(self.children) == 0:
+            return []
+        if self.use_pidfd:
+            exited = []
+            for key, _ in self.selector.select(timeout):
+                self.selector.unregister(key.fd)
+                os.close(key.fd)
+                exited.append(self._reap(key.data))
+            return exited
+
+        if timeout is not None:
+            # `os.waitid` cannot time out, poll instead
+            exited = [pid for pid, (p, _) in self.children.items() if p.poll() is not None]
+            if not exited:
+                time.sleep(timeout)
+            return [self._reap(pid) for pid in exited]
+        while True:
+            result = os.waitid(os.P_ALL, 0, os.WEXITED | os.WNOWAIT)
+            if result is not None and result.si_pid in self.children:
+                return [self._reap(result.si_pid)]
+            # the child doesn't belong to us, don't steal its exit status
+            exited = [pid for pid, (p, _) in self.children.items() if p.poll() is not None]
+            if exited:
+                return [self._reap(pid) for pid in exited]
+            time.sleep(0.01)
+
+    def close(self):
+        if self.selector is not None:
+            for key in list(self.selector.get_map().values()):
+                os.close(key.fd)
+            self.selector.close()
+            self.selector = None
+
+
+class CoreAllocator:
+    """
+    Hands out the cores this process may run on to AFL instances, so each
+    is started with its own `-b <core>` instead of AFL looking for a free
+    core itself, which races with the instances started right before it.
+    A core is free again once its instance is `release`d after being reaped.
+    """
+
+    def __init__(self, cores: Optional[Iterable[int]] = None):
+        if cores is None:
+            cores = (
+                sorted(os.sched_getaffinity(0))
+                if hasattr(os, "sched_getaffinity")
+                else range(CORES)
+            )
+        self.free: Deque[int] = deque(cores)
+        self.used: Dict[int, int] = {}
+
+    def acquire(self) -> Optional[int]:
+        """A free core, or None if all are taken and the instance shouldn't bind."""
+        return self.free.popleft() if self.free else None
+
+    def assign(self, p: subprocess.Popen, core: Optional[int]):
+        """Record that `p` runs on the `acquire`d `core`."""
+        if core is not None:
+            self.used[p.pid] = core
+
+    def release(self, p: subprocess.Popen):
+        core = self.used.pop(p.pid, None)
+        if core is not None:
+            self.free.append(core)
+
+
+def get_afl_binding(core: Optional[int]) -> Tuple[List[str], Optional[Dict[str, str]]]:
+    """afl-fuzz arguments and environment to run it on `core`, or unbound if None."""
+    if core is None:
+        return [], {**os.environ, "AFL_NO_AFFINITY": "1"}
+    return ["-b", str(core)], None
+
+
 def parallel_subprocess(
     iter: Iterable[__T],
     jobs: int,
@@ -59,23 +232,24 @@ def parallel_subprocess(
     User has to guarantee elements in `iter` is unique, or the output may be incorrect.
     """
     ret = {}
-    processes: Set[Tuple[subprocess.Popen, __T]] = set()
-    for input in tqdm(iter):
-        processes.add((subprocess_creator(input), input))
-        if len(processes) >= jobs:
-            # wait for a child process to exit
-            os.wait()
-            exited_processes = [(p, i) for p, i in processes if p.poll() is not None]
-            for p, i in exited_processes:
-                processes.remove((p, i))
-                if on_exit is not None:
-                    ret[i] = on_exit(p)
-    # wait for remaining processes to exit
-    for p, i in processes:
-        p.wait()
-        # let `on_exit` to decide wait for or kill the process
-        if on_exit is not None:
-            ret[i] = on_exit(p)
+    reaper: ChildReaper[__T] = ChildReaper()
+
+    def collect(exited: List[Tuple[subprocess.Popen, __T]]):
+        for p, i in exited:
+            if on_exit is not None:
+                ret[i] = on_exit(p)
+
+    try:
+        for input in tqdm(iter):
+            reaper.add(subprocess_creator(input), input)
+            # refill the slot as soon as a child exits
+            while len(reaper) >= max(jobs, 1):
+                collect(reaper.wait())
+        # wait for remaining processes to exit
+        while len(reaper) > 0:
+            collect(reaper.wait())
+    finally:
+        reaper.close()
     return ret
 
 
@@ -96,33 +270,29 @@ def parallel_subprocess_pair(
     fst elem of process pair will be killed when snd elem is finished,
     """
     ret = {}
-    processes: Set[Tuple[subprocess.Popen, subprocess.Popen, __T]] = set()
-    for input in tqdm(iter):
-        processes.add((*subprocess_creator(input), input))
-        if len(processes) * 2 >= jobs:
-            # wait for two child process to exit
-            # NOTE: need to wait for two process to exit or fuzzer may not start
-            os.wait()
-            os.wait()
-            exited_processes = [
-                (p1, p2, i) for p1, p2, i in processes if p2.poll() is not None
-            ]
-            for p1, p2, i in exited_processes:
-                processes.remove((p1, p2, i))
-                # kill server if its alive
-                if p1.poll() is None:
-                    p1.kill()
-                if on_exit is not None:
-                    ret[i] = on_exit(p2)
-    # wait for remaining processes to exit
-    for p1, p2, i in processes:
-        p2.wait()
-        # kill server if its alive
-        if p1.poll() is None:
-            p1.kill()
-        # let `on_exit` to decide wait for or kill the process
-        if on_exit is not None:
-            ret[i] = on_exit(p2)
+    reaper: ChildReaper[Tuple[subprocess.Popen, __T]] = ChildReaper()
+
+    def collect(exited):
+        for p2, (p1, i) in exited:
+            # kill server if its alive
+            if p1.poll() is None:
+                p1.kill()
+            p1.wait()
+            if on_exit is not None:
+                ret[i] = on_exit(p2)
+
+    try:
+        for input in tqdm(iter):
+            p1, p2 = subprocess_creator(input)
+            # only the fuzzer is waited for, the server lives as long as it
+            reaper.add(p2, (p1, input))
+            while len(reaper) * 2 >= max(jobs, 2):
+                collect(reaper.wait())
+        # wait for remaining processes to exit
+        while len(reaper) > 0:
+            collect(reaper.wait())
+    finally:
+        reaper.close()
     return ret
 
 
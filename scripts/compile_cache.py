@@ -0,0 +1,187 @@
+# Content addressed cache of compiled binaries.
+#
+# A binary is keyed by the hash of its preprocessed source together with the
+# compiler and flags used to build it, so a changed header or flag rebuilds it
+# and an identical program under another path is built only once.
+# Objects live in <cache_dir>/objects, an sqlite index in <cache_dir>/index.db
+# keeps their size and last use for LRU eviction, and remembers the key of each
+# source so an unchanged tree can be checked with `stat` calls only.
+import glob
+import hashlib
+import json
+import os
+from os import path
+import re
+import shutil
+import sqlite3
+import time
+from typing import Iterable, List, Optional, Tuple
+
+# flags whose value depends on the source path but not on the binary
+PATH_DEPENDENT_FLAGS = ["-fmacro-prefix-map="]
+# environment read by afl-clang-fast++ that changes the instrumentation
+AFL_COMPILE_ENV = re.compile(
+    r"^AFL_(LLVM_|USE_|INST_|CC|CXX|HARDEN|DONT_OPTIMIZE|NO_BUILTIN)"
+)
+
+
+def parse_size(s: str) -> int:
+    """parse a size like 512M or 20G into bytes"""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    if s[-1].upper() in units:
+        return int(float(s[:-1]) * units[s[-1].upper()])
+    return int(s)
+
+
+def flags_digest(cmd: List[str], paths: Iterable[str]) -> str:
+    """
+    Hash the compiler invocation `cmd` without the per program `paths` in it,
+    together with the identity of the compiler, its AFL++ passes next to it
+    and the AFL_* environment it reads.
+    """
+    paths = set(paths)
+    flags = [
+        "<path>" if arg in paths else arg
+        for arg in cmd
+        if not any(arg.startswith(f) for f in PATH_DEPENDENT_FLAGS)
+    ]
+    compiler = [cmd[0]] + sorted(glob.glob(path.join(path.dirname(cmd[0]), "*.so")))
+    env = sorted((k, v) for k, v in os.environ.items() if AFL_COMPILE_ENV.match(k))
+    return hashlib.sha256(
+        json.dumps([flags, file_stats(compiler), env]).encode()
+    ).hexdigest()
+
+
+def file_stats(files: Iterable[str]) -> List[Tuple[str, Optional[int], Optional[int]]]:
+    stats = []
+    for f in files:
+        try:
+            st = os.stat(f)
+            stats.append((f, st.st_size, st.st_mtime_ns))
+        except OSError:
+            stats.append((f, None, None))
+    return stats
+
+
+def deps_digest(deps: Iterable[str]) -> str:
+    """
+    Hash the identity of files outside of the source that may be included,
+    a source is preprocessed again if any of them changed.
+    """
+    return hashlib.sha256(json.dumps(file_stats(deps)).encode()).hexdigest()
+
+
+def cache_key(preprocessed_digest: str, flags: str) -> str:
+    return hashlib.sha256(f"{preprocessed_digest}\n{flags}".encode()).hexdigest()
+
+
+class CompileCache:
+    def __init__(self, cache_dir: str, max_size: int):
+        self.cache_dir = path.abspath(cache_dir)
+        self.objdir = path.join(self.cache_dir, "objects")
+        self.max_size = max_size
+        os.makedirs(self.objdir, exist_ok=True)
+        self.db = sqlite3.connect(path.join(self.cache_dir, "index.db"))
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS objects (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS objects_last_used ON objects (last_used);
+            CREATE TABLE IF NOT EXISTS sources (
+                src TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                stamp TEXT NOT NULL,
+                key TEXT NOT NULL
+            );
+            """
+        )
+
+    def get_object_path(self, key: str) -> str:
+        return path.join(self.objdir, key[:2], key)
+
+    def lookup_source(self, src: str, stamp: str) -> Optional[str]:
+        """
+        Key of `src` if neither it nor `stamp` changed since it was recorded,
+        `stamp` should cover the flags and dependencies of `src`.
+        """
+        row = self.db.execute(
+            "SELECT mtime_ns, size, stamp, key FROM sources WHERE src = ?", (src,)
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            st = os.stat(src)
+        except OSError:
+            return None
+        mtime_ns, size, recorded_stamp, key = row
+        if (st.st_mtime_ns, st.st_size, stamp) != (mtime_ns, size, recorded_stamp):
+            return None
+        return key
+
+    def record_sources(self, sources: Iterable[Tuple[str, str, str]]):
+        """Remember the key of each (src, stamp, key)."""
+        rows = []
+        for src, stamp, key in sources:
+            st = os.stat(src)
+            rows.append((src, st.st_mtime_ns, st.st_size, stamp, key))
+        self.db.executemany(
+            "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)", rows
+        )
+        self.db.commit()
+
+    def fetch(self, key: str, dst: str) -> bool:
+        """Hardlink (or copy) the cached binary of `key` to `dst`."""
+        obj = self.get_object_path(key)
+        if not path.isfile(obj):
+            return False
+        if path.lexists(dst):
+            os.remove(dst)
+        try:
+            os.link(obj, dst)
+        except OSError:
+            shutil.copy2(obj, dst)
+        self.db.execute(
+            "UPDATE objects SET last_used = ? WHERE key = ?", (time.time(), key)
+        )
+        return True
+
+    def store(self, key: str, bin_path: str):
+        obj = self.get_object_path(key)
+        os.makedirs(path.dirname(obj), exist_ok=True)
+        tmp = f"{obj}.{os.getpid()}.tmp"
+        try:
+            os.link(bin_path, tmp)
+        except OSError:
+            shutil.copy2(bin_path, tmp)
+        os.replace(tmp, obj)
+        self.db.execute(
+            "INSERT OR REPLACE INTO objects VALUES (?, ?, ?)",
+            (key, os.stat(obj).st_size, time.time()),
+        )
+
+    def evict(self) -> int:
+        """Remove least recently used objects until the cache fits in `max_size`."""
+        self.db.commit()
+        (total,) = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()
+        evicted = 0
+        rows = self.db.execute("SELECT key, size FROM objects ORDER BY last_used")
+        for key, size in rows.fetchall():
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(self.get_object_path(key))
+            except FileNotFoundError:
+                pass
+            self.db.execute("DELETE FROM objects WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self.db.commit()
+        return evicted
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
@@ -1,11 +1,19 @@
 import argparse
+import json
 import os
-from typing import List
+from typing import Iterator, List
 import subprocess
 import re
+from multiprocessing import Pool
 from common import *
+from diagnostics import DiagnosticStore, ErrorHistogram, classify_errors, classify_shard, get_shards
 
 PROBLEMS = [1]
+# `(<type>) malloc(<size>)` and `(<type>) calloc(<size>)`
+MALLOC_CAST = re.compile(r".*\((.*)\) ?malloc\((.*)\)")
+CALLOC_CAST = re.compile(r".*\((.*)\) ?calloc\((.*)\)")
+# shards per job, so a slow shard doesn't keep the others waiting
+SHARDS_PER_JOB = 4
 
 
 class Report:
@@ -30,26 +38,21 @@ class Report:
         )
 
     def struct_len_undefined(self):
-        match_rules = [
-            ".*\((.*)\) ?malloc\((.*)\)",
-            ".*\((.*)\) ?calloc\((.*)\)",
-        ]
         return (
             "use of undeclared identifier" in self.lines[0]
             and len(self.lines) > 1
-            and any([re.findall(r, self.lines[1]) for r in match_rules])
+            and (
+                MALLOC_CAST.match(self.lines[1]) is not None
+                or CALLOC_CAST.match(self.lines[1]) is not None
+            )
         )
 
     def get_struct_len_definition(self) -> Tuple[str, str]:
         assert self.struct_len_undefined()
-        match_rules = [
-            ".*\((.*)\) ?malloc\(.*\)",
-            ".*\((.*)\) ?calloc\(.*\)",
-        ]
         if "malloc" in self.lines[1]:
-            ptr_name = re.findall(match_rules[0], self.lines[1])[0]
+            ptr_name = MALLOC_CAST.match(self.lines[1]).group(1)
         else:
-            ptr_name = re.findall(match_rules[1], self.lines[1])[0]
+            ptr_name = CALLOC_CAST.match(self.lines[1]).group(1)
         id_name = self.lines[0].split("'")[1]
         return (ptr_name, id_name)
 
@@ -152,7 +155,15 @@ class CompilerReport:
         # Split the report into seperate warnings and errors.
         self.error_list = []
         self.warning_list = []
+        # skip the lines in front of the first diagnostic, e.g. the source
+        # path of a recorded report or the include stack of a header
         idx = 0
+        while (
+            idx < len(lines) - 1
+            and "error: " not in lines[idx]
+            and "warning: " not in lines[idx]
+        ):
+            idx += 1
         while idx < len(lines) - 1:
             begin = idx
             idx += 1
@@ -199,26 +210,42 @@ def init_crash_report(p: subprocess.Popen):
     reports.append(CompilerReport(p.stderr.read().decode().split("\n")))
 
 
-def init_crash_report_from_stderr(p: str):
-    reports: List[CompilerReport] = []
+def read_report_lines(p: str) -> Iterator[List[str]]:
+    """The lines of each CompilerReport dumped to `p`, read one report at a time."""
     if not path.isfile(p):
         error(f"{p} is not a valid path to dumped reports.")
     with open(p, "r") as f:
         lines = []
-        info("Converting stderr into CompilerReport")
-        for line in tqdm(f):
+        for line in f:
             lines.append(line[:-1])
             if "generated." in line:
-                reports.append(CompilerReport(lines))
+                yield lines
                 lines = []
 
-    return reports
+
+def init_crash_report_from_stderr(p: str):
+    info("Converting stderr into CompilerReport")
+    return [CompilerReport(lines) for lines in tqdm(read_report_lines(p))]
+
+
+def classify(errfile: str, jobs: int = CORES) -> ErrorHistogram:
+    """Classify the errors dumped to `errfile`, its shards in parallel."""
+    if not path.isfile(errfile):
+        error(f"{errfile} is not a valid path to dumped reports.")
+        return ErrorHistogram()
+    shards = get_shards(errfile, jobs * SHARDS_PER_JOB)
+    info(f"Classifying the errors in {errfile}, {len(shards)} shards")
+    histogram = ErrorHistogram()
+    with Pool(jobs) as pool:
+        for shard in tqdm(pool.imap_unordered(classify_shard, shards), total=len(shards)):
+            histogram.merge(shard)
+    return histogram
 
 
-def classify():
-    reports = init_crash_report_from_stderr("./O")
-    # compile_all(on_exit=init_crash_report)
-    return reports
+def classify_recorded(workdir: str) -> ErrorHistogram:
+    """Classify the errors recorded in the diagnostics store of `workdir`."""
+    info(f"Classifying the errors recorded in {workdir}")
+    return classify_errors(DiagnosticStore(workdir).get_errors())
 
 
 def set_global_DIR(txtdir: str, srcdir: str):
@@ -229,9 +256,43 @@ def set_global_DIR(txtdir: str, srcdir: str):
 
 
 def main():
-    reports = classify()
-    print(len(reports))
+    parser = argparse.ArgumentParser(description="Histogram of compile error categories")
+    parser.add_argument(
+        "-e", "--errfile", type=str, help="The file stderr was dumped to", default="O"
+    )
+    parser.add_argument(
+        "-w",
+        "--workdir",
+        type=str,
+        help="Read the errors recorded in <workdir>/diagnostics.db instead of errfile",
+        default=None,
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="Number of processes to use.", default=CORES
+    )
+    parser.add_argument(
+        "--examples", type=int, help="Example programs per category", default=5
+    )
+    parser.add_argument(
+        "--unmatched", type=int, help="Unmatched messages to show", default=20
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, help="Also save the histogram as json", default=None
+    )
+    args = parser.parse_args()
+
+    if args.workdir is not None:
+        histogram = classify_recorded(args.workdir)
+    else:
+        histogram = classify(args.errfile, jobs=args.jobs)
+    info(f"{histogram.total()} errors in {len(histogram.counts)} categories")
+    print(histogram.format(args.examples, args.unmatched))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(histogram.to_dict(args.examples), f, indent=2)
 
 
 if __name__ == "__main__":
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
     main()
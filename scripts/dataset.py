@@ -4,21 +4,58 @@ from fix_strategy import *
 from os import path
 import os
 from tqdm import tqdm
-from typing import List, Tuple
+from typing import Iterator, List, Tuple
 import subprocess
 import re
+import shlex
 from logging import error, info, warning
 from replace_input import replace_file
-import requests
-import tarfile
+from harness import HARNESS_MODES, get_harness_path, write_harness
+from dedup import NORMALIZERS, DuplicateIndex, hash_program
+from compile_cache import CompileCache, cache_key, deps_digest, flags_digest, parse_size
+from manifest import BUILT, FUZZ_STATS, FUZZED, POSTPROCESSED, PREPROCESSED, Manifest
+from pipeline import Stage, StreamPipeline
+from download import download_and_extract
+from fuzz_stats import STATS_NAME, format_distributions, summarize_workdir
+from pack import get_pack_path
+from supervisor import FuzzSupervisor
+from kelinci_pool import KelinciServer, KelinciServerPool
+from replay import build_jvm_driver
+from diagnostics import DiagnosticStore, program_of
+from py_harness import compile_program
+import tempfile
 import random
+import shutil
+import sys
+import time
 from functools import partial
 import argparse
 import yaml
-from multiprocessing import Pool
+from multiprocessing import Pool, get_context
 
 
 ENCODE_INPUT = False
+# Files a cached binary depends on besides its preprocessed source
+CACHE_DEPENDENCIES = ["header.hpp", "encode2stderr.hpp", "afl_harness.hpp"]
+# Compile C/C++ with a precompiled prelude, see `build_pch`
+USE_PCH = True
+# One of HARNESS_MODES, see harness.py
+HARNESS_MODE = "none"
+# Pack replay results into results.pack, "raw" or "zstd", see pack.py
+PACK_RESULTS: Optional[str] = None
+# Stop AFL once coverage didn't grow for this many seconds, see supervisor.py
+PLATEAU_WINDOW: Optional[int] = None
+# Seconds of wall-clock time all fuzzing of one run may take
+FUZZ_BUDGET: Optional[int] = None
+# Fuzz Java classes with long-lived Kelinci servers, see kelinci_pool.py
+KELINCI_POOL = True
+# Java sources of one problem compiled by one javac
+JAVAC_BATCH_SIZE = 64
+# Replay Java classes in one JVM per program, see JavaReplay.java
+JVM_REPLAY = True
+# Rounds of fixing and checking the fixed programs before they are built
+FIX_ROUNDS = 3
+
 
 def dump_stderr_on_exit(errfile: str, p: subprocess.Popen):
     with open(errfile, "ab") as f:
@@ -30,8 +67,80 @@ def dump_stderr_on_exit(errfile: str, p: subprocess.Popen):
         f.write(stderr)
 
 
-def compile_one_file(p: Tuple[str, str], lang: str):
-    src, dst = p
+def record_diagnostics_on_exit(store: DiagnosticStore, p: subprocess.Popen) -> Tuple[str, str]:
+    """Replace the diagnostics of the compiled program in `store`, returns the program."""
+    try:
+        _, stderr = p.communicate(timeout=15)
+    except TimeoutExpired:
+        p.kill()
+        _, stderr = p.communicate()
+    src = next(arg for arg in p.args if arg.endswith(".cpp"))
+    program = program_of(src)
+    store.record(program, stderr.decode(errors="replace"), src)
+    return program
+
+
+def get_macros(src: str) -> List[str]:
+    macros = []
+    # TODO: this method to get file id only works for POJ104
+    f_id = src.rsplit("src/")[1].split(".cpp")[0]
+    if f_id in POJ104_NO_MATH_H_LIST:
+        macros.append("_NO_MATH_H_")
+    if ENCODE_INPUT:
+        macros.append("_ENCODE_INPUT_")
+    return macros
+
+
+def get_pch_path(macros: List[str]) -> str:
+    name = "-".join(["prelude"] + [m.strip("_") for m in macros])
+    return path.join(EMBDING_HOME, "pch", name + ".pch")
+
+
+def build_pch(macros: List[str]) -> bool:
+    """
+    Precompile the prelude headers with `macros` defined,
+    unless the PCH is newer than the headers and the compiler.
+    """
+    pch = get_pch_path(macros)
+    deps = [f"{AFL}/afl-clang-fast++"] + [
+        path.join(EMBDING_HOME, h) for h in PRELUDE_HEADERS
+    ]
+    if path.isfile(pch) and all(
+        path.getmtime(pch) >= path.getmtime(d) for d in deps if path.exists(d)
+    ):
+        return True
+
+    prelude = path.join(EMBDING_HOME, "pch", "prelude.hpp")
+    os.makedirs(path.dirname(prelude), exist_ok=True)
+    # rewriting it would invalidate the PCHs built from it before
+    if not path.isfile(prelude) or open(prelude).read() != get_prelude():
+        with open(prelude, "w") as f:
+            f.write(get_prelude())
+    tmp = f"{pch}.{os.getpid()}.tmp"
+    p = subprocess.run(
+        [
+            f"{AFL}/afl-clang-fast++",
+            "-x",
+            "c++-header",
+            "-O0",
+            "--std=c++11",
+            f"-I{EMBDING_HOME}",
+            *[f"-D{m}" for m in macros],
+            prelude,
+            "-o",
+            tmp,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    if p.returncode != 0:
+        error(f"Failed to precompile {prelude}: {p.stderr.decode(errors='replace')}")
+        return False
+    os.replace(tmp, pch)
+    return True
+
+
+def get_compile_cmd(src: str, dst: str, lang: str) -> List[str]:
     cmd = []
 
     if lang == "C/C++":
@@ -39,33 +148,87 @@ def compile_one_file(p: Tuple[str, str], lang: str):
         cmd = [
             f"{AFL}/afl-clang-fast++",
             "-O0",
-            src,
+            src if HARNESS_MODE == "none" else get_harness_path(src),
             "./encode2stderr.so",
             "--std=c++11",
             "-o",
             dst,
+            # keep `__FILE__` independent of where the program is
+            f"-fmacro-prefix-map={src}=program.cpp",
+            f"-I{EMBDING_HOME}",
         ]
-
-        # TODO: this method to get file id only works for POJ104
-        f_id = src.rsplit("src/")[1].split(".cpp")[0]
-        if f_id in POJ104_NO_MATH_H_LIST:
-            cmd.append("-D_NO_MATH_H_")
-        if ENCODE_INPUT:
-            cmd.append("-D_ENCODE_INPUT_")
+        macros = get_macros(src)
+        cmd += [f"-D{m}" for m in macros]
+        if USE_PCH:
+            cmd += ["-include-pch", get_pch_path(macros)]
     elif lang == "Java":
         cmd = ["javac", src, "-d", dst]
 
+    return cmd
+
+
+def compile_one_file(p: Tuple[str, str], lang: str):
+    src, dst = p
+    if lang == "C/C++" and HARNESS_MODE != "none":
+        write_harness(src, HARNESS_MODE)
+
     return subprocess.Popen(
-        cmd,
+        get_compile_cmd(src, dst, lang),
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
     )
 
 
-def fuzz_one_file(p: Tuple[str, str], timeout: int, seeds: str, lang):
+def hash_preprocessed_one_file(p: Tuple[str, str], lang: str):
+    """Print the sha256 of the preprocessed source, without linemarkers."""
+    src, dst = p
+    if lang == "C/C++" and HARNESS_MODE != "none":
+        write_harness(src, HARNESS_MODE)
+
+    cmd = get_compile_cmd(src, dst, lang)
+    # drop the output, link inputs and PCH, only preprocess
+    for opt in ["-o", "-include-pch"]:
+        if opt in cmd:
+            idx = cmd.index(opt)
+            cmd = cmd[:idx] + cmd[idx + 2 :]
+    cmd = [arg for arg in cmd if not arg.endswith(".so")] + ["-E", "-P"]
+    return subprocess.Popen(
+        ["bash", "-c", f"set -o pipefail; {shlex.join(cmd)} | sha256sum"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def syntax_check_one_file(src: str):
+    """
+    Check `src` with clang -fsyntax-only, with the flags of `get_compile_cmd`
+    that change its diagnostics. No instrumentation, harness, PCH or link.
+    """
+    cmd = [
+        f"{LLVM}/bin/clang++",
+        "-fsyntax-only",
+        src,
+        "--std=c++11",
+        f"-I{EMBDING_HOME}",
+    ]
+    cmd += [f"-D{m}" for m in get_macros(src)]
+    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def read_digest(p: subprocess.Popen) -> Optional[str]:
+    out = p.stdout.read().decode()
+    p.stdout.close()
+    return out.split()[0] if p.returncode == 0 and out else None
+
+
+def fuzz_one_file(
+    p: Tuple[str, str], timeout: int, seeds: str, lang, core: Optional[int] = None
+):
     bin, out = p
+    binding, env = get_afl_binding(core)
     cmd = [
         f"{AFL}/afl-fuzz",
+        *binding,
         "-D",
         "-V",
         str(timeout),
@@ -77,60 +240,108 @@ def fuzz_one_file(p: Tuple[str, str], timeout: int, seeds: str, lang):
         "50",
     ]
     if lang == "Python":
+        # py-afl-fuzz lets py_harness.py run in persistent mode
         cmd[0] = "py-afl-fuzz"
-        cmd.append("python3")
+        cmd += ["python3", path.join(EMBDING_HOME, "scripts", "py_harness.py")]
     cmd.append(bin)
-    process = subprocess.Popen(
+    return subprocess.Popen(
         cmd,
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
+        env=env,
     )
-    # Sleep half a second for AFL to bind core.
-    subprocess.run(["sleep", "0.5"])
-    return process
 
 
-def format_one_file(src: str):
-    return subprocess.Popen(
-        [f"{LLVM}/bin/clang-format", src],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
+def make_fuzz_supervisor(timeout: int) -> Optional[FuzzSupervisor]:
+    if PLATEAU_WINDOW is None and FUZZ_BUDGET is None:
+        return None
+    return FuzzSupervisor(timeout, window=PLATEAU_WINDOW, budget=FUZZ_BUDGET)
 
 
-def run_one_file(paths: Tuple[str, str, str, str], lang: str, timeout="1m"):
-    bin_to_run, fuzz_in, output, input_csv = paths
-    run_cmd = ""
-    if lang == "C/C++":
-        run_cmd = bin_to_run
-    elif lang == "Java":
+def get_run_cmd(bin_to_run: str, lang: str) -> List[str]:
+    if lang == "Java":
         bin_dir = path.dirname(bin_to_run)
         class_name = path.basename(bin_to_run).split(".class")[0]
-        run_cmd = f"java -cp {bin_dir} {class_name}"
+        return ["java", "-cp", bin_dir, class_name]
     elif lang == "Python":
-        run_cmd = f"python3 {bin_to_run}"
+        return ["python3", bin_to_run]
+    return [bin_to_run]
+
+
+def replay_one_program(
+    p: Tuple[str, str], lang: str, timeout="1m", jvm_driver: Optional[str] = None
+):
+    """
+    Run all inputs in the queue of `fuzz_out` through `bin_to_run` with one
+    `replay.py` driver, which writes `output/` and `input_csv/` next to `queue/`,
+    or `results.pack` if `PACK_RESULTS` is set.
+    Java classes run in one JVM with the JavaReplay of `jvm_driver` if given.
+    """
+    bin_to_run, fuzz_out = p
+    # the driver prints the timed out inputs
+    timeouts = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            path.join(EMBDING_HOME, "scripts", "replay.py"),
+            "-t",
+            timeout,
+            *(["--pack", PACK_RESULTS] if PACK_RESULTS is not None else []),
+            *(["--jvm", jvm_driver] if lang == "Java" and jvm_driver is not None else []),
+            *(["--python"] if lang == "Python" else []),
+            fuzz_out,
+            "--",
+            *get_run_cmd(bin_to_run, lang),
+        ],
+        stdout=timeouts,
+        stderr=subprocess.DEVNULL,
+    )
+    process.timeouts = timeouts
+    return process
+
+
+def is_replayed(fuzz_out: str) -> bool:
+    return path.isdir(path.join(fuzz_out, "output")) or path.isfile(
+        get_pack_path(fuzz_out)
+    )
 
-    with open(fuzz_in, "rb") as fin, open(output, "wb") as fout, open(
-        input_csv, "wb"
-    ) as ferr:
-        # remove output file if timeout
-        return subprocess.Popen(
-            [
-                "bash",
-                "-c",
-                f"timeout {timeout} {run_cmd}; if [[ $? -eq 124 ]]; then rm {output}; fi",
-            ],
-            stdin=fin,
-            stdout=fout,
-            stderr=ferr,
-        )
+
+def collect_timeouts(p: subprocess.Popen) -> List[str]:
+    p.timeouts.seek(0)
+    timeouts = p.timeouts.read().decode().split()
+    p.timeouts.close()
+    return timeouts
 
 
 def coin_toss(percentage: float):
     return random.random() <= percentage / 100.0
 
 
+# The dataset `preprocess_all` workers preprocess for, set by `init_preprocess_worker`
+_preprocess_dataset = None
+
+
+def init_preprocess_worker(dataset: "DataSet"):
+    # the workers are forked, so the dataset and the globals `main` sets are
+    # inherited, the dataset isn't pickled with its sqlite connections
+    global _preprocess_dataset
+    _preprocess_dataset = dataset
+
+
+def preprocess_program_in_worker(p: Tuple[str, str]) -> Tuple[str, str]:
+    return _preprocess_dataset.preprocess_program(*p)
+
+
+COMMENT_PATTERN = re.compile(
+    r'//.*?$|/\*.*?\*/|\'(?:\\.|[^\\\'])*\'|"(?:\\.|[^\\"])*"',
+    re.DOTALL | re.MULTILINE,
+)
+
+
 class DataSet:
+    # whether the sources include the prelude, which the PCH is forced into
+    has_prelude = False
+
     def __init__(self, workdir, txtdir, language):
         self.workdir = path.abspath(workdir)
         self.txtdir = path.join(self.workdir, txtdir)
@@ -138,6 +349,12 @@ class DataSet:
         self.bindir = path.join(self.workdir, "build")
         self.outdir = path.join(self.workdir, "fuzz")
         self.lang = language
+        self.compile_cache: Optional[CompileCache] = None
+        self.duplicates = DuplicateIndex(path.join(self.workdir, "duplicates.json"))
+        self.manifest = Manifest(self.workdir)
+        self.diagnostics = DiagnosticStore(self.workdir)
+        # indices of the problems to run, see `set_problems`
+        self.problem_range: Optional[Iterable[int]] = None
         self.update_problems()
 
     def update_problems(self):
@@ -164,6 +381,10 @@ class DataSet:
             return
 
         assert isinstance(pr, Iterable), "Invalid problem range given"
+        if not hasattr(self, "problems"):
+            # not extracted yet, `download` only extracts the selected problems
+            self.problem_range = set(pr)
+            return
         assert (
             max(pr) < len(self.problems) and min(pr) >= 0
         ), "Range selection index out of range"
@@ -171,12 +392,52 @@ class DataSet:
         self.problems = [self.problems[i] for i in pr]
 
     def for_all_src(self):
-        for i in tqdm(self.problems):
-            for p in os.listdir(path.join(self.srcdir, str(i))):
-                p = path.splitext(p)[0]
-                yield (i, p)
+        yield from tqdm(self.programs())
+
+    def programs(self, **kwargs) -> List[Tuple[str, str]]:
+        """(problem, program) of the selected problems, see `Manifest.get_programs`."""
+        self.sync_manifest()
+        self.manifest.select_problems(self.problems)
+        return self.manifest.get_programs(**kwargs)
+
+    def list_programs(self, problems) -> List[Tuple[str, str, str]]:
+        """(problem, program, src) of `problems` as found in the source dir."""
+        return [
+            (str(i), path.splitext(p)[0], path.join(self.srcdir, str(i), p))
+            for i in problems
+            for p in os.listdir(path.join(self.srcdir, str(i)))
+        ]
+
+    def sync_manifest(self):
+        """
+        Scan the selected problems that are not in the manifest yet,
+        e.g. of a workdir built before there was one.
+        """
+        if not path.isdir(self.srcdir):
+            return
+        self.manifest.select_problems(self.problems)
+        missing = self.manifest.get_unrecorded_problems()
+        if len(missing) == 0:
+            return
+        info(f"Scanning {len(missing)} problems into {self.manifest.db_path}")
+        programs = self.list_programs(missing)
+        self.manifest.add_programs(
+            (i, p, src, None, self.duplicates.get_representative(i, p))
+            for i, p, src in programs
+        )
+        built = [(i, p) for i, p, _ in tqdm(programs) if self.is_built(i, p)]
+        self.record_built(built)
+        self.record_fuzzed(built)
+        self.manifest.set_stage(
+            POSTPROCESSED,
+            [
+                (i, p, None)
+                for i, p in built
+                if is_replayed(path.join(self.get_paths(i, p)[1], "default"))
+            ],
+        )
 
-    def preprocess_all(self):
+    def prepare_srcdir(self):
         if not path.isdir(self.srcdir):
             info("Preprocessing not set, using symlink...")
             if not path.isdir(self.txtdir):
@@ -186,6 +447,125 @@ class DataSet:
             # By default there is no preprocessing.
             os.symlink(self.txtdir, self.srcdir)
 
+    def preprocess_program(self, i, txt_name: str) -> Tuple[str, str]:
+        """
+        Preprocess `txt_name` of problem `i` unless it already is,
+        returns the program and its source path.
+        """
+        return path.splitext(txt_name)[0], path.join(self.srcdir, str(i), txt_name)
+
+    def format_all(self, txt_files: List[Tuple[str, str]], jobs: int = CORES):
+        """Format the (problem, text file) that need it before they are preprocessed."""
+        pass
+
+    def preprocess_all(self, jobs: int = CORES):
+        self.prepare_srcdir()
+        txt_files = [
+            (str(i), txt_name)
+            for i in self.problems
+            for txt_name in os.listdir(path.join(self.txtdir, str(i)))
+        ]
+        self.format_all(txt_files, jobs)
+        info(f"Preprocessing {len(txt_files)} text files into codes")
+        start = time.perf_counter()
+        # forked explicitly, spawn and forkserver (the default from Python 3.14) pickle `self`
+        with get_context("fork").Pool(
+            jobs, initializer=init_preprocess_worker, initargs=(self,)
+        ) as pool:
+            for _ in tqdm(
+                pool.imap_unordered(preprocess_program_in_worker, txt_files, chunksize=64),
+                total=len(txt_files),
+            ):
+                pass
+        elapsed = time.perf_counter() - start
+        info(
+            f"Preprocessed {len(txt_files)} files in {elapsed:.2f}s "
+            f"({len(txt_files) / max(elapsed, 1e-9):.2f} files/sec, {jobs} jobs)"
+        )
+        self.record_programs(jobs)
+
+    def record_programs(self, jobs: int = CORES):
+        """
+        Record the preprocessed programs in the manifest, after grouping
+        programs with the same source up to whitespace and comments.
+        """
+        programs = self.list_programs(self.problems)
+        hashes: Dict[str, str] = {}
+        if self.lang in NORMALIZERS:
+            info("Indexing duplicate programs")
+            if self.duplicates.outdated:
+                # the recorded hashes can't tell whether a source changed
+                self.manifest.forget_hashes()
+            before = dict(self.duplicates.representatives)
+            hashes = self.duplicates.build(
+                programs,
+                self.lang,
+                jobs,
+                get_macros if self.lang == "C/C++" else None,
+            )
+            info(self.duplicates.summary())
+            # their artifacts are links to the representative they had before
+            for i, p, _ in programs:
+                rep = before.get(f"{i}/{p}")
+                if rep is not None and rep != self.duplicates.get_representative(i, p):
+                    for artifact in self.get_paths(i, p):
+                        if path.islink(artifact):
+                            os.remove(artifact)
+        self.manifest.add_programs(
+            (
+                i,
+                p,
+                src,
+                hashes.get(f"{i}/{p}"),
+                self.duplicates.get_representative(i, p),
+            )
+            for i, p, src in programs
+        )
+
+    def is_built(self, i, p) -> bool:
+        return path.isfile(self.get_paths(i, p)[0])
+
+    def record_built(self, programs: Iterable[Tuple[str, str]]):
+        """Move the `programs` that have a binary now to `BUILT`, the others back."""
+        built, failed = [], []
+        for i, p in programs:
+            if self.is_built(i, p):
+                built.append((i, p, self.get_paths(i, p)[0]))
+            else:
+                failed.append((i, p))
+        self.manifest.set_stage(BUILT, built, only_forward=True)
+        self.manifest.reset_stage(BUILT, failed)
+
+    def record_fuzzed(
+        self,
+        programs: Iterable[Tuple[str, str]],
+        supervisor: Optional[FuzzSupervisor] = None,
+    ) -> List[Tuple[str, str]]:
+        """
+        Move the `programs` AFL left stats for to `FUZZED` and record the stats,
+        and which of them the `supervisor` let run to their end.
+        Returns those programs.
+        """
+        fuzzed = []
+        for i, p in programs:
+            fuzz_out = self.get_paths(i, p)[1]
+            expr = ExprimentInfo(fuzz_out)
+            if expr.fuzzed:
+                fuzzed.append((i, p, fuzz_out, {s: getattr(expr, s) for s in FUZZ_STATS}))
+        self.manifest.set_stage(FUZZED, [(i, p, out) for i, p, out, _ in fuzzed])
+        self.manifest.set_fuzz_stats([(i, p, stats) for i, p, _, stats in fuzzed])
+        if supervisor is not None:
+            self.manifest.set_fuzz_completed(
+                [(i, p, out in supervisor.completed) for i, p, out, _ in fuzzed]
+            )
+        return [(i, p) for i, p, _, _ in fuzzed]
+
+    def materialize_duplicates(self, dir: str, suffix: str = ""):
+        num_linked = self.duplicates.materialize(dir, suffix)
+        if num_linked > 0:
+            info(f"Linked {num_linked} duplicates to their representative in {dir}")
+        self.manifest.propagate_to_duplicates()
+
     def mkdir_if_doesnt_exist(self, dir):
         if not path.isdir(dir):
             os.makedirs(dir)
@@ -194,28 +574,145 @@ class DataSet:
             if not path.isdir(subdir):
                 os.makedirs(subdir)
 
+    def prepare_pch(self):
+        """Precompile the prelude for every combination of macros a program may use."""
+        global USE_PCH
+        if self.lang != "C/C++" or not USE_PCH:
+            return
+        if not self.has_prelude:
+            # forcing it in would change what the raw sources mean
+            info("Sources don't include the prelude, compiling without precompiled headers")
+            USE_PCH = False
+            return
+        encode = ["_ENCODE_INPUT_"] if ENCODE_INPUT else []
+        info("Precompiling headers")
+        if not all(build_pch(macros + encode) for macros in [[], ["_NO_MATH_H_"]]):
+            warning("Precompiled headers not available, compiling without them")
+            USE_PCH = False
+
+    def prepare_bindir(self):
+        self.mkdir_if_doesnt_exist(self.bindir)
+
     def build(self, jobs: int = CORES, on_exit=None, sample=100, built=None):
+        self.prepare_pch()
+        if built is None and self.compile_cache is not None and self.lang == "C/C++":
+            return self.build_cached(jobs=jobs, on_exit=on_exit, sample=sample)
+        self.prepare_bindir()
+        info("Collecting codes to compile")
         if built is None:
-            built = lambda bin_path: path.isfile(bin_path)
-        self.mkdir_if_doesnt_exist(self.bindir)
-        # Copy the files and do some preprocessing
-        files_to_compile: List[Tuple[str, str]] = []
+            programs = self.programs(max_stage=PREPROCESSED, with_duplicates=False)
+        else:
+            programs = [
+                (i, p)
+                for (i, p) in self.programs(with_duplicates=False)
+                if not built(self.get_paths(i, p)[0])
+            ]
+        programs = [(i, p) for (i, p) in programs if coin_toss(sample)]
+        files_to_compile: List[Tuple[str, str]] = [
+            (
+                path.join(self.srcdir, str(i), str(p) + ".cpp"),
+                path.join(self.bindir, str(i), str(p)),
+            )
+            for (i, p) in programs
+        ]
+
+        info("Compiling all the code")
+        parallel_subprocess(
+            files_to_compile,
+            jobs,
+            lambda r: compile_one_file(r, lang=self.lang),
+            on_exit,
+        )
+        self.record_built(programs)
+        self.materialize_duplicates(self.bindir)
+
+    def build_cached(self, jobs: int = CORES, on_exit=None, sample=100):
+        """
+        Build through `self.compile_cache`, a program is only compiled if no
+        binary of the same preprocessed source, compiler and flags is cached.
+        """
+        cache = self.compile_cache
+        deps = deps_digest(path.join(EMBDING_HOME, h) for h in CACHE_DEPENDENCIES)
+        self.prepare_bindir()
+
         info("Collecting codes to compile")
-        for (i, p) in self.for_all_src():
-            if path.isdir(os.path.abspath(p)):
-                warning(f"{i}/{p} is a dir, is the dataset correct?")
+        built = set(self.programs(min_stage=BUILT, with_duplicates=False))
+        flags: Dict[Tuple[str, str], str] = {}
+        # programs whose binary may have changed
+        programs: List[Tuple[str, str]] = []
+        num_up_to_date = 0
+        for (i, p) in tqdm(self.programs(with_duplicates=False)):
             src_path = path.join(self.srcdir, str(i), str(p) + ".cpp")
             bin_path = path.join(self.bindir, str(i), str(p))
-            if not built(bin_path) and coin_toss(sample):
-                files_to_compile.append((src_path, bin_path))
+            f = flags_digest(
+                get_compile_cmd(src_path, bin_path, self.lang),
+                [src_path, bin_path, get_harness_path(src_path)],
+            )
+            key = cache.lookup_source(src_path, f + deps)
+            if key is not None and (i, p) in built and path.isfile(bin_path):
+                num_up_to_date += 1
+            elif key is not None and cache.fetch(key, bin_path):
+                num_up_to_date += 1
+                programs.append((i, p))
+            elif coin_toss(sample):
+                flags[(src_path, bin_path)] = f
+                programs.append((i, p))
+
+        info(f"Hashing {len(flags)} preprocessed codes")
+        digests = parallel_subprocess(
+            flags.keys(),
+            jobs,
+            lambda r: hash_preprocessed_one_file(r, self.lang),
+            read_digest,
+        )
 
-        info("Compiling all the code")
+        keys: Dict[Tuple[str, str], str] = {}
+        files_to_compile: List[Tuple[str, str]] = []
+        # programs with the same key as one in `files_to_compile`
+        same_as_compiled: List[Tuple[str, str]] = []
+        compiled_keys: Set[str] = set()
+        num_hits = 0
+        for (src_path, bin_path), f in flags.items():
+            digest = digests.get((src_path, bin_path))
+            if digest is not None:
+                key = keys[(src_path, bin_path)] = cache_key(digest, f)
+                if cache.fetch(key, bin_path):
+                    num_hits += 1
+                    continue
+                if key in compiled_keys:
+                    same_as_compiled.append((src_path, bin_path))
+                    continue
+                compiled_keys.add(key)
+            # don't leave a stale binary behind if the compilation fails
+            if path.lexists(bin_path):
+                os.remove(bin_path)
+            files_to_compile.append((src_path, bin_path))
+
+        info(f"Compiling {len(files_to_compile)} codes")
         parallel_subprocess(
             files_to_compile,
             jobs,
             lambda r: compile_one_file(r, lang=self.lang),
             on_exit,
         )
+        for src_bin in files_to_compile:
+            if src_bin in keys and path.isfile(src_bin[1]):
+                cache.store(keys[src_bin], src_bin[1])
+        for src_bin in same_as_compiled:
+            if cache.fetch(keys[src_bin], src_bin[1]):
+                num_hits += 1
+        cache.record_sources(
+            (src_path, flags[(src_path, bin_path)] + deps, key)
+            for (src_path, bin_path), key in keys.items()
+            if path.isfile(bin_path)
+        )
+        num_evicted = cache.evict()
+        self.record_built(programs)
+        self.materialize_duplicates(self.bindir)
+        info(
+            f"{num_up_to_date} up to date, {num_hits} cache hits, "
+            f"{len(files_to_compile)} compiled, {num_evicted} evicted from cache"
+        )
 
     def remove_comments(self, text: str) -> str:
         # https://stackoverflow.com/questions/241327/remove-c-and-c-comments-using-python
@@ -226,15 +723,10 @@ class DataSet:
             else:
                 return s
 
-        if self.lang in ["C/C++", "Java"]:
-            pattern = re.compile(
-                r'//.*?$|/\*.*?\*/|\'(?:\\.|[^\\\'])*\'|"(?:\\.|[^\\"])*"',
-                re.DOTALL | re.MULTILINE,
-            )
-        else:
+        if self.lang not in ["C/C++", "Java"]:
             error("language not supported for removing comments")
 
-        return re.sub(pattern, replacer, text)
+        return COMMENT_PATTERN.sub(replacer, text)
 
     def fuzz(
         self,
@@ -248,71 +740,232 @@ class DataSet:
         """
         Fuzz the program
         """
-        if fuzzed is None:
-            fuzzed = lambda out_path: ExprimentInfo(out_path).sufficiently_fuzzed()
         self.mkdir_if_doesnt_exist(self.outdir)
-        bins_to_fuzz: List[Tuple[str, str]] = []
         info("Collecting binaries to fuzz")
-        for i in tqdm(self.problems):
-            for p in os.listdir(path.join(self.bindir, str(i))):
-                if path.isdir(os.path.abspath(p)):
-                    warning(f"{i}/{p} is a dir, is the dataset correct?")
-                bin_path = path.join(self.bindir, str(i), str(p))
-                out_path = path.join(self.outdir, str(i), str(p))
-                if path.isfile(bin_path) and not fuzzed(out_path) and coin_toss(sample):
-                    bins_to_fuzz.append((bin_path, out_path))
+        programs = self.programs_to_fuzz(sample, fuzzed)
+        bins_to_fuzz: List[Tuple[str, str]] = [self.get_paths(i, p) for (i, p) in programs]
 
         seeds = path.abspath(seeds)
         info(f"Fuzzing all {len(bins_to_fuzz)} binaries")
-        parallel_subprocess(
-            bins_to_fuzz,
-            jobs,
-            lambda r: fuzz_one_file(r, timeout=timeout, seeds=seeds, lang=self.lang),
-            on_exit,
+        supervisor = make_fuzz_supervisor(timeout)
+        time_limit = timeout if supervisor is None else supervisor.get_time_limit()
+        cores = CoreAllocator()
+
+        def start(r: Tuple[str, str]) -> subprocess.Popen:
+            core = cores.acquire()
+            p = fuzz_one_file(r, timeout=time_limit, seeds=seeds, lang=self.lang, core=core)
+            cores.assign(p, core)
+            return p
+
+        def finish(p: subprocess.Popen):
+            cores.release(p)
+            return on_exit(p) if on_exit is not None else None
+
+        if supervisor is None:
+            parallel_subprocess(bins_to_fuzz, jobs, start, finish)
+        else:
+            supervisor.run(bins_to_fuzz, jobs, start, lambda r: r[1], finish)
+        self.record_fuzzed(programs, supervisor)
+        self.materialize_duplicates(
+            self.outdir, ".py" if self.lang == "Python" else ""
         )
 
+    def programs_to_fuzz(self, sample=100, fuzzed=None) -> List[Tuple[str, str]]:
+        """Built programs that aren't sufficiently fuzzed, or not `fuzzed` if given."""
+        if fuzzed is None:
+            programs = self.programs(
+                min_stage=BUILT, with_duplicates=False, unless_sufficiently_fuzzed=True
+            )
+        else:
+            programs = [
+                (i, p)
+                for (i, p) in self.programs(min_stage=BUILT, with_duplicates=False)
+                if not fuzzed(self.get_paths(i, p)[1])
+            ]
+        return [(i, p) for (i, p) in programs if coin_toss(sample)]
+
     def postprocess(self, jobs: int = CORES, sample=100, timeout="1m"):
         """
         Run the program with fuzzing inputs
         """
-        bins_to_run: List[Tuple[str, str, str, str]] = []
-
         info("Collecting binaries to run")
-        for i in tqdm(self.problems):
-            for p in os.listdir(path.join(self.bindir, str(i))):
-                if path.isdir(os.path.abspath(p)):
-                    warning(f"{i}/{p} is a dir, is the dataset correct?")
-
-                bin_path = path.join(self.bindir, str(i), str(p))
-                fuzz_out = path.join(self.outdir, str(i), str(p), "default")
-
-                # skip if current problem is not fuzzed nor selected by sample
-                if not (path.isdir(path.join(fuzz_out, "queue")) and coin_toss(sample)):
-                    continue
-
-                input_csv_dir = path.join(fuzz_out, "input_csv")
-                output_dir = path.join(fuzz_out, "output")
-                if not path.isdir(input_csv_dir):
-                    os.makedirs(input_csv_dir)
-                if not path.isdir(output_dir):
-                    os.makedirs(output_dir)
-
-                for q in os.listdir(path.join(fuzz_out, "queue")):
-                    fuzz_input_path = path.join(fuzz_out, "queue", str(q))
-                    if path.isdir(fuzz_input_path):
-                        continue
-                    output = path.join(output_dir, str(q))
-                    input_csv = path.join(input_csv_dir, str(q) + ".csv")
-                    bins_to_run.append((bin_path, fuzz_input_path, output, input_csv))
+        # the representative's outputs are shared through a symlink
+        programs = [
+            (i, p)
+            for (i, p) in self.programs(
+                min_stage=FUZZED, max_stage=FUZZED, with_duplicates=False
+            )
+            if coin_toss(sample)
+        ]
+        bins_to_run: List[Tuple[str, str]] = []
+        for (i, p) in programs:
+            bin_path, fuzz_out = self.get_paths(i, p)
+            bins_to_run.append((bin_path, path.join(fuzz_out, "default")))
 
         info(f"Runninng {len(bins_to_run)} binaries")
+        jvm_driver = self.get_jvm_driver()
         timeout_info = parallel_subprocess(
             bins_to_run,
             jobs,
-            lambda r: run_one_file(r, self.lang, timeout=timeout),
-            on_exit=None,
+            lambda r: replay_one_program(
+                r, self.lang, timeout=timeout, jvm_driver=jvm_driver
+            ),
+            on_exit=collect_timeouts,
+        )
+        num_timeouts = sum(map(len, timeout_info.values()))
+        info(f"{num_timeouts} inputs timed out")
+        self.manifest.set_stage(POSTPROCESSED, [(i, p, None) for (i, p) in programs])
+        self.manifest.propagate_to_duplicates()
+
+    def stream(
+        self,
+        jobs: int = CORES,
+        timeout=60,
+        seeds="seeds",
+        sample=100,
+        singletime="1m",
+        errfile="O",
+        limits: Dict[str, int] = {},
+    ):
+        """
+        Preprocess, compile, fuzz and replay each program as soon as it is
+        done with its previous stage, instead of one stage for all programs
+        at a time. `limits` caps how many programs are in "compile", "fuzz"
+        or "replay" at once, all of them share `jobs` cores.
+        The diagnostics of compilations are recorded for `fix`,
+        see `get_compile_on_exit`.
+        """
+        self.prepare_srcdir()
+        self.prepare_bindir()
+        self.prepare_pch()
+        self.mkdir_if_doesnt_exist(self.outdir)
+        seeds = path.abspath(seeds)
+        self.duplicates.clear(self.problems)
+        num_timeouts = 0
+        supervisor = make_fuzz_supervisor(timeout)
+        jvm_driver = self.get_jvm_driver()
+        compile_on_exit = self.get_compile_on_exit(errfile)
+        time_limit = timeout if supervisor is None else supervisor.get_time_limit()
+        cores = CoreAllocator()
+
+        def next_stage(i, p) -> Optional[str]:
+            stage = self.manifest.get_stage(i, p)
+            if stage == PREPROCESSED:
+                return "compile"
+            if not self.manifest.is_sufficiently_fuzzed(i, p) and not (
+                supervisor is not None and supervisor.expired()
+            ):
+                return "fuzz"
+            if stage == FUZZED:
+                return "replay"
+            return None
+
+        def programs():
+            for problem in self.problems:
+                i = str(problem)
+                for txt_name in sorted(os.listdir(path.join(self.txtdir, i))):
+                    p, src_path = self.preprocess_program(i, txt_name)
+                    digest, rep = None, None
+                    if self.lang in NORMALIZERS:
+                        digest = hash_program((src_path, self.lang))
+                        rep = self.duplicates.add(i, p, digest)
+                    self.manifest.add_programs([(i, p, src_path, digest, rep)])
+                    if rep is not None or not coin_toss(sample):
+                        continue
+                    if self.lang == "Python":
+                        # compiling in place is cheaper than starting a process for it
+                        compile_program((src_path, self.get_paths(i, p)[0]))
+                        self.record_built([(i, p)])
+                        if not self.is_built(i, p):
+                            continue
+                    stage = next_stage(i, p)
+                    if stage is not None:
+                        yield stage, (i, p)
+
+        def compile_start(r: Tuple[str, str]):
+            i, p = r
+            src_path = path.join(self.srcdir, i, p + ".cpp")
+            return compile_one_file((src_path, self.get_paths(i, p)[0]), self.lang)
+
+        def compile_finish(r: Tuple[str, str], process: subprocess.Popen):
+            compile_on_exit(process)
+            self.record_built([r])
+            if supervisor is not None and supervisor.expired():
+                return None
+            return "fuzz" if self.is_built(*r) else None
+
+        def fuzz_start(r: Tuple[str, str]):
+            bin_path, fuzz_out = self.get_paths(*r)
+            core = cores.acquire()
+            process = fuzz_one_file(
+                (bin_path, fuzz_out),
+                timeout=time_limit,
+                seeds=seeds,
+                lang=self.lang,
+                core=core,
+            )
+            cores.assign(process, core)
+            if supervisor is not None:
+                supervisor.add(process, fuzz_out)
+            return process
+
+        def fuzz_finish(r: Tuple[str, str], process: subprocess.Popen):
+            cores.release(process)
+            if supervisor is not None:
+                supervisor.remove(process)
+            return "replay" if self.record_fuzzed([r], supervisor) else None
+
+        def replay_start(r: Tuple[str, str]):
+            bin_path, fuzz_out = self.get_paths(*r)
+            return replay_one_program(
+                (bin_path, path.join(fuzz_out, "default")),
+                self.lang,
+                timeout=singletime,
+                jvm_driver=jvm_driver,
+            )
+
+        def replay_finish(r: Tuple[str, str], process: subprocess.Popen):
+            nonlocal num_timeouts
+            num_timeouts += len(collect_timeouts(process))
+            self.manifest.set_stage(POSTPROCESSED, [(*r, None)])
+            return None
+
+        pipeline: StreamPipeline[Tuple[str, str]] = StreamPipeline(
+            [
+                Stage("compile", compile_start, compile_finish, limits.get("compile", jobs)),
+                Stage("fuzz", fuzz_start, fuzz_finish, limits.get("fuzz", jobs)),
+                Stage("replay", replay_start, replay_finish, limits.get("replay", jobs)),
+            ],
+            jobs,
+        )
+        if supervisor is not None:
+            pipeline.poll = supervisor.poll
+            pipeline.poll_interval = supervisor.poll_interval
+        info("Streaming programs through compile, fuzz and replay")
+        pipeline.run(programs())
+        info(f"{num_timeouts} inputs timed out")
+        if supervisor is not None:
+            info(supervisor.summary())
+
+        if self.lang in NORMALIZERS:
+            self.duplicates.save()
+            info(self.duplicates.summary())
+        if self.lang != "Python":
+            self.materialize_duplicates(self.bindir)
+        self.materialize_duplicates(
+            self.outdir, ".py" if self.lang == "Python" else ""
         )
 
+    def get_jvm_driver(self) -> Optional[str]:
+        """The JavaReplay to replay Java classes with, None for a JVM per input."""
+        if self.lang != "Java" or not JVM_REPLAY:
+            return None
+        try:
+            return build_jvm_driver(path.join(self.workdir, "jvm_replay"))
+        except (OSError, subprocess.CalledProcessError) as e:
+            warning(f"Can't build the JavaReplay driver ({e}), starting a JVM per input")
+            return None
+
     def get_paths(self, i, p) -> Tuple[str, str]:
         bin_path = path.join(self.bindir, str(i), str(p))
         fuzz_out = path.join(self.outdir, str(i), str(p))
@@ -321,26 +974,20 @@ class DataSet:
             bin_path += ".class"
             fuzz_out += ".class"
         elif self.lang == "Python":
-            bin_path += ".py"
+            bin_path += ".pyc"
             fuzz_out += ".py"
 
         return bin_path, fuzz_out
 
-    def summarize(self):
-        num_programs = 0
-        num_built = 0
-        num_fuzzed = 0
-        num_sufficiently_fuzzed = 0
+    def summarize(self, jobs: int = CORES):
         info("Summarizing dataset result")
-        for (i, p) in self.for_all_src():
-            bin_path, fuzz_out = self.get_paths(i, p)
-            num_programs += 1
-            if path.isfile(bin_path):
-                num_built += 1
-                expr = ExprimentInfo(fuzz_out)
-                if expr.fuzzed:
-                    num_fuzzed += 1
-                    num_sufficiently_fuzzed += 1 if expr.bitmap_cvg > 40 else 0
+        self.sync_manifest()
+        self.manifest.select_problems(self.problems)
+        summary = self.manifest.summary()
+        num_programs = summary["programs"]
+        num_built = summary["built"]
+        num_fuzzed = summary["fuzzed"]
+        num_sufficiently_fuzzed = summary["above_40"]
         print(
             f"""
             Number of programs in the dataset: {num_programs} (100.0%)
@@ -349,17 +996,35 @@ class DataSet:
             Number of programs reached above 40% coverage: {num_sufficiently_fuzzed} ({num_sufficiently_fuzzed / num_programs * 100:.2f}%)
         """
         )
+        stats = summarize_workdir(self.workdir, self.problems, jobs)
+        info(f"Saved stats of {len(stats)} programs to {path.join(self.workdir, STATS_NAME)}")
+        print(format_distributions(stats))
+
+    def get_compile_on_exit(self, errfile: str) -> Callable[[subprocess.Popen], object]:
+        """
+        What to do with the stderr of a compilation: C/C++ diagnostics
+        are recorded in `self.diagnostics` for `fix`, others go to `errfile`.
+        """
+        if self.lang == "C/C++":
+            return partial(record_diagnostics_on_exit, self.diagnostics)
+        return partial(dump_stderr_on_exit, errfile)
 
     def fix(self, errfile: str, jobs: int = CORES, on_exit=None):
         warning("Fix strategy not implemented")
 
 
 class POJ104(DataSet):
+    has_prelude = True
+
     def __init__(self, workdir):
         DataSet.__init__(self, workdir, "ProgramData", "C/C++")
-        self.format_list: List[str] = [
+        self.format_list: Set[str] = {
             f"{self.txtdir}/{file_id}.txt" for file_id in POJ104_FORMAT_LIST
-        ]
+        }
+        # text file in `format_list` -> its copy formatted by `format_all`
+        self.formatted: Dict[str, str] = {}
+        self.formatted_dir = path.join(self.workdir, "formatted")
+        self.prelude = get_prelude()
 
     def download(self):
         if path.isdir(self.txtdir):
@@ -379,33 +1044,78 @@ class POJ104(DataSet):
         exec(open("preprocess.py").read())
         os.chdir(cur_path)
 
-    def preprocess_all(self):
+    def prepare_srcdir(self):
         if not path.isdir(self.txtdir):
             warning(f"{self.txtdir} doesn't exist yet.")
             self.download()
         self.mkdir_if_doesnt_exist(self.srcdir)
-        info("Preprocessing text files into codes")
-        for i in tqdm(self.problems):
-            for p in os.listdir(path.join(self.txtdir, str(i))):
-                p = path.splitext(p)[0]
-                txt_path = path.join(self.txtdir, str(i), str(p) + ".txt")
-                src_path = path.join(self.srcdir, str(i), str(p) + ".cpp")
-                if not path.isfile(src_path):
-                    self.preprocess_one(txt_path, src_path)
+
+    def preprocess_program(self, i, txt_name: str) -> Tuple[str, str]:
+        p = path.splitext(txt_name)[0]
+        txt_path = path.join(self.txtdir, str(i), str(p) + ".txt")
+        src_path = path.join(self.srcdir, str(i), str(p) + ".cpp")
+        if not starts_with_prelude(src_path):
+            self.preprocess_one(txt_path, src_path)
+        return p, src_path
+
+    def build(self, jobs: int = CORES, on_exit=None, sample=100, built=None):
+        # sources of an older workdir have the headers pasted in, compiling
+        # them with the PCH redefines everything and their lines are offset
+        # by the headers, preprocess them again from their text files
+        if path.isdir(self.srcdir) and not all(
+            starts_with_prelude(src) for _, _, src in self.list_programs(self.problems)
+        ):
+            warning("Sources were preprocessed without the prelude, preprocessing again")
+            self.preprocess_all(jobs)
+        return DataSet.build(
+            self, jobs=jobs, on_exit=on_exit, sample=sample, built=built
+        )
+
+    def format_all(self, txt_files: List[Tuple[str, str]], jobs: int = CORES):
+        """
+        Format copies of the files in `format_list` that aren't preprocessed yet,
+        with one clang-format per batch of files instead of one per file.
+        """
+        to_format = []
+        for i, txt_name in txt_files:
+            txt_path = path.join(self.txtdir, i, txt_name)
+            src_path = path.join(self.srcdir, i, path.splitext(txt_name)[0] + ".cpp")
+            if txt_path in self.format_list and not starts_with_prelude(src_path):
+                to_format.append(txt_path)
+        if len(to_format) == 0:
+            return
+
+        info(f"Formatting {len(to_format)} text files")
+        os.makedirs(self.formatted_dir, exist_ok=True)
+        for txt_path in to_format:
+            rel = path.relpath(txt_path, self.txtdir)
+            copy = path.join(
+                self.formatted_dir, rel.replace("/", "_")[: -len(".txt")] + ".cpp"
+            )
+            shutil.copyfile(txt_path, copy)
+            self.formatted[txt_path] = copy
+        copies = list(self.formatted.values())
+        batches = [tuple(copies[n : n + 64]) for n in range(0, len(copies), 64)]
+        parallel_subprocess(batches, jobs, format_files_in_place)
+
+    def preprocess_all(self, jobs: int = CORES):
+        try:
+            DataSet.preprocess_all(self, jobs)
+        finally:
+            # the formatted copies are only needed until the sources are written
+            self.formatted = {}
+            shutil.rmtree(self.formatted_dir, ignore_errors=True)
 
     def preprocess_one(self, txt_path, src_path):
         with open(src_path, "w") as f:
-            # cat $EMBDING_HOME/header.hpp >> $SRCDIR/$P.cpp
-            with open(path.join(EMBDING_HOME, "header.hpp"), "r") as hpp:
-                header = hpp.read()
-                f.write(header)
-            # cat $EMBDING_HOME/encode2stderr.hpp >> $SRCDIR/$P.cpp
-            with open(path.join(EMBDING_HOME, "encode2stderr.hpp"), "r") as hpp:
-                header = hpp.read()
-                f.write(header)
+            # #include "header.hpp" and "encode2stderr.hpp"
+            f.write(self.prelude)
             # $LLVMPATH/bin/clang-format $TXTDIR/$P.txt > $SRCDIR/$P.temp.cpp
             # python3.8 $EMBDING_HOME/scripts/replace_input.py $SRCDIR/$P.temp.cpp >> $SRCDIR/$P.cpp
-            if txt_path in self.format_list:
+            if txt_path in self.formatted:
+                with open(self.formatted[txt_path], "r", errors="replace") as txt:
+                    code = txt.read()
+            elif txt_path in self.format_list:
                 code = format_one_file(txt_path).stdout.read().decode(errors="replace")
             else:
                 with open(txt_path, "r", errors="replace") as txt:
@@ -418,24 +1128,58 @@ class POJ104(DataSet):
             f.write(code)
 
     def fix(self, errfile: str, jobs: int = CORES, on_exit=None):
-        # apply fix scripts
+        """
+        Fix the programs with errors in `self.diagnostics`, check the fixed
+        ones with clang -fsyntax-only and fix them again, until they compile,
+        stop changing or `FIX_ROUNDS` are done. Then build them.
+        Without recorded diagnostics the reports are read from `errfile`.
+        """
         set_global_DIR(self.txtdir, self.srcdir)
 
-        with open(errfile, "r") as f:
-            lines = []
-            lines_in_file = f.readlines()
-            info("Converting stderr into CompilerReport")
-            for line in tqdm(lines_in_file):
-                lines.append(line[:-1])
-                if "generated." in line:
-                    cr = CompilerReport(lines)
-                    for r in cr.error_list:
-                        for strategy in FIX_STRATEGIES:
-                            if strategy.isMatch(r, cr):
-                                strategy.fix(cr.get_path(), r, cr)
-                    lines = []
-                    write_fixed_file(cr.get_path()[1])
-        self.build(jobs=jobs)
+        if self.diagnostics.get_programs_with_errors():
+            # read here, the pool's task thread can't use the connection
+            report_lines = list(self.diagnostics.reports())
+        else:
+            warning(f"No diagnostics recorded, reading the reports in {errfile}")
+            report_lines = read_report_lines(errfile)
+        reports: Iterable[Tuple[List[str], bool]] = (
+            (lines, False) for lines in report_lines
+        )
+        with Pool(
+            jobs, initializer=set_global_DIR, initargs=(self.txtdir, self.srcdir)
+        ) as pool:
+            for round in range(1, FIX_ROUNDS + 1):
+                changed = []
+                # written here in the order of the reports, so the last report
+                # of a program wins whatever the number of jobs
+                for cpp_path, code in tqdm(
+                    pool.imap(fix_compiler_report, reports, chunksize=16)
+                ):
+                    if code is None:
+                        continue
+                    with open(cpp_path, "r", errors="replace") as f:
+                        if f.read() == code:
+                            continue
+                    with open(cpp_path, "w") as f:
+                        f.write(code)
+                    changed.append(cpp_path)
+
+                errors = parallel_subprocess(
+                    dict.fromkeys(changed),
+                    jobs,
+                    syntax_check_one_file,
+                    lambda p: self.diagnostics.get_report_lines(
+                        record_diagnostics_on_exit(self.diagnostics, p)
+                    ),
+                )
+                reports = [(lines, True) for lines in errors.values() if lines is not None]
+                info(
+                    f"Fix round {round}: changed {len(changed)} programs, "
+                    f"{len(reports)} of them still don't compile"
+                )
+                if not reports:
+                    break
+        self.build(jobs=jobs, on_exit=self.get_compile_on_exit(errfile))
 
 
 class IBM(DataSet):
@@ -446,6 +1190,8 @@ class IBM(DataSet):
         if subset not in IBM.SUBSET:
             error(f"Incorrect subset given, only {IBM.SUBSET} allowed.")
             exit(1)
+        # expected sha256 of the tarball, if known
+        self.sha256: Optional[str] = None
         DataSet.__init__(self, workdir, self.get_subset_name(), self.get_lang())
 
     def get_subset_name(self):
@@ -473,34 +1219,34 @@ class IBM(DataSet):
         else:
             warning(f"{self.workdir} already exists")
 
+        if os.path.isdir(self.txtdir):
+            info("Extracted dataset already exists.")
+            return
+
         tar_path = path.join(self.workdir, self.get_tar_name())
-        if not os.path.isfile(tar_path):
-            info("Downloading dataset...")
-            url = self.get_download_path()
-            response = requests.get(url, stream=True)
-            # Download with a nice looking progress bar
-            # https://stackoverflow.com/questions/37573483/progress-bar-while-download-file-over-http-with-requests
-            total_size_in_bytes = int(response.headers.get("content-length", 0))
-            block_size = 1024
-            progress_bar = tqdm(total=total_size_in_bytes, unit="iB", unit_scale=True)
-            with open(tar_path, "wb") as file:
-                for data in response.iter_content(block_size):
-                    progress_bar.update(len(data))
-                    file.write(data)
-            progress_bar.close()
-        else:
-            info("tar already exists.")
-
-        if not os.path.isdir(self.txtdir):
-            info("Extracting dataset, may take a while...")
-            with tarfile.open(tar_path) as tar:
-                # Go over each member
-                for m in tqdm(tar.getmembers()):
-                    # Extract member
-                    tar.extract(member=m, path=self.workdir)
-            info("Extraction done.")
+        if os.path.isfile(tar_path):
+            info("tar already exists, extracting dataset...")
         else:
-            info("Extracted dataset already exists.")
+            # extract along with the download, resuming a previous one
+            info("Downloading and extracting dataset...")
+        progress_bar = tqdm(unit="iB", unit_scale=True)
+
+        def on_progress(n: int, total: int):
+            progress_bar.total = total
+            progress_bar.update(n)
+
+        try:
+            extracted = download_and_extract(
+                self.get_download_path(),
+                tar_path,
+                self.workdir,
+                sha256=self.sha256,
+                problems=self.problem_range,
+                on_progress=on_progress,
+            )
+        finally:
+            progress_bar.close()
+        info(f"Extraction of {len(extracted)} problems done.")
 
 
 class IBMPython800(IBM):
@@ -508,34 +1254,63 @@ class IBMPython800(IBM):
         IBM.__init__(self, workdir, subset)
 
     def preprocess_one(self, txt_path, src_path):
+        # the AFL harness is py_harness.py, which runs the compiled program
         with open(src_path, "w") as f:
-            f.writelines(["import afl\n", "afl.init()\n", "import os\n"])
             with open(txt_path, "r", errors="replace") as txt:
-                code = txt.read()
-                f.write(code)
-            f.writelines(["\nos._exit(0)\n"])
+                f.write(txt.read())
 
-    def preprocess_all(self):
+    def prepare_srcdir(self):
         if not path.isdir(self.txtdir):
             warning(f"{self.txtdir} doesn't exist yet.")
             self.download()
         self.mkdir_if_doesnt_exist(self.srcdir)
-        info("Preprocessing text files into codes")
-        for i in tqdm(self.problems):
-            for p in os.listdir(path.join(self.txtdir, str(i))):
-                p = path.splitext(p)[0]
-                txt_path = path.join(self.txtdir, str(i), str(p) + ".py")
-                src_path = path.join(self.srcdir, str(i), str(p) + ".py")
-                if not path.isfile(src_path):
-                    self.preprocess_one(txt_path, src_path)
+
+    def preprocess_program(self, i, txt_name: str) -> Tuple[str, str]:
+        p = path.splitext(txt_name)[0]
+        txt_path = path.join(self.txtdir, str(i), str(p) + ".py")
+        src_path = path.join(self.srcdir, str(i), str(p) + ".py")
+        if not path.isfile(src_path):
+            self.preprocess_one(txt_path, src_path)
+        return p, src_path
+
+    def prepare_bindir(self):
+        # build/ used to be a symlink to src/, it holds the .pyc now
+        if path.islink(self.bindir):
+            os.remove(self.bindir)
+        self.mkdir_if_doesnt_exist(self.bindir)
 
     def build(self, jobs: int = CORES, on_exit=None, sample=100, built=None):
         if not path.isdir(self.srcdir):
             warning(f"{self.srcdir} doesn't exist yet, preprocessing first.")
             self.preprocess_all()
-        info(f"Python code doesn't need to be compiled, using symlink to {self.srcdir}")
-        # By default there is no preprocessing.
-        os.symlink(self.srcdir, self.bindir)
+        self.prepare_bindir()
+        if built is None:
+            programs = self.programs(max_stage=PREPROCESSED)
+        else:
+            programs = [
+                (i, p)
+                for (i, p) in self.programs()
+                if not built(self.get_paths(i, p)[0])
+            ]
+        programs = [(i, p) for (i, p) in programs if coin_toss(sample)]
+        files_to_compile = [
+            (path.join(self.srcdir, str(i), str(p) + ".py"), self.get_paths(i, p)[0])
+            for (i, p) in programs
+        ]
+
+        info(f"Compiling {len(files_to_compile)} programs into .pyc")
+        with Pool(jobs) as pool:
+            errors = [
+                e
+                for e in tqdm(
+                    pool.imap_unordered(compile_program, files_to_compile, chunksize=64),
+                    total=len(files_to_compile),
+                )
+                if e is not None
+            ]
+        if errors:
+            warning(f"{len(errors)} programs don't compile, e.g. {errors[0]}")
+        self.record_built(programs)
 
 
 def instrument_one_dir_java(p: Tuple[str, str]):
@@ -556,24 +1331,25 @@ def instrument_one_dir_java(p: Tuple[str, str]):
     )
 
 
-def fuzz_one_file_java(p: Tuple[str, str, str], timeout: int, seeds: str):
-    # bind a free port
-    port = get_local_open_port()
+def get_javac_failures(stderr: str, srcs: List[str]) -> List[str]:
+    """The `srcs` javac reported an error for in `stderr`."""
+    failed = []
+    for line in stderr.splitlines():
+        src, sep, rest = line.partition(".java:")
+        if sep and f"{src}.java" in srcs and ": error:" in rest:
+            if f"{src}.java" not in failed:
+                failed.append(f"{src}.java")
+    return failed
 
-    bin_instrumented_dir, class_name, out = p
 
-    start_kelinci_server = [
-        "java",
-        "-cp",
-        bin_instrumented_dir,
-        "edu.cmu.sv.kelinci.Kelinci",
-        "--port",
-        port,
-        class_name,
-        "@@",
-    ]
+def fuzz_with_kelinci(
+    port: str, out: str, timeout: int, seeds: str, core: Optional[int] = None
+) -> subprocess.Popen:
+    """afl-fuzz against the Kelinci server on `port`."""
+    binding, env = get_afl_binding(core)
     run_afl = [
         f"{AFL}/afl-fuzz",
+        *binding,
         "-D",
         "-V",
         str(timeout),
@@ -584,20 +1360,42 @@ def fuzz_one_file_java(p: Tuple[str, str, str], timeout: int, seeds: str):
         "-t",
         "50",
         f"{KELINCI}/fuzzerside/interface",
+        "-p",
+        port,
         "@@",
     ]
-    server = subprocess.Popen(
-        start_kelinci_server,
+    return subprocess.Popen(
+        run_afl,
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
+        env=env,
     )
-    process = subprocess.Popen(
-        run_afl,
+
+
+def fuzz_one_file_java(
+    p: Tuple[str, str, str], timeout: int, seeds: str, core: Optional[int] = None
+):
+    # bind a free port
+    port = get_local_open_port()
+
+    bin_instrumented_dir, class_name, out = p
+
+    start_kelinci_server = [
+        "java",
+        "-cp",
+        bin_instrumented_dir,
+        "edu.cmu.sv.kelinci.Kelinci",
+        "--port",
+        port,
+        class_name,
+        "@@",
+    ]
+    server = subprocess.Popen(
+        start_kelinci_server,
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
     )
-    # Sleep half a second for AFL to bind core.
-    subprocess.run(["sleep", "0.5"])
+    process = fuzz_with_kelinci(port, out, timeout, seeds, core)
     return server, process
 
 
@@ -606,19 +1404,19 @@ class IBMJava250(IBM):
         IBM.__init__(self, workdir, "Java250")
         self.instdir = path.join(self.workdir, "instrumented")
 
-    def preprocess_all(self):
+    def prepare_srcdir(self):
         if not path.isdir(self.txtdir):
             warning(f"{self.txtdir} doesn't exist yet.")
             self.download()
         self.mkdir_if_doesnt_exist(self.srcdir)
-        info("Preprocessing text files into codes")
-        for i in tqdm(self.problems):
-            for p in os.listdir(path.join(self.txtdir, str(i))):
-                txt_path = path.join(self.txtdir, str(i), str(p))
-                src_path = path.join(self.srcdir, str(i), str(p))
-                if not path.isfile(src_path):
-                    class_name = p.split(".java")[-2]
-                    self.preprocess_one(txt_path, src_path, class_name)
+
+    def preprocess_program(self, i, txt_name: str) -> Tuple[str, str]:
+        class_name = txt_name.split(".java")[-2]
+        txt_path = path.join(self.txtdir, str(i), txt_name)
+        src_path = path.join(self.srcdir, str(i), txt_name)
+        if not path.isfile(src_path):
+            self.preprocess_one(txt_path, src_path, class_name)
+        return class_name, src_path
 
     def preprocess_one(self, txt_path, src_path, class_name):
         with open(src_path, "w") as f:
@@ -629,38 +1427,93 @@ class IBMJava250(IBM):
             f.write(code)
 
     def build(self, jobs: int = CORES, on_exit=None, sample=100, built=None):
-        if built is None:
-            built = lambda bin_path: path.isfile(bin_path)
-
         self.mkdir_if_doesnt_exist(self.bindir)
         self.mkdir_if_doesnt_exist(self.instdir)
-        # Copy the files and do some preprocessing
-        files_to_compile: List[Tuple[str, str]] = []
-        dirs_to_instrument: Set[Tuple[str, str]] = set()
-
         info("Collecting codes to compile")
+        if built is None:
+            programs = self.programs(max_stage=PREPROCESSED)
+        else:
+            programs = [
+                (i, p)
+                for (i, p) in self.programs()
+                if not built(self.get_paths(i, p)[0])
+            ]
+        programs = [(i, p) for (i, p) in programs if coin_toss(sample)]
+
+        sources: Dict[str, List[str]] = {}
+        for (i, p) in programs:
+            sources.setdefault(str(i), []).append(
+                path.join(self.srcdir, str(i), str(p) + ".java")
+            )
+        # sources of each problem that are still being compiled
+        pending = {i: len(srcs) for i, srcs in sources.items()}
+
+        def batches():
+            for i, srcs in sources.items():
+                for k in range(0, len(srcs), JAVAC_BATCH_SIZE):
+                    yield "javac", (i, srcs[k : k + JAVAC_BATCH_SIZE])
+
+        def javac_start(batch: Tuple[str, List[str]]):
+            i, srcs = batch
+            # a single source is compiled for its own errors, which fit in a pipe
+            # `on_exit` reads, without it nothing would and they are dropped
+            if len(srcs) == 1:
+                stderr = subprocess.PIPE if on_exit is not None else subprocess.DEVNULL
+            else:
+                stderr = tempfile.TemporaryFile()
+            process = subprocess.Popen(
+                ["javac", "-d", path.join(self.bindir, i), *srcs],
+                stdout=subprocess.DEVNULL,
+                stderr=stderr,
+            )
+            process.errors = stderr
+            return process
+
+        def javac_finish(batch: Tuple[str, List[str]], process: subprocess.Popen):
+            i, srcs = batch
+            if len(srcs) == 1:
+                if on_exit is not None:
+                    on_exit(process)
+            elif process.returncode != 0:
+                # one bad source fails the whole batch, retry the others
+                # without it and compile it alone to get its errors
+                process.errors.seek(0)
+                errors = process.errors.read().decode(errors="replace")
+                process.errors.close()
+                failed = get_javac_failures(errors, srcs)
+                rest = [src for src in srcs if src not in failed]
+                for src in failed if failed else srcs:
+                    pipeline.submit("javac", (i, [src]))
+                if failed and rest:
+                    pipeline.submit("javac", (i, rest))
+                return None
+            if len(srcs) > 1:
+                process.errors.close()
+            pending[i] -= len(srcs)
+            if pending[i] == 0:
+                pipeline.submit("instrument", i)
+            return None
+
+        def instrument_start(i: str):
+            return instrument_one_dir_java(
+                (path.join(self.bindir, i), path.join(self.instdir, i))
+            )
 
-        for (i, p) in self.for_all_src():
-            if path.isdir(os.path.abspath(p)):
-                warning(f"{i}/{p} is a dir, is the dataset correct?")
-            src_path = path.join(self.srcdir, str(i), str(p) + ".java")
-            bin_dir = path.join(self.bindir, str(i))
-            bin_path = path.join(bin_dir, str(p) + ".class")
-            inst_dir = path.join(self.instdir, str(i))
-            if not built(bin_path) and coin_toss(sample):
-                files_to_compile.append((src_path, bin_dir))
-                dirs_to_instrument.add((bin_dir, inst_dir))
-
-        info("Compiling all the code")
-        parallel_subprocess(
-            files_to_compile,
+        pipeline: StreamPipeline = StreamPipeline(
+            [
+                Stage("javac", javac_start, javac_finish, jobs),
+                Stage("instrument", instrument_start, lambda *_: None, jobs),
+            ],
             jobs,
-            lambda r: compile_one_file(r, self.lang),
-            on_exit=on_exit,
         )
-        info("Instrumenting all the code")
-        parallel_subprocess(
-            dirs_to_instrument, jobs, instrument_one_dir_java, on_exit=None
+        info(f"Compiling {len(programs)} classes, up to {JAVAC_BATCH_SIZE} per javac")
+        pipeline.run(batches())
+        self.record_built(programs)
+
+    def is_built(self, i, p) -> bool:
+        # only instrumented classes can be fuzzed
+        return DataSet.is_built(self, i, p) and path.isfile(
+            path.join(self.instdir, str(i), str(p) + ".class")
         )
 
     def fuzz(
@@ -675,34 +1528,127 @@ class IBMJava250(IBM):
         """
         Fuzz the program
         """
-        if fuzzed is None:
-            fuzzed = lambda out_path: ExprimentInfo(out_path).sufficiently_fuzzed()
         self.mkdir_if_doesnt_exist(self.outdir)
-        bins_to_fuzz: List[Tuple[str, str, str]] = []
         info("Collecting binaries to fuzz")
-        for i in tqdm(self.problems):
-            for p in os.listdir(path.join(self.bindir, str(i))):
-                if path.isdir(os.path.abspath(p)):
-                    warning(f"{i}/{p} is a dir, is the dataset correct?")
-                bin_dir = path.join(self.instdir, str(i))
-                class_name = p.split(".class")[0]
-                out_path = path.join(self.outdir, str(i), p)
-                if (
-                    path.isfile(path.join(bin_dir, str(p)))
-                    and not fuzzed(out_path)
-                    and coin_toss(sample)
-                    and "$" not in class_name
-                ):
-                    bins_to_fuzz.append((bin_dir, class_name, out_path))
+        # programs are named after their top level class, so no `$` in them
+        programs = self.programs_to_fuzz(sample, fuzzed)
+        bins_to_fuzz: List[Tuple[str, str, str]] = [
+            (path.join(self.instdir, str(i)), str(p), self.get_paths(i, p)[1])
+            for (i, p) in programs
+        ]
 
         seeds = path.abspath(seeds)
         info(f"Fuzzing all {len(bins_to_fuzz)} binaries")
-        parallel_subprocess_pair(
-            bins_to_fuzz,
-            jobs,
-            lambda r: fuzz_one_file_java(r, timeout=timeout, seeds=seeds),
-            on_exit,
+        cores = CoreAllocator()
+        supervisor = make_fuzz_supervisor(timeout)
+        if KELINCI_POOL:
+            try:
+                pool = KelinciServerPool(jobs, path.join(self.workdir, "kelinci_pool"))
+            except (OSError, subprocess.CalledProcessError) as e:
+                warning(f"Can't build the Kelinci server pool ({e}), starting a server per class")
+            else:
+                with pool:
+                    self.fuzz_with_server_pool(
+                        pool, bins_to_fuzz, jobs, timeout, seeds, cores, on_exit, supervisor
+                    )
+                self.record_fuzzed(programs, supervisor)
+                return
+        if supervisor is not None:
+            warning(
+                "--plateau and --fuzz-budget need the Kelinci server pool, "
+                "fuzzing every class for the full time"
+            )
+
+        def start(r: Tuple[str, str, str]) -> Tuple[subprocess.Popen, subprocess.Popen]:
+            core = cores.acquire()
+            server, process = fuzz_one_file_java(r, timeout=timeout, seeds=seeds, core=core)
+            # the core is bound by afl-fuzz, whose exit `finish` is called with
+            cores.assign(process, core)
+            return server, process
+
+        def finish(p: subprocess.Popen):
+            cores.release(p)
+            return on_exit(p) if on_exit is not None else None
+
+        parallel_subprocess_pair(bins_to_fuzz, jobs, start, finish)
+        self.record_fuzzed(programs)
+
+    def fuzz_with_server_pool(
+        self,
+        pool: KelinciServerPool,
+        bins_to_fuzz: List[Tuple[str, str, str]],
+        jobs: int,
+        timeout: int,
+        seeds: str,
+        cores: CoreAllocator,
+        on_exit=None,
+        supervisor: Optional[FuzzSupervisor] = None,
+    ):
+        """
+        Fuzz (instrumented dir, class, fuzz_out) with the `jobs` long-lived
+        Kelinci servers of `pool`, each afl-fuzz counts as one job since its
+        server is idle while afl-fuzz is busy and the other way around.
+        """
+        servers: Dict[int, KelinciServer] = {}
+        time_limit = timeout if supervisor is None else supervisor.get_time_limit()
+
+        def loaded() -> Iterator[Tuple[Tuple[str, str, str], KelinciServer]]:
+            """
+            The programs with a server that loaded their class, advanced when a
+            job is free. A server that died is replaced once, a class that
+            can't be loaded is skipped, afl-fuzz would fail its dry run.
+            """
+            for r in bins_to_fuzz:
+                inst_dir, class_name, _ = r
+                server = pool.acquire()
+                ok = server.load(inst_dir, class_name)
+                if not ok and not server.alive():
+                    # the pool starts a new server in place of the dead one
+                    pool.release(server)
+                    server = pool.acquire()
+                    ok = server.load(inst_dir, class_name)
+                if not ok:
+                    pool.release(server)
+                    warning(f"Not fuzzing {class_name} of {inst_dir}, it can't be loaded")
+                    continue
+                yield r, server
+
+        def start(r: Tuple[Tuple[str, str, str], KelinciServer]) -> subprocess.Popen:
+            (_, _, out), server = r
+            core = cores.acquire()
+            process = fuzz_with_kelinci(server.port, out, time_limit, seeds, core)
+            cores.assign(process, core)
+            servers[process.pid] = server
+            return process
+
+        def finish(p: subprocess.Popen):
+            cores.release(p)
+            pool.release(servers.pop(p.pid))
+            return on_exit(p) if on_exit is not None else None
+
+        if supervisor is None:
+            parallel_subprocess(loaded(), jobs, start, finish)
+        else:
+            supervisor.run(loaded(), jobs, start, lambda r: r[0][2], finish)
+
+    def stream(
+        self,
+        jobs: int = CORES,
+        timeout=60,
+        seeds="seeds",
+        sample=100,
+        singletime="1m",
+        errfile="O",
+        limits: Dict[str, int] = {},
+    ):
+        warning(
+            "Java programs are compiled and instrumented per problem, "
+            "running the stages one after another"
         )
+        self.preprocess_all(jobs=jobs)
+        self.build(jobs=jobs, sample=sample, on_exit=self.get_compile_on_exit(errfile))
+        self.fuzz(jobs=jobs, timeout=timeout, seeds=seeds, sample=sample)
+        self.postprocess(jobs=jobs, sample=sample, timeout=singletime)
 
 
 def main():
@@ -725,7 +1671,12 @@ def main():
         "-j", "--jobs", type=int, help="Number of threads to use.", default=CORES
     )
     parser.add_argument(
-        "-e", "--errfile", type=str, help="The file name to dump stderr", default="O"
+        "-e",
+        "--errfile",
+        type=str,
+        help="The file name to dump the stderr of compilations to, "
+        "C/C++ diagnostics are recorded in <workdir>/diagnostics.db instead",
+        default="O",
     )
     parser.add_argument(
         "-p",
@@ -735,6 +1686,7 @@ def main():
         default="all",
         choices=[
             "all",
+            "stream",
             "download",
             "preprocess",
             "compile",
@@ -744,6 +1696,18 @@ def main():
             "summarize",
         ],
     )
+    parser.add_argument(
+        "--sha256",
+        type=str,
+        help="Expected sha256 of the downloaded CodeNet tarball",
+        default=None,
+    )
+    parser.add_argument(
+        "--stage-jobs",
+        type=str,
+        help="Limits of programs in each stage of `-p stream`, e.g. compile=8,fuzz=24,replay=4",
+        default="",
+    )
     parser.add_argument(
         "-s",
         "--sample",
@@ -754,6 +1718,19 @@ def main():
     parser.add_argument(
         "-ft", "--fuzztime", type=str, help="Time to fuzz one program", default="1m"
     )
+    parser.add_argument(
+        "--plateau",
+        type=str,
+        help="Stop fuzzing a program once its coverage didn't grow for this long, "
+        "e.g. 10s, and give the time it didn't use to programs still gaining coverage",
+        default=None,
+    )
+    parser.add_argument(
+        "--fuzz-budget",
+        type=str,
+        help="Wall-clock time all fuzzing may take, e.g. 2h",
+        default=None,
+    )
     parser.add_argument(
         "-st",
         "--singletime",
@@ -768,12 +1745,77 @@ def main():
         "-r",
         "--range",
         type=str,
-        help="A string of python iterable object, or None",
+        help="A string of python iterable object, or None. Before the dataset is "
+        "extracted, it selects problems by their order in the archive.",
         default="None",
     )
     parser.add_argument("--encode", action="store_true")
     parser.add_argument("--no-encode", dest="encode", action="store_false")
     parser.set_defaults(encode=False)
+    parser.add_argument(
+        "--no-pch",
+        dest="pch",
+        action="store_false",
+        help="Don't precompile the headers C/C++ programs include.",
+    )
+    parser.add_argument(
+        "--harness",
+        type=str,
+        choices=HARNESS_MODES,
+        default="none",
+        help="Build C/C++ programs with a deferred forkserver or in persistent mode, "
+        "persistent falls back to deferred for programs that are not safe to rerun.",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        help="Directory of the compile cache",
+        default=path.join(EMBDING_HOME, ".compile_cache"),
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=str,
+        help="Size limit of the compile cache, e.g. 512M or 20G",
+        default="20G",
+    )
+    parser.add_argument(
+        "--pack",
+        type=str,
+        choices=["raw", "zstd"],
+        default=None,
+        help="Pack the replay results of each program into one results.pack, "
+        "instead of a file per input in output/ and input_csv/",
+    )
+    parser.add_argument(
+        "--no-kelinci-pool",
+        dest="kelinci_pool",
+        action="store_false",
+        help="Start a new Kelinci server for every Java class instead of reusing a pool.",
+    )
+    parser.add_argument(
+        "--no-jvm-replay",
+        dest="jvm_replay",
+        action="store_false",
+        help="Replay Java classes with a new JVM for every input instead of one per class.",
+    )
+    parser.add_argument(
+        "--fix-rounds",
+        type=int,
+        default=3,
+        help="Rounds of `-p fix` that fix the programs that still have syntax errors.",
+    )
+    parser.add_argument(
+        "--rescan",
+        action="store_true",
+        help="Rebuild the manifest of the workdir from the files in it.",
+    )
+    parser.add_argument(
+        "--no-compile-cache",
+        dest="compile_cache",
+        action="store_false",
+        help="Decide what to compile only by whether the binary exists.",
+    )
 
     args = parser.parse_args()
     workdir = args.workdir if args.workdir != "" else args.dataset
@@ -786,6 +1828,18 @@ def main():
     
     global ENCODE_INPUT
     ENCODE_INPUT = args.encode
+    global HARNESS_MODE
+    HARNESS_MODE = args.harness
+    global USE_PCH
+    USE_PCH = args.pch
+    global PACK_RESULTS
+    PACK_RESULTS = args.pack
+    global KELINCI_POOL
+    KELINCI_POOL = args.kelinci_pool
+    global JVM_REPLAY
+    JVM_REPLAY = args.jvm_replay
+    global FIX_ROUNDS
+    FIX_ROUNDS = args.fix_rounds
 
     dataset = None
     if args.dataset == "POJ104":
@@ -800,30 +1854,66 @@ def main():
     else:
         unreachable("No dataset provided.")
 
+    if isinstance(dataset, IBM):
+        dataset.sha256 = args.sha256
+    if args.rescan:
+        dataset.manifest.clear()
+    if args.compile_cache:
+        dataset.compile_cache = CompileCache(args.cache_dir, parse_size(args.cache_size))
+
     def convert_to_seconds(s: str) -> int:
         seconds_per_unit = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
         return int(s[:-1]) * seconds_per_unit[s[-1]]
 
+    def parse_stage_jobs(s: str) -> Dict[str, int]:
+        limits = {}
+        for limit in filter(None, s.split(",")):
+            stage, n = limit.split("=")
+            limits[stage.strip()] = int(n)
+        return limits
+
     args.fuzztime = convert_to_seconds(args.fuzztime)
+    global PLATEAU_WINDOW
+    if args.plateau is not None:
+        PLATEAU_WINDOW = convert_to_seconds(args.plateau)
+    global FUZZ_BUDGET
+    if args.fuzz_budget is not None:
+        FUZZ_BUDGET = convert_to_seconds(args.fuzz_budget)
     dataset.set_problems(args.range)
 
     if args.pipeline == "all":
         dataset.download()
         dataset.update_problems()
-        dataset.preprocess_all()
-        dataset.build(jobs=args.jobs, sample=args.sample)
+        dataset.preprocess_all(jobs=args.jobs)
+        dataset.build(
+            jobs=args.jobs,
+            sample=args.sample,
+            on_exit=dataset.get_compile_on_exit(args.errfile),
+        )
         dataset.fix(args.errfile, jobs=args.jobs)
         dataset.fuzz(jobs=args.jobs, timeout=args.fuzztime, seeds=args.seeds)
         dataset.postprocess(jobs=args.jobs, timeout=args.singletime)
+    elif args.pipeline == "stream":
+        dataset.download()
+        dataset.update_problems()
+        dataset.stream(
+            jobs=args.jobs,
+            timeout=args.fuzztime,
+            seeds=args.seeds,
+            sample=args.sample,
+            singletime=args.singletime,
+            errfile=args.errfile,
+            limits=parse_stage_jobs(args.stage_jobs),
+        )
     elif args.pipeline == "download":
         dataset.download()
     elif args.pipeline == "preprocess":
-        dataset.preprocess_all()
+        dataset.preprocess_all(jobs=args.jobs)
     elif args.pipeline == "compile":
         dataset.build(
             jobs=args.jobs,
             sample=args.sample,
-            on_exit=partial(dump_stderr_on_exit, args.errfile),
+            on_exit=dataset.get_compile_on_exit(args.errfile),
         )
     elif args.pipeline == "fuzz":
         dataset.fuzz(
@@ -832,7 +1922,7 @@ def main():
     elif args.pipeline == "postprocess":
         dataset.postprocess(jobs=args.jobs, timeout=args.singletime, sample=args.sample)
     elif args.pipeline == "summarize":
-        dataset.summarize()
+        dataset.summarize(jobs=args.jobs)
     elif args.pipeline == "fix":
         dataset.fix(args.errfile, jobs=args.jobs)
     else:
@@ -0,0 +1,194 @@
+# Group programs that only differ in whitespace or comments.
+#
+# Only one representative per group is compiled, fuzzed and replayed,
+# the artifacts of the others are symlinks to the representative's.
+import hashlib
+import json
+import os
+from os import path
+import re
+from multiprocessing import Pool
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# bump when the hashes change, an index of older hashes is built again
+HASH_VERSION = 2
+# longest first, `a+++b` is `a ++ + b` like the compiler reads it
+C_OPERATOR = (
+    r">>=|<<=|->\*|\.\.\.|->|\+\+|--|<<|>>|<=|>=|==|!=|&&|\|\||::|\.\*|##"
+    r"|[-+*/%&|^]="
+)
+C_TOKEN = re.compile(
+    r"(?P<comment>//[^\n]*|/\*.*?\*/)|(?P<newline>\n)"
+    r'|"(?:\\.|[^\\"\n])*"|\'(?:\\.|[^\\\'\n])*\'|\w+|' + C_OPERATOR + r"|\S",
+    re.DOTALL,
+)
+
+
+def normalize_c(code: str) -> str:
+    """
+    Join the tokens of a C/C++ program with single spaces,
+    preprocessor directives keep their own line.
+    """
+    lines: List[str] = []
+    tokens: List[str] = []
+
+    def end_line():
+        if not tokens:
+            return
+        if tokens[0] == "#" or not lines or lines[-1].startswith("#"):
+            lines.append(" ".join(tokens))
+        else:
+            lines[-1] += " " + " ".join(tokens)
+        tokens.clear()
+
+    for m in C_TOKEN.finditer(code):
+        if m.group("newline") is not None:
+            end_line()
+        elif m.group("comment") is None:
+            tokens.append(m.group(0))
+    end_line()
+    return "\n".join(lines)
+
+
+def normalize_python(code: str) -> str:
+    """Indentation matters in Python, only drop blank lines, comments and trailing spaces."""
+    lines = [line.rstrip() for line in code.splitlines()]
+    return "\n".join(
+        line for line in lines if line != "" and not line.lstrip().startswith("#")
+    )
+
+
+NORMALIZERS = {"C/C++": normalize_c, "Python": normalize_python}
+
+
+def hash_program(args: Tuple[str, str, Tuple[str, ...]]) -> str:
+    """Hash of the normalized source, with the macros it is compiled with."""
+    src, lang, macros = args
+    with open(src, "r", errors="replace") as f:
+        code = f.read()
+    defines = "".join(f"#define {m}\n" for m in macros)
+    return hashlib.sha256((defines + NORMALIZERS[lang](code)).encode()).hexdigest()
+
+
+class DuplicateIndex:
+    """Maps each duplicate program `problem/program` to its representative."""
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.representatives: Dict[str, str] = {}
+        # how many programs of each problem are indexed
+        self.num_programs_per_problem: Dict[str, int] = {}
+        # first program seen with each hash, see `add`
+        self.first: Dict[str, str] = {}
+        # the saved index grouped programs by older hashes
+        self.outdated = False
+        if path.isfile(index_path):
+            with open(index_path, "r") as f:
+                index = json.load(f)
+            self.outdated = index.get("hash_version") != HASH_VERSION
+            # an index without the counts per problem is indexed again from scratch
+            if "num_programs_per_problem" in index:
+                self.representatives = index["representatives"]
+                self.num_programs_per_problem = index["num_programs_per_problem"]
+
+    @property
+    def num_programs(self) -> int:
+        return sum(self.num_programs_per_problem.values())
+
+    def save(self):
+        with open(self.index_path, "w") as f:
+            json.dump(
+                {
+                    "hash_version": HASH_VERSION,
+                    "num_programs": self.num_programs,
+                    "num_programs_per_problem": self.num_programs_per_problem,
+                    "representatives": self.representatives,
+                },
+                f,
+            )
+
+    def build(
+        self,
+        programs: Iterable[Tuple[str, str, str]],
+        lang: str,
+        jobs: int,
+        get_macros: Optional[Callable[[str], List[str]]] = None,
+    ) -> Dict[str, str]:
+        """
+        Group (problem, program, src) by the hash of their normalized source
+        and the macros `get_macros` gives for it, programs compiled with other
+        macros are different programs. Returns the hash of each `problem/program`.
+        The entries of other problems are kept.
+        """
+        programs = sorted(programs)
+        args = [
+            (src, lang, tuple(get_macros(src)) if get_macros is not None else ())
+            for _, _, src in programs
+        ]
+        with Pool(jobs) as pool:
+            digests = pool.map(hash_program, args, chunksize=256)
+        hashes: Dict[str, str] = {}
+        self.clear({i for i, _, _ in programs})
+        for (i, p, _), digest in zip(programs, digests):
+            hashes[f"{i}/{p}"] = digest
+            self.add(i, p, digest)
+        self.save()
+        self.outdated = False
+        return hashes
+
+    def clear(self, problems: Iterable):
+        """Forget the programs of `problems`, to index them again."""
+        problems = {str(i) for i in problems}
+        self.representatives = {
+            dup: rep
+            for dup, rep in self.representatives.items()
+            if dup.split("/")[0] not in problems
+        }
+        for i in problems:
+            self.num_programs_per_problem.pop(i, None)
+        self.first = {}
+
+    def add(self, i, p, digest: str) -> Optional[str]:
+        """
+        Add one program with the hash `digest` of its normalized source,
+        returns its representative if it is a duplicate.
+        """
+        name = f"{i}/{p}"
+        self.num_programs_per_problem[str(i)] = self.num_programs_per_problem.get(str(i), 0) + 1
+        rep = self.first.setdefault(digest, name)
+        if rep == name:
+            return None
+        self.representatives[name] = rep
+        return rep
+
+    def get_representative(self, i, p) -> Optional[str]:
+        return self.representatives.get(f"{i}/{p}")
+
+    def is_duplicate(self, i, p) -> bool:
+        return f"{i}/{p}" in self.representatives
+
+    def materialize(self, dir: str, suffix: str = "") -> int:
+        """
+        Symlink `dir/<problem>/<program><suffix>` of every duplicate to its
+        representative's, if the representative has one and the duplicate doesn't.
+        """
+        num_linked = 0
+        for dup, rep in self.representatives.items():
+            dup_path = path.join(dir, dup + suffix)
+            rep_path = path.join(dir, rep + suffix)
+            if path.lexists(dup_path) or not path.exists(rep_path):
+                continue
+            if not path.isdir(path.dirname(dup_path)):
+                continue
+            os.symlink(path.relpath(rep_path, path.dirname(dup_path)), dup_path)
+            num_linked += 1
+        return num_linked
+
+    def summary(self) -> str:
+        num_dups = len(self.representatives)
+        num_groups = self.num_programs - num_dups
+        saved = num_dups / self.num_programs * 100 if self.num_programs else 0.0
+        return (
+            f"{self.num_programs} programs in {num_groups} distinct groups, "
+            f"{num_dups} duplicates skipped ({saved:.2f}% of the work saved)"
+        )
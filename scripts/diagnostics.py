@@ -0,0 +1,340 @@
+# Compiler diagnostics of every program, parsed when its compilation exits.
+#
+# Instead of appending raw clang stderr to one errfile and splitting it again
+# on "generated." lines, each diagnostic is stored as a row of
+# <workdir>/diagnostics.db under the program it belongs to, so `fix` reads the
+# report of one program by its key and concurrent compiles can't interleave.
+#
+# The errors are classified by `ERROR_RULES`, all compiled into one regex, to
+# see which kinds of errors are common enough for a new fix strategy.
+import os
+from os import path
+import re
+import sqlite3
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+# "<file>:<line>:<column>: <severity>: <message>"
+DIAGNOSTIC = re.compile(r"^(.*?):(\d+):(\d+): (fatal error|error|warning): (.*)$")
+# the include stack clang prints before a diagnostic or note in a header
+INCLUDED_FROM = re.compile(r"^(?:In file included from | +from ).*:\d+:$")
+
+Program = Tuple[str, str]
+
+# (category, pattern) matched against the start of an error's message, the
+# first matching rule wins. Patterns must not have capturing groups.
+ERROR_RULES: List[Tuple[str, str]] = [
+    ("main_returned_non_int", r".*'main' must return 'int'"),
+    ("main_invalid_param", r".*parameter of 'main' .*must be of type"),
+    ("main_no_return_value", r"non-void function 'main' should return a value"),
+    ("no_return_value", r"non-void function '[^']*' should return a value"),
+    ("missing_type_specifier", r"C\+\+ requires a type specifier for all declarations"),
+    ("struct_in_result_type", r".*cannot be defined in the result type of a function"),
+    ("ambiguous_reference", r"reference to '[^']*' is ambiguous"),
+    ("ambiguous_call", r"call to '[^']*' is ambiguous"),
+    ("redefinition_as_different_symbol", r"redefinition of '[^']*' as different kind of symbol"),
+    ("redefinition", r"redefinition of "),
+    ("undeclared_identifier", r"use of undeclared identifier "),
+    ("unknown_type_name", r"unknown type name "),
+    ("no_matching_function", r"no matching (?:member )?function for call to "),
+    ("no_member", r"no (?:type|member) named "),
+    ("invalid_operands", r"invalid operands to binary expression"),
+    ("incompatible_types", r".*incompatible (?:pointer )?type"),
+    ("no_viable_conversion", r"no viable conversion"),
+    ("cannot_initialize", r"cannot initialize "),
+    ("variable_length_array", r"(?:variable-sized object|variable length array)"),
+    ("array_size", r".*array size|array has incomplete element type"),
+    ("subscript", r"subscripted value is not "),
+    ("jump_bypasses_init", r"cannot jump from "),
+    ("expected_token", r"expected "),
+    ("extraneous_token", r"extraneous "),
+    ("file_not_found", r"'[^']*' file not found"),
+    ("too_many_errors", r"too many errors emitted"),
+]
+ERROR_CLASSIFIER = re.compile("|".join(f"(?P<{name}>{rule})" for name, rule in ERROR_RULES))
+UNMATCHED = "unmatched"
+# names and numbers in a message, replaced to group unmatched messages
+MESSAGE_VARIABLES = re.compile(r"'[^']*'|\b\d+\b")
+
+
+class Diagnostic(NamedTuple):
+    severity: str
+    line: int
+    column: int
+    message: str
+    # the diagnostic with its code snippet and notes, as clang printed it
+    text: str
+
+
+def program_of(src: str) -> Program:
+    """<...>/<problem>/<program>.cpp -> (problem, program)"""
+    problem, name = src.split("/")[-2:]
+    return problem, path.splitext(name)[0]
+
+
+def parse_diagnostics(stderr: str) -> Tuple[List[Diagnostic], Optional[str]]:
+    """
+    The errors and warnings in `stderr` and its "... generated." summary, the
+    lines after a diagnostic up to the next one belong to it, and so does the
+    include stack right before it.
+    """
+    diagnostics: List[Diagnostic] = []
+    summary = None
+    head: Optional[re.Match] = None
+    lines: List[str] = []
+    # include stack of the next diagnostic or note
+    context: List[str] = []
+
+    def flush():
+        if head is not None:
+            severity, line, column, message = head.group(4, 2, 3, 5)
+            diagnostics.append(
+                Diagnostic(severity, int(line), int(column), message, "\n".join(lines))
+            )
+
+    for line in stderr.splitlines():
+        match = DIAGNOSTIC.match(line)
+        if match is not None:
+            flush()
+            head, lines, context = match, context + [line], []
+        elif line.endswith(" generated."):
+            summary = line
+        elif INCLUDED_FROM.match(line) is not None:
+            context.append(line)
+        elif head is not None:
+            lines += context + [line]
+            context = []
+    flush()
+    return diagnostics, summary
+
+
+class DiagnosticStore:
+    def __init__(self, workdir: str):
+        self.db_path = path.join(workdir, "diagnostics.db")
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(path.dirname(self.db_path), exist_ok=True)
+            self._db = sqlite3.connect(self.db_path)
+            self._db.executescript(
+                """
+                PRAGMA journal_mode = WAL;
+                PRAGMA synchronous = NORMAL;
+                CREATE TABLE IF NOT EXISTS reports (
+                    problem TEXT NOT NULL,
+                    program TEXT NOT NULL,
+                    num_errors INTEGER NOT NULL,
+                    num_warnings INTEGER NOT NULL,
+                    summary TEXT,
+                    src TEXT,
+                    PRIMARY KEY (problem, program)
+                );
+                CREATE TABLE IF NOT EXISTS diagnostics (
+                    problem TEXT NOT NULL,
+                    program TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    severity TEXT NOT NULL,
+                    line INTEGER NOT NULL,
+                    col INTEGER NOT NULL,
+                    message TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    PRIMARY KEY (problem, program, idx)
+                );
+                CREATE INDEX IF NOT EXISTS reports_errors ON reports (num_errors);
+                """
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(reports)")]
+            # stores from before the source path was recorded
+            if "src" not in columns:
+                self._db.execute("ALTER TABLE reports ADD COLUMN src TEXT")
+                self._db.commit()
+        return self._db
+
+    def clear(self):
+        self.db.execute("DELETE FROM reports")
+        self.db.execute("DELETE FROM diagnostics")
+        self.db.commit()
+
+    def record(self, program: Program, stderr: str, src: Optional[str] = None):
+        """
+        Replace the diagnostics of `program` with the ones in its compiler's
+        `stderr`, `src` is the path of the source it was compiled from.
+        """
+        diagnostics, summary = parse_diagnostics(stderr)
+        self.db.execute("DELETE FROM reports WHERE problem = ? AND program = ?", program)
+        self.db.execute("DELETE FROM diagnostics WHERE problem = ? AND program = ?", program)
+        if diagnostics:
+            num_errors = sum(d.severity != "warning" for d in diagnostics)
+            self.db.execute(
+                "INSERT INTO reports VALUES (?, ?, ?, ?, ?, ?)",
+                (*program, num_errors, len(diagnostics) - num_errors, summary, src),
+            )
+            self.db.executemany(
+                "INSERT INTO diagnostics VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(*program, idx, *d) for idx, d in enumerate(diagnostics)],
+            )
+        self.db.commit()
+
+    def get_diagnostics(self, program: Program) -> List[Diagnostic]:
+        rows = self.db.execute(
+            "SELECT severity, line, col, message, text FROM diagnostics "
+            "WHERE problem = ? AND program = ? ORDER BY idx",
+            program,
+        )
+        return [Diagnostic(*row) for row in rows.fetchall()]
+
+    def get_report_lines(self, program: Program) -> Optional[List[str]]:
+        """
+        The stderr lines of `program` that make its CompilerReport, None without
+        errors. The first line names its source, the first diagnostic may be
+        in a header.
+        """
+        row = self.db.execute(
+            "SELECT summary, src FROM reports "
+            "WHERE problem = ? AND program = ? AND num_errors > 0",
+            program,
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        summary, src = row
+        if src is None:
+            src = "/".join(program) + ".cpp"
+        lines = [f"{src}:"]
+        for d in self.get_diagnostics(program):
+            lines += d.text.split("\n")
+        return lines + [summary]
+
+    def get_programs_with_errors(self) -> List[Program]:
+        rows = self.db.execute(
+            "SELECT problem, program FROM reports WHERE num_errors > 0 "
+            "ORDER BY problem, program"
+        )
+        return rows.fetchall()
+
+    def get_errors(self) -> List[Tuple[Program, str]]:
+        """The `(program, message)` of every recorded error."""
+        rows = self.db.execute(
+            "SELECT problem, program, message FROM diagnostics WHERE severity != 'warning'"
+        )
+        return [((problem, program), message) for problem, program, message in rows]
+
+    def reports(self) -> Iterator[List[str]]:
+        """The CompilerReport lines of every program with errors."""
+        for program in self.get_programs_with_errors():
+            lines = self.get_report_lines(program)
+            if lines is not None:
+                yield lines
+
+
+def classify_error(message: str) -> str:
+    """The category of an error message, or "unmatched: <message template>"."""
+    match = ERROR_CLASSIFIER.match(message)
+    if match is not None:
+        return match.lastgroup
+    return f"{UNMATCHED}: {MESSAGE_VARIABLES.sub('_', message)}"
+
+
+class ErrorHistogram:
+    """How many errors of each category there are and which programs have them."""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.programs: Dict[str, Set[str]] = {}
+
+    def add(self, category: str, program: str):
+        self.counts[category] = self.counts.get(category, 0) + 1
+        self.programs.setdefault(category, set()).add(program)
+
+    def merge(self, other: "ErrorHistogram"):
+        for category, count in other.counts.items():
+            self.counts[category] = self.counts.get(category, 0) + count
+            self.programs.setdefault(category, set()).update(other.programs[category])
+
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def to_dict(self, num_examples: int) -> Dict[str, Dict[str, object]]:
+        """Categories by count, each with its number of programs and some examples."""
+        return {
+            category: {
+                "errors": count,
+                "programs": len(self.programs[category]),
+                "examples": sorted(self.programs[category])[:num_examples],
+            }
+            for category, count in sorted(self.counts.items(), key=lambda kv: (-kv[1], kv[0]))
+        }
+
+    def format(self, num_examples: int, num_unmatched: int) -> str:
+        """A table of the matched categories, all unmatched errors in one row and
+        the `num_unmatched` most common unmatched messages."""
+        total = max(self.total(), 1)
+        rows = self.to_dict(num_examples)
+        unmatched = {c: row for c, row in rows.items() if c.startswith(UNMATCHED)}
+        matched = {c: row for c, row in rows.items() if c not in unmatched}
+        num_unmatched_errors = sum(row["errors"] for row in unmatched.values())
+        lines = [f"{'category':<36}{'errors':>10}{'%':>7}{'programs':>10}  examples"]
+        for category, row in matched.items():
+            lines.append(
+                f"{category:<36}{row['errors']:>10}{100 * row['errors'] / total:>7.2f}"
+                f"{row['programs']:>10}  {' '.join(row['examples'])}"
+            )
+        lines.append(
+            f"{UNMATCHED:<36}{num_unmatched_errors:>10}"
+            f"{100 * num_unmatched_errors / total:>7.2f}{'':>10}  "
+            f"{len(unmatched)} distinct messages"
+        )
+        for category, row in list(unmatched.items())[:num_unmatched]:
+            lines.append(
+                f"  {category[len(UNMATCHED) + 2 :]}\n"
+                f"  {'':<34}{row['errors']:>10}{100 * row['errors'] / total:>7.2f}"
+                f"{row['programs']:>10}  {' '.join(row['examples'])}"
+            )
+        return "\n".join(lines)
+
+
+def classify_errors(errors: Iterable[Tuple[Program, str]]) -> ErrorHistogram:
+    """Classify the messages of `(program, message)` errors."""
+    histogram = ErrorHistogram()
+    for (problem, program), message in errors:
+        histogram.add(classify_error(message), f"{problem}/{program}")
+    return histogram
+
+
+def get_shards(p: str, num_shards: int) -> List[Tuple[str, int, int]]:
+    """Split the file `p` into `(p, begin, end)` byte ranges of similar size."""
+    size = path.getsize(p)
+    step = max(-(-size // max(num_shards, 1)), 1)
+    return [(p, begin, min(begin + step, size)) for begin in range(0, size, step)]
+
+
+def classify_shard(shard: Tuple[str, int, int]) -> ErrorHistogram:
+    """
+    Classify the errors on the lines of a stderr dump that start in the byte
+    range of `shard`, for Pool workers. Errors in headers are counted for the
+    program compiled last.
+    """
+    p, begin, end = shard
+    histogram = ErrorHistogram()
+    program = "?"
+    with open(p, "rb") as f:
+        if begin > 0:
+            # the line going on at `begin` belongs to the shard before
+            f.seek(begin - 1)
+            f.readline()
+        offset = f.tell()
+        while offset < end:
+            line = f.readline()
+            if not line:
+                break
+            offset += len(line)
+            if b"error: " not in line:
+                continue
+            match = DIAGNOSTIC.match(line.decode(errors="replace").rstrip("\n"))
+            if match is None or match.group(4) == "warning":
+                continue
+            src = match.group(1)
+            if src.endswith(".cpp"):
+                program = "/".join(program_of(src))
+            histogram.add(classify_error(match.group(5)), program)
+    return histogram
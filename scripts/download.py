@@ -0,0 +1,307 @@
+# Resumable download and streaming extraction of dataset tarballs.
+#
+# The tarball is downloaded to `<dst>.part` in 1 MiB blocks and resumed with
+# an HTTP Range request after a broken connection. Extraction reads the
+# archive as a stream, so it never indexes the whole archive in memory, and
+# can follow the `.part` file while it is still being downloaded. Files are
+# extracted to a staging directory and only moved into place once the tarball
+# is complete and verified, an interrupted run leaves nothing half extracted.
+# Usage: python3 scripts/download.py URL -o tar.gz [-x DIR] [--sha256 HEX] [-r "range(0, 10)"]
+import argparse
+import hashlib
+import logging
+from logging import info, warning
+import os
+from os import path
+import shutil
+import socket
+import tarfile
+import threading
+import time
+from http.client import HTTPException
+from typing import Callable, Container, Dict, List, Optional
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+BLOCK_SIZE = 1 << 20
+# members are checked by `is_safe_member`, still use the stricter filter where it exists
+EXTRACT_FILTER = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+
+
+def sha256sum(file_path: str) -> str:
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def download(
+    url: str,
+    dst: str,
+    sha256: Optional[str] = None,
+    retries: int = 5,
+    timeout: float = 60,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    allow_restart: bool = True,
+):
+    """
+    Download `url` to `dst` through `<dst>.part`, resuming what is already in
+    it with a Range request, also after each of up to `retries` broken
+    connections. `on_progress(new_bytes, total)` is called after every block.
+    Without `allow_restart` a server that can't resume is an error,
+    instead of truncating `.part` under someone reading it.
+    Raises `ValueError` if the file doesn't match `sha256`.
+    """
+    part = dst + ".part"
+    attempt = 0
+    while True:
+        offset = path.getsize(part) if path.isfile(part) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+        try:
+            with urlopen(Request(url, headers=headers), timeout=timeout) as response:
+                if offset > 0 and response.status != 206:
+                    if not allow_restart:
+                        os.remove(part)
+                        raise ValueError(f"{url} doesn't support resuming, start over")
+                    warning(f"{url} doesn't support resuming, downloading from the start")
+                    offset = 0
+                total = offset + int(response.headers.get("Content-Length", 0))
+                if on_progress is not None:
+                    on_progress(offset, total)
+                with open(part, "ab" if offset > 0 else "wb") as f:
+                    while True:
+                        block = response.read(BLOCK_SIZE)
+                        if not block:
+                            break
+                        f.write(block)
+                        f.flush()
+                        if on_progress is not None:
+                            on_progress(len(block), total)
+                if path.getsize(part) < total:
+                    raise HTTPException(f"connection closed at {path.getsize(part)}/{total}")
+            break
+        except HTTPError as e:
+            # the range starts at the end, `.part` is complete
+            if e.code == 416 and offset > 0:
+                break
+            raise
+        except (URLError, HTTPException, ConnectionError, socket.timeout) as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            warning(f"Download of {url} interrupted ({e}), resuming ({attempt}/{retries})")
+            time.sleep(min(2**attempt, 30))
+
+    if sha256 is not None:
+        digest = sha256sum(part)
+        if digest != sha256.lower():
+            os.remove(part)
+            raise ValueError(f"{url}: sha256 {digest} doesn't match {sha256}")
+    os.replace(part, dst)
+
+
+class FollowReader:
+    """
+    Reads a file that is still being written,
+    a read at its end waits for more data until `done` is set.
+    """
+
+    def __init__(self, file_path: str, done: threading.Event, poll_interval: float = 0.1):
+        self.file = open(file_path, "rb")
+        self.done = done
+        self.poll_interval = poll_interval
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = []
+        while size != 0:
+            # everything is written once `done` is set, so check it before reading
+            finished = self.done.is_set()
+            block = self.file.read(size if size > 0 else BLOCK_SIZE)
+            if block:
+                chunks.append(block)
+                size -= len(block) if size > 0 else 0
+            elif finished:
+                break
+            else:
+                time.sleep(self.poll_interval)
+        return b"".join(chunks)
+
+    def close(self):
+        self.file.close()
+
+
+def is_safe_member(member: tarfile.TarInfo) -> bool:
+    name = path.normpath(member.name)
+    return (
+        not path.isabs(name)
+        and name != ".."
+        and not name.startswith("../")
+        and (member.isfile() or member.isdir())
+    )
+
+
+def extract_problems(
+    fileobj, dst_dir: str, problems: Optional[Container[int]] = None
+) -> List[str]:
+    """
+    Extract a `<dataset>/<problem>/<program>` tarball read from `fileobj`
+    as a stream into `dst_dir`. If `problems` is given, only the problems
+    whose index in the order they appear in the archive is in it are extracted.
+    Returns the extracted problems.
+    """
+    index: Dict[str, int] = {}
+    extracted: List[str] = []
+    with tarfile.open(fileobj=fileobj, mode="r|*", bufsize=BLOCK_SIZE) as tar:
+        for member in tar:
+            if not is_safe_member(member):
+                warning(f"Skipping {member.name} in the archive")
+                continue
+            parts = path.normpath(member.name).split("/")
+            if len(parts) >= 2:
+                problem = parts[1]
+                if problem not in index:
+                    index[problem] = len(index)
+                if problems is not None and index[problem] not in problems:
+                    continue
+                if problem not in extracted:
+                    extracted.append(problem)
+            tar.extract(member, dst_dir, set_attrs=False, **EXTRACT_FILTER)
+    return extracted
+
+
+def move_into(src: str, dst: str):
+    """Move `src` to `dst`, merging directories into ones that already exist."""
+    if path.isdir(src) and path.isdir(dst) and not path.islink(dst):
+        for name in os.listdir(src):
+            move_into(path.join(src, name), path.join(dst, name))
+        os.rmdir(src)
+    else:
+        if path.isdir(dst) and not path.islink(dst):
+            shutil.rmtree(dst)
+        os.replace(src, dst)
+
+
+def download_and_extract(
+    url: str,
+    tar_path: str,
+    dst_dir: str,
+    sha256: Optional[str] = None,
+    problems: Optional[Container[int]] = None,
+    follow: bool = True,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[str]:
+    """
+    Download `url` to `tar_path` and extract the selected `problems` to `dst_dir`,
+    with `follow` extraction runs along the download instead of after it.
+    The files are extracted to `<tar_path>.extracting` and only moved to
+    `dst_dir` once the download is complete and matches `sha256`.
+    """
+    staging = tar_path + ".extracting"
+    if path.isdir(staging):
+        warning(f"Removing {staging} left by an interrupted extraction")
+        shutil.rmtree(staging)
+    os.makedirs(staging)
+    extracted = extract_to(url, tar_path, staging, sha256, problems, follow, on_progress)
+    os.makedirs(dst_dir, exist_ok=True)
+    move_into(staging, dst_dir)
+    return extracted
+
+
+def extract_to(
+    url: str,
+    tar_path: str,
+    dst_dir: str,
+    sha256: Optional[str],
+    problems: Optional[Container[int]],
+    follow: bool,
+    on_progress: Optional[Callable[[int, int], None]],
+) -> List[str]:
+    """`download_and_extract` straight into `dst_dir`."""
+    if not follow or path.isfile(tar_path):
+        if not path.isfile(tar_path):
+            download(url, tar_path, sha256=sha256, on_progress=on_progress)
+        with open(tar_path, "rb") as f:
+            return extract_problems(f, dst_dir, problems)
+
+    done = threading.Event()
+    failure: List[BaseException] = []
+    # open `.part` before the download can rename it, writes keep the same inode
+    open(tar_path + ".part", "ab").close()
+    reader = FollowReader(tar_path + ".part", done)
+
+    def downloader():
+        try:
+            download(
+                url,
+                tar_path,
+                sha256=sha256,
+                on_progress=on_progress,
+                allow_restart=False,
+            )
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=downloader, daemon=True)
+    thread.start()
+    try:
+        extracted = extract_problems(reader, dst_dir, problems)
+    except (tarfile.TarError, EOFError):
+        # a truncated archive is reported as the download failure behind it
+        thread.join()
+        if failure:
+            raise failure[0]
+        raise
+    finally:
+        reader.close()
+    thread.join()
+    if failure:
+        raise failure[0]
+    return extracted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download and extract a dataset tarball")
+    parser.add_argument("url", type=str)
+    parser.add_argument("-o", "--output", type=str, required=True, help="The tarball")
+    parser.add_argument("-x", "--extract", type=str, help="Directory to extract to")
+    parser.add_argument("--sha256", type=str, help="Expected sha256 of the tarball")
+    parser.add_argument(
+        "-r",
+        "--range",
+        type=str,
+        help="A string of python iterable object of problem indices, or None",
+        default="None",
+    )
+    parser.add_argument(
+        "--no-follow",
+        dest="follow",
+        action="store_false",
+        help="Extract after the download instead of along with it",
+    )
+    args = parser.parse_args()
+
+    if args.extract is None:
+        download(args.url, args.output, sha256=args.sha256)
+        return
+    problems = eval(args.range)
+    extracted = download_and_extract(
+        args.url,
+        args.output,
+        args.extract,
+        sha256=args.sha256,
+        problems=None if problems is None else set(problems),
+        follow=args.follow,
+    )
+    info(f"Extracted {len(extracted)} problems to {args.extract}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    main()
@@ -4,29 +4,16 @@ from compile_report import *
 from tqdm import tqdm
 from functools import partial
 import sys
-from dataset import format_one_file
 import sctokenizer
 from sctokenizer import Source, TokenType, Token
-from functools import reduce
 from compile_report import init_crash_report_from_stderr
 from tqdm import tqdm
 from replace_input import replace_file
 
 CPP_TYPE_SET = {"int", "float", "double", "char", "wchar", "bool", "void", "long"}
-
-
-def tokenize(paths: Tuple[str, str]):
-    def token2tuple(token):
-        # discard position
-        return (token.token_value, token.token_type)
-
-    # ! reading from txt file or temp fixed file without includes and defines
-    # assembling includes and defines tokens is too complex
-    txt_path, cpp_path = paths
-    fpath = cpp_path + "~" if os.path.exists(cpp_path + "~") else txt_path
-    tokens = sctokenizer.tokenize_file(filepath=fpath, lang="cpp")
-    tokens = list(map(token2tuple, tokens))
-    return tokens
+# the `#include`s every cpp file starts with
+PRELUDE = get_prelude()
+PRELUDE_LINES = PRELUDE.count("\n")
 
 
 def get_value(token: Tuple[str, TokenType]):
@@ -40,54 +27,96 @@ def get_value(token: Tuple[str, TokenType]):
     return token_val
 
 
-# TODO: Should use an IOWrapper to write to file or string.
-def assemble_tokens_and_write(tokens: List[Tuple[str, TokenType]], cpp_path: str):
-    """write tokens to a temp-cpp file
-
-    Args:
-        tokens (List[Tuple[str, TokenType]]): list of tokens of the file
-        cpp_path (str): path to the final cpp file to compile
-    """
+def assemble_tokens(tokens: List[Tuple[str, TokenType]]) -> str:
+    return "".join(map(get_value, tokens))
 
-    with open(cpp_path + "~", "w") as f:
-        f.write(reduce(lambda s, t: s + get_value(t), tokens, ""))
 
+class FixedSource:
+    """
+    The fix context of one program: its code while its errors are fixed,
+    kept in memory, and the macros to define before it. The code is tokenized
+    once for all strategies that edit `tokens`, and only joined back into
+    `text` when a strategy edits lines or it is written.
+    """
 
-def write_fixed_file(cpp_path: str):
-    """preprocess a fixed temp-cpp file with headers
+    def __init__(self, paths: Tuple[str, str], from_cpp: bool = False):
+        self.txt_path, self.cpp_path = paths
+        # `#define`s written between the prelude and the code
+        self.macros: List[str] = []
+        # the cpp file of a previous fix round is preprocessed already,
+        # otherwise fix the txt file without includes and defines,
+        # assembling includes and defines tokens is too complex
+        self.preprocessed = from_cpp
+        if from_cpp:
+            with open(self.cpp_path, "r", errors="replace") as f:
+                code = f.read()
+            if code.startswith(PRELUDE):
+                code = code[len(PRELUDE) :]
+            while code.startswith("#define "):
+                macro, _, code = code.partition("\n")
+                self.macros.append(macro + "\n")
+            self._text: Optional[str] = code
+        else:
+            with open(self.txt_path, "r", errors="replace") as f:
+                self._text = f.read()
+        self._tokens: Optional[List[Tuple[str, TokenType]]] = None
+        # lines in front of the code in the compiled cpp file, to map its line numbers
+        self.header_lines = PRELUDE_LINES + len(self.macros)
+        self.fixed = False
+
+    @property
+    def tokens(self) -> List[Tuple[str, TokenType]]:
+        if self._tokens is None:
+            # discard position
+            self._tokens = [
+                (token.token_value, token.token_type)
+                for token in sctokenizer.tokenize_str(self._text, lang="cpp")
+            ]
+        return self._tokens
+
+    @tokens.setter
+    def tokens(self, tokens: List[Tuple[str, TokenType]]):
+        self._tokens = tokens
+        self._text = None
+        self.fixed = True
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = assemble_tokens(self._tokens)
+        return self._text
+
+    @text.setter
+    def text(self, text: str):
+        self._text = text
+        self._tokens = None
+        self.fixed = True
+
+
+def get_fixed_code(source: FixedSource) -> Optional[str]:
+    """preprocess a fixed source with headers
 
     Args:
-        cpp_path (str): path to write the cpp file
+        source (FixedSource): the source after all fixes
+
+    Returns:
+        the code of its cpp file, None if nothing was fixed
     """
-    if not os.path.exists(cpp_path + "~"):
-        return
-
-    code = format_one_file(cpp_path + "~").stdout.read().decode()
-    code = replace_file(code)
-    code = code.replace("void main", "int main")
-    with open(cpp_path, "w") as f:
-        with open(path.join(EMBDING_HOME, "header.hpp"), "r") as hpp:
-            header = hpp.read()
-            f.write(header)
-        # cat $EMBDING_HOME/encode2stderr.hpp >> $SRCDIR/$P.cpp
-        with open(path.join(EMBDING_HOME, "encode2stderr.hpp"), "r") as hpp:
-            header = hpp.read()
-            f.write(header)
-        # if there is additional macro defined, write them to f
-        const_macro_path = path.join(EMBDING_HOME, "const_macro.hpp")
-        if path.exists(const_macro_path):
-            with open(const_macro_path, "r") as hpp:
-                macro = hpp.read()
-                f.write(macro)
-            os.remove(const_macro_path)
-        f.write(code)
-    os.remove(cpp_path + "~")
+    if not source.fixed:
+        return None
+
+    code = format_code(source.text)
+    if not source.preprocessed:
+        code = replace_file(code)
+        code = code.replace("void main", "int main")
+    # #include "header.hpp" and "encode2stderr.hpp", then the additional macros
+    return PRELUDE + "".join(source.macros) + code
 
 
 class FixStrategy:
     _description: str
     _isMatch: Callable[[Report, CompilerReport], bool]
-    _fix: Callable[[str, Report, CompilerReport], None]
+    _fix: Callable[[FixedSource, Report, CompilerReport], None]
 
     def __init__(self, description, isMatch, fix):
         self._description = description
@@ -100,14 +129,13 @@ class FixStrategy:
     def isMatch(self, r: Report, cr: CompilerReport) -> bool:
         return self._isMatch(r, cr)
 
-    def fix(self, path, r, cr):
-        self._fix(path, r, cr)
+    def fix(self, source: FixedSource, r: Report, cr: CompilerReport):
+        self._fix(source, r, cr)
 
 
 # Main does not return int
-def _fix_main_returned_non_int(paths: Tuple[str, str], r: Report, cr: CompilerReport):
-    txt_path, cpp_path = paths
-    tokens = tokenize(paths)
+def _fix_main_returned_non_int(source: FixedSource, r: Report, cr: CompilerReport):
+    tokens = source.tokens
     main_idx = tokens.index(("main", TokenType.IDENTIFIER))
     prev_val, prev_type = tokens[main_idx - 1]
     int_token = ("int", TokenType.KEYWORD)
@@ -118,8 +146,8 @@ def _fix_main_returned_non_int(paths: Tuple[str, str], r: Report, cr: CompilerRe
         # main no type
         tokens = tokens[:main_idx] + [int_token] + tokens[main_idx:]
     else:
-        error(f"undefined main return error: {cpp_path}")
-    assemble_tokens_and_write(tokens, cpp_path)
+        error(f"undefined main return error: {source.cpp_path}")
+    source.tokens = tokens
 
 
 fix_main_returned_non_int = FixStrategy(
@@ -130,13 +158,12 @@ fix_main_returned_non_int = FixStrategy(
 
 
 # Main has no return type
-def _fix_main_has_no_return_type(paths: Tuple[str, str], r: Report, cr: CompilerReport):
-    txt_path, cpp_path = paths
-    tokens = tokenize(paths)
+def _fix_main_has_no_return_type(source: FixedSource, r: Report, cr: CompilerReport):
+    tokens = source.tokens
     main_idx = tokens.index(("main", TokenType.IDENTIFIER))
     int_token = ("int", TokenType.KEYWORD)
     tokens = tokens[:main_idx] + [int_token] + tokens[main_idx:]
-    assemble_tokens_and_write(tokens, cpp_path)
+    source.tokens = tokens
 
 
 main_has_no_return_type = FixStrategy(
@@ -146,15 +173,14 @@ main_has_no_return_type = FixStrategy(
 )
 
 
-def _fix_use_of_std_keyword(paths: Tuple[str, str], r: Report, cr: CompilerReport):
-    txt_path, cpp_path = paths
-    tokens = tokenize(paths)
+def _fix_use_of_std_keyword(source: FixedSource, r: Report, cr: CompilerReport):
+    tokens = source.tokens
     keywords = cr.get_keywords_used()
     for i in range(len(tokens)):
         token_val, token_type = tokens[i]
         if token_val in keywords:
             tokens[i] = ("fixed_" + token_val, token_type)
-    assemble_tokens_and_write(tokens, cpp_path)
+    source.tokens = tokens
 
 
 # Cpp stdlib keyword
@@ -165,9 +191,8 @@ use_of_std_keyword = FixStrategy(
 )
 
 
-def _fix_struct_len_undefined(paths: Tuple[str, str], r: Report, cr: CompilerReport):
-    txt_path, cpp_path = paths
-    tokens = tokenize(paths)
+def _fix_struct_len_undefined(source: FixedSource, r: Report, cr: CompilerReport):
+    tokens = source.tokens
     var_pairs = list(cr.get_struct_len_definition())
     _, len_vars = tuple(zip(*var_pairs))
     for i in range(len(tokens)):
@@ -175,7 +200,7 @@ def _fix_struct_len_undefined(paths: Tuple[str, str], r: Report, cr: CompilerRep
         if token_val in len_vars:
             struct_size_var, len_var = var_pairs[len_vars.index(token_val)]
             tokens[i] = (f"sizeof({struct_size_var})", token_type)
-    assemble_tokens_and_write(tokens, cpp_path)
+    source.tokens = tokens
 
 
 struct_len_undefined = FixStrategy(
@@ -185,9 +210,8 @@ struct_len_undefined = FixStrategy(
 )
 
 
-def _fix_type_cannot_be_returned(paths: Tuple[str, str], r: Report, cr: CompilerReport):
-    txt_path, cpp_path = paths
-    tokens = tokenize(paths)
+def _fix_type_cannot_be_returned(source: FixedSource, r: Report, cr: CompilerReport):
+    tokens = source.tokens
     struct_name = r.get_struct_name()
     defn_idx = tokens.index((struct_name, TokenType.IDENTIFIER))
     # insert token after first } after struct definition
@@ -199,8 +223,7 @@ def _fix_type_cannot_be_returned(paths: Tuple[str, str], r: Report, cr: Compiler
         + [(";", TokenType.SPECIAL_SYMBOL)]
         + tokens[struct_end_idx:]
     )
-
-    assemble_tokens_and_write(tokens, cpp_path)
+    source.tokens = tokens
 
 
 struct_missing_semicolon = FixStrategy(
@@ -210,9 +233,8 @@ struct_missing_semicolon = FixStrategy(
 )
 
 
-def _fix_main_invalid_arg(paths: Tuple[str, str], r: Report, cr: CompilerReport):
-    txt_path, cpp_path = paths
-    tokens = tokenize(paths)
+def _fix_main_invalid_arg(source: FixedSource, r: Report, cr: CompilerReport):
+    tokens = source.tokens
 
     main_arg_tokens = [
         ("int", TokenType.KEYWORD),
@@ -229,7 +251,7 @@ def _fix_main_invalid_arg(paths: Tuple[str, str], r: Report, cr: CompilerReport)
         tokens[main_idx:].index((")", TokenType.SPECIAL_SYMBOL)) + main_idx
     )  # insert arg tokens B4 first ) after main
     tokens = tokens[:start_idx] + main_arg_tokens + tokens[end_idx:]
-    assemble_tokens_and_write(tokens, cpp_path)
+    source.tokens = tokens
 
 
 invalid_main_arg = FixStrategy(
@@ -239,27 +261,14 @@ invalid_main_arg = FixStrategy(
 )
 
 
-def _fix_main_didnt_return_value(paths: Tuple[str, str], r: Report, cr: CompilerReport):
-    txt_path, cpp_path = paths
-    fpath = cpp_path + "~" if os.path.exists(cpp_path + "~") else txt_path
-    with open(fpath, "r") as f:
-        lines = f.readlines()
+def _fix_main_didnt_return_value(source: FixedSource, r: Report, cr: CompilerReport):
+    lines = source.text.splitlines(keepends=True)
 
     # current f has no headers
-    offset = 0
-    with open(path.join(EMBDING_HOME, "header.hpp")) as f:
-        offset += len(f.readlines())
-    with open(path.join(EMBDING_HOME, "encode2stderr.hpp")) as f:
-        offset += len(f.readlines())
-    if path.exists(path.join(EMBDING_HOME, "const_macro.hpp")):
-        with open(path.join(EMBDING_HOME, "const_macro.hpp")) as f:
-            offset += len(f.readlines())
-
     (ret_ln, _) = r.get_loc()
-    ret_ln -= offset
+    ret_ln -= source.header_lines
     lines[ret_ln - 1] = lines[ret_ln - 1].replace("return", "return 0")
-    with open(cpp_path + "~", "w") as f:
-        f.writelines(lines)
+    source.text = "".join(lines)
 
 
 main_return_value = FixStrategy(
@@ -270,17 +279,12 @@ main_return_value = FixStrategy(
 
 
 def _fix_undeclared_identifier_macro(
-    paths: Tuple[str, str], r: Report, cr: CompilerReport
+    source: FixedSource, r: Report, cr: CompilerReport
 ):
-    txt_path, cpp_path = paths
     macro_name = r.get_undefined_macro()
-    macro_defn = f"#define {macro_name} 100\n"
-    with open(path.join(EMBDING_HOME, "const_macro.hpp"), "a") as hpp:
-        hpp.write(macro_defn)
-    if not path.exists(cpp_path + "~"):
-        with open(cpp_path + "~", "w") as f:
-            with open(txt_path, "r", errors="replace") as txt:
-                f.write(txt.read())
+    source.macros.append(f"#define {macro_name} 100\n")
+    # the code itself is unchanged, but has to be written with the macro
+    source.fixed = True
 
 
 undeclared_identifier_macro = FixStrategy(
@@ -299,7 +303,7 @@ def in_special_case_list(_: Report, cr: CompilerReport):
     return (cr.p, cr.i) in SPECIAL_CASE_LIST
 
 
-def _fix_special_case(cpp_path: str):
+def _fix_special_case(source: FixedSource, r: Report, cr: CompilerReport):
     pass
 
 
@@ -316,14 +320,28 @@ FIX_STRATEGIES = [
     struct_len_undefined,
     struct_missing_semicolon,
     invalid_main_arg,
-    # `undeclared_identifier_macro` may change the line numebr used in `main_return_value`
-    # so these two need to be in order
     undeclared_identifier_macro,
     main_return_value,
     special_cases,
 ]
 
 
+def fix_compiler_report(p: Tuple[List[str], bool]) -> Tuple[str, Optional[str]]:
+    """
+    Apply FIX_STRATEGIES to the program of one CompilerReport, for Pool workers.
+    With `from_cpp` the fixes of a previous round in its cpp file are fixed further.
+    Returns the cpp path and its fixed code, or None if nothing was fixed.
+    """
+    lines, from_cpp = p
+    cr = CompilerReport(lines)
+    source = FixedSource(cr.get_path(), from_cpp)
+    for r in cr.error_list:
+        for strategy in FIX_STRATEGIES:
+            if strategy.isMatch(r, cr):
+                strategy.fix(source, r, cr)
+    return source.cpp_path, get_fixed_code(source)
+
+
 def main():
     pass_file
 
@@ -0,0 +1,271 @@
+# Fuzzing statistics of a whole workdir as numpy arrays.
+#
+# `fuzzer_stats` and `plot_data` of every fuzzed program are read in parallel
+# into one structured array with a row per program, and persisted column by
+# column in <workdir>/fuzz_stats.npz together with per-problem distributions.
+# Rows of programs whose `fuzzer_stats` didn't change since are taken from
+# the previous file, so summarizing again only reads what was fuzzed since.
+# Summarizing some problems keeps the rows of the others.
+# Usage: python3 scripts/fuzz_stats.py <workdir> [-j N]
+import argparse
+import logging
+from logging import info
+import os
+from os import path
+from multiprocessing import Pool
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from manifest import FUZZED, Manifest
+
+STATS_NAME = "fuzz_stats.npz"
+
+# (column, dtype, names in fuzzer_stats across AFL++ versions)
+FIELDS = [
+    ("run_time", "i8", ["run_time"]),
+    ("execs_done", "i8", ["execs_done"]),
+    ("execs_per_sec", "f4", ["execs_per_sec"]),
+    ("bitmap_cvg", "f4", ["bitmap_cvg"]),
+    ("stability", "f4", ["stability"]),
+    ("edges_found", "i8", ["edges_found"]),
+    ("corpus_count", "i8", ["corpus_count", "paths_total"]),
+    ("saved_crashes", "i8", ["saved_crashes", "unique_crashes"]),
+    ("saved_hangs", "i8", ["saved_hangs", "unique_hangs"]),
+]
+# seconds from the start of fuzzing until the coverage stopped growing, from plot_data
+PLATEAU = ("time_to_plateau", "f4")
+# distributions per problem are computed for these columns
+METRICS = ["bitmap_cvg", "execs_per_sec", "time_to_plateau", "stability"]
+QUANTILES = [10, 50, 90]
+
+Row = Tuple
+
+
+def missing(dtype: str):
+    return np.nan if dtype.startswith("f") else -1
+
+
+def read_fuzzer_stats(stats_path: str) -> Dict[str, str]:
+    """`key : value` lines of a `fuzzer_stats`, the same as `ExprimentInfo` reads."""
+    stats = {}
+    with open(stats_path, "r") as f:
+        for line in f:
+            key, sep, value = line.partition(":")
+            if sep:
+                stats[key.strip()] = value.strip()
+    return stats
+
+
+def read_time_to_plateau(plot_data_path: str) -> float:
+    """Time from the first row of `plot_data` to the last one the coverage grew at."""
+    try:
+        with open(plot_data_path, "r") as f:
+            columns = [c.strip() for c in f.readline().lstrip("#").split(",")]
+            # edges_found is only in AFL++ 3.0+, map_size in all of them
+            cov = columns.index("edges_found" if "edges_found" in columns else "map_size")
+            start = last_growth = None
+            last_cov = None
+            for line in f:
+                fields = line.split(",")
+                if len(fields) <= cov:
+                    continue
+                t = float(fields[0])
+                if start is None:
+                    start = t
+                if fields[cov].strip() != last_cov:
+                    last_cov = fields[cov].strip()
+                    last_growth = t
+    except (OSError, ValueError):
+        return np.nan
+    return np.nan if start is None else last_growth - start
+
+
+def parse_value(value: Optional[str], dtype: str):
+    if value is None:
+        return missing(dtype)
+    try:
+        value = value.rstrip("%")
+        return float(value) if dtype.startswith("f") else int(float(value))
+    except ValueError:
+        return missing(dtype)
+
+
+def read_stats(args: Tuple[str, str, str, int]) -> Optional[Tuple[int, Optional[Row]]]:
+    """
+    (mtime, row) of an AFL output dir, with a row of None if `fuzzer_stats`
+    still has the mtime `cached_mtime`, or None if it was never fuzzed.
+    """
+    problem, program, fuzz_out, cached_mtime = args
+    stats_path = path.join(fuzz_out, "fuzzer_stats")
+    try:
+        mtime = os.stat(stats_path).st_mtime_ns
+        if mtime == cached_mtime:
+            return mtime, None
+        stats = read_fuzzer_stats(stats_path)
+    except OSError:
+        return None
+    row = [
+        parse_value(next((stats[k] for k in keys if k in stats), None), dtype)
+        for _, dtype, keys in FIELDS
+    ]
+    row.append(read_time_to_plateau(path.join(fuzz_out, "plot_data")))
+    return mtime, (problem, program, mtime, *row)
+
+
+def make_dtype(rows: List[Row]) -> np.dtype:
+    name_len = max([1] + [max(len(r[0]), len(r[1])) for r in rows])
+    return np.dtype(
+        [("problem", f"U{name_len}"), ("program", f"U{name_len}"), ("mtime", "i8")]
+        + [(name, dtype) for name, dtype, _ in FIELDS]
+        + [PLATEAU]
+    )
+
+
+def save_stats(stats_path: str, stats: np.ndarray, problems: np.ndarray):
+    columns = {f"programs/{c}": stats[c] for c in stats.dtype.names}
+    columns.update({f"problems/{c}": problems[c] for c in problems.dtype.names})
+    tmp_path = f"{stats_path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp_path, **columns)
+    os.replace(tmp_path, stats_path)
+
+
+def load_stats(stats_path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """The (per program, per problem) arrays `save_stats` persisted."""
+
+    def to_array(columns: Dict[str, np.ndarray]) -> np.ndarray:
+        arr = np.empty(
+            len(next(iter(columns.values()))),
+            dtype=[(c, v.dtype) for c, v in columns.items()],
+        )
+        for c, v in columns.items():
+            arr[c] = v
+        return arr
+
+    with np.load(stats_path) as npz:
+        tables: Dict[str, Dict[str, np.ndarray]] = {"programs": {}, "problems": {}}
+        for key in npz.files:
+            table, column = key.split("/", 1)
+            tables[table][column] = npz[key]
+    return to_array(tables["programs"]), to_array(tables["problems"])
+
+
+def collect_stats(
+    fuzz_outs: Iterable[Tuple[str, str, str]],
+    jobs: int = os.cpu_count(),
+    stats_path: Optional[str] = None,
+    problems: Optional[Iterable] = None,
+) -> np.ndarray:
+    """
+    Structured array of the stats of the (problem, program, fuzz_out)
+    that were fuzzed, reusing the unchanged rows of `stats_path`.
+    If `fuzz_outs` are only those of `problems`, the rows of the other
+    problems in `stats_path` are kept.
+    """
+    cached: Dict[Tuple[str, str], Row] = {}
+    if stats_path is not None and path.isfile(stats_path):
+        old, _ = load_stats(stats_path)
+        if old.dtype.names == make_dtype([]).names:
+            cached = {(r[0], r[1]): r for r in old.tolist()}
+
+    tasks = [
+        (i, p, path.join(fuzz_out, "default"), cached.get((i, p), (0, 0, -1))[2])
+        for i, p, fuzz_out in fuzz_outs
+    ]
+    rows = []
+    num_reused = 0
+    with Pool(jobs) as pool:
+        for task, result in zip(tasks, pool.imap(read_stats, tasks, chunksize=256)):
+            if result is None:
+                continue
+            _, row = result
+            if row is None:
+                row = cached[(task[0], task[1])]
+                num_reused += 1
+            rows.append(row)
+    info(f"Read stats of {len(rows) - num_reused} programs, {num_reused} unchanged")
+    if problems is not None:
+        selected = {str(i) for i in problems}
+        rows += [row for (i, _), row in cached.items() if i not in selected]
+        rows.sort(key=lambda row: (row[0], row[1]))
+    return np.array(rows, dtype=make_dtype(rows))
+
+
+def per_problem(stats: np.ndarray) -> np.ndarray:
+    """Count, mean and `QUANTILES` of each of `METRICS` per problem."""
+    stats = np.sort(stats, order=["problem", "program"])
+    problems, starts, counts = np.unique(
+        stats["problem"], return_index=True, return_counts=True
+    )
+    dtype = [("problem", stats.dtype["problem"]), ("count", "i8")]
+    for m in METRICS:
+        dtype += [(f"{m}_mean", "f4")] + [(f"{m}_p{q}", "f4") for q in QUANTILES]
+    result = np.zeros(len(problems), dtype=dtype)
+    result["problem"] = problems
+    result["count"] = counts
+    for m in METRICS:
+        values = stats[m].astype("f8")
+        if not np.issubdtype(stats.dtype[m], np.floating):
+            values[stats[m] < 0] = np.nan
+        for k, (start, count) in enumerate(zip(starts, counts)):
+            group = values[start : start + count]
+            if np.all(np.isnan(group)):
+                result[k][f"{m}_mean"] = np.nan
+                for q in QUANTILES:
+                    result[k][f"{m}_p{q}"] = np.nan
+                continue
+            result[k][f"{m}_mean"] = np.nanmean(group)
+            for q, v in zip(QUANTILES, np.nanpercentile(group, QUANTILES)):
+                result[k][f"{m}_p{q}"] = v
+    return result
+
+
+def format_distributions(stats: np.ndarray) -> str:
+    lines = [f"{'':>16}{'mean':>10}" + "".join(f"{'p' + str(q):>10}" for q in QUANTILES)]
+    for m in METRICS:
+        values = stats[m].astype("f8")
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            continue
+        lines.append(
+            f"{m:>16}{np.mean(values):>10.2f}"
+            + "".join(f"{v:>10.2f}" for v in np.percentile(values, QUANTILES))
+        )
+    return "\n".join(lines)
+
+
+def summarize_workdir(
+    workdir: str, problems: Optional[Iterable] = None, jobs: int = os.cpu_count()
+) -> np.ndarray:
+    """
+    Collect the stats of the fuzzed programs of `workdir`, persist them
+    to its `STATS_NAME` and return the per program array. With `problems`,
+    only those are collected again, the saved stats of others are kept.
+    """
+    manifest = Manifest(workdir)
+    if problems is not None:
+        manifest.select_problems(problems)
+    fuzz_outs = manifest.get_fuzz_outs(min_stage=FUZZED, only_selected=problems is not None)
+    stats_path = path.join(workdir, STATS_NAME)
+    stats = collect_stats(fuzz_outs, jobs, stats_path, problems)
+    save_stats(stats_path, stats, per_problem(stats))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect the fuzzing stats of a workdir")
+    parser.add_argument("workdir", type=str)
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="Number of processes", default=os.cpu_count()
+    )
+    args = parser.parse_args()
+
+    stats = summarize_workdir(path.abspath(args.workdir), jobs=args.jobs)
+    info(f"Saved stats of {len(stats)} programs to {path.join(args.workdir, STATS_NAME)}")
+    print(format_distributions(stats))
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    main()
@@ -0,0 +1,142 @@
+# Write AFL harness wrappers around preprocessed C++ programs.
+#
+# The wrapper renames the program's `main` to `afl_user_main` and includes
+# `afl_harness.hpp`, which either defers the forkserver until static
+# initialization is done, or runs the program in an `__AFL_LOOP`.
+# Persistent mode is only used when the program looks safe to rerun in the
+# same process, i.e. it has no mutable global or static state.
+import os
+from os import path
+import re
+from typing import List
+
+HARNESS_MODES = ["none", "deferred", "persistent"]
+
+# anything matching these can leave state behind between iterations
+UNSAFE_PATTERNS = [
+    re.compile(r"\bstatic\b"),
+    re.compile(r"\bnamespace\b(?!\s+std\b)"),
+    re.compile(r"\bsync_with_stdio\b"),
+    re.compile(r"\bfreopen\b"),
+    re.compile(r"\bfclose\s*\(\s*stdin\b"),
+    re.compile(r"\bsetvbuf\b"),
+    re.compile(r"\batexit\b"),
+]
+
+LITERAL_OR_COMMENT = re.compile(
+    r'//.*?$|/\*.*?\*/|\'(?:\\.|[^\\\'])*\'|"(?:\\.|[^\\"])*"',
+    re.DOTALL | re.MULTILINE,
+)
+
+IMMUTABLE_PREFIXES = ("using", "typedef", "template", "const", "constexpr", "extern")
+TYPE_PREFIXES = ("struct", "class", "union", "enum")
+
+
+def strip_code(code: str) -> str:
+    """remove comments, literals and preprocessor lines"""
+
+    def replacer(match):
+        s = match.group(0)
+        if s.startswith("/"):
+            return " "
+        # keep a placeholder so `char s[] = "..."` still looks like a definition
+        return s[0] + s[0]
+
+    code = LITERAL_OR_COMMENT.sub(replacer, code)
+    return "\n".join(
+        line for line in code.splitlines() if not line.lstrip().startswith("#")
+    )
+
+
+def top_level_statements(code: str) -> List[str]:
+    """
+    Split `code` into file scope statements, with bodies replaced by `{}`.
+    A function definition ends at its closing brace, anything else at `;`.
+    """
+    statements = []
+    depth = 0
+    stmt = ""
+    for c in code:
+        if c == "{":
+            if depth == 0:
+                stmt += "{}"
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0 and "(" in stmt.split("{}")[0]:
+                statements.append(stmt.strip())
+                stmt = ""
+        elif depth == 0:
+            if c == ";":
+                statements.append(stmt.strip())
+                stmt = ""
+            else:
+                stmt += c
+    if stmt.strip():
+        statements.append(stmt.strip())
+    return [" ".join(s.split()) for s in statements if s.strip()]
+
+
+def is_mutable_global(stmt: str) -> bool:
+    if stmt.startswith(IMMUTABLE_PREFIXES):
+        return False
+    if stmt.startswith(TYPE_PREFIXES):
+        # `struct node {...} nodes[100]` declares variables after the body
+        return "{}" in stmt and stmt.split("{}", 1)[1].strip() != ""
+    if "=" in stmt:
+        return True
+    if "(" in stmt:
+        # `int f(int a);` is a prototype, `vector<int> v(10);` a variable
+        args = stmt.split("(", 1)[1].lstrip()
+        return args[:1].isdigit() or args[:1] in ["'", '"', "-"]
+    return True
+
+
+def is_rerun_safe(code: str) -> bool:
+    """Can `main` of `code` be called repeatedly in one process?"""
+    stripped = strip_code(code)
+    if any(p.search(stripped) for p in UNSAFE_PATTERNS):
+        return False
+    return not any(map(is_mutable_global, top_level_statements(stripped)))
+
+
+def main_takes_args(code: str) -> bool:
+    return re.search(r"\bmain\s*\(\s*(void)?\s*\)", strip_code(code)) is None
+
+
+def get_harness_path(src: str) -> str:
+    """<workdir>/src/<problem>/<id>.cpp -> <workdir>/harness/<problem>/<id>.cpp"""
+    workdir, rel = src.rsplit("/src/", 1)
+    return path.join(workdir, "harness", rel)
+
+
+def write_harness(src: str, mode: str) -> str:
+    """
+    Write the harness wrapper of `src` and return its path.
+    `persistent` falls back to `deferred` if the program isn't safe to rerun.
+    """
+    with open(src, "r", errors="replace") as f:
+        code = f.read()
+
+    defines = []
+    if mode == "persistent" and is_rerun_safe(code):
+        defines.append("#define AFL_HARNESS_PERSISTENT")
+    if main_takes_args(code):
+        defines.append("#define AFL_HARNESS_MAIN_ARGS")
+
+    harness_path = get_harness_path(src)
+    os.makedirs(path.dirname(harness_path), exist_ok=True)
+    with open(harness_path, "w") as f:
+        f.write(
+            "\n".join(
+                defines
+                + [
+                    "#define main afl_user_main",
+                    f'#include "{path.abspath(src)}"',
+                    "#undef main",
+                    '#include "afl_harness.hpp"',
+                    "",
+                ]
+            )
+        )
+    return harness_path
@@ -0,0 +1,115 @@
+# Long-lived Kelinci servers that fuzz one Java class after another.
+#
+# Instead of a new JVM per class, every fuzzing slot keeps one `KelinciPool`
+# JVM (see KelinciPool.java) on its own port, and loads the next class into
+# it before the next `afl-fuzz` is started against that port, so JVM startup
+# and JIT warm-up are paid once per slot instead of once per program.
+from common import *
+
+POOL_SRC = path.join(EMBDING_HOME, "KelinciPool.java")
+KELINCI_JAR = f"{KELINCI}/instrumentor/build/libs/kelinci.jar"
+
+
+def build_pool_server(build_dir: str) -> str:
+    """Compile KelinciPool.java into `build_dir` unless it is up to date."""
+    class_path = path.join(build_dir, "KelinciPool.class")
+    if not path.isfile(class_path) or path.getmtime(class_path) < path.getmtime(POOL_SRC):
+        os.makedirs(build_dir, exist_ok=True)
+        subprocess.run(
+            ["javac", "-cp", KELINCI_JAR, "-d", build_dir, POOL_SRC],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+    return build_dir
+
+
+class KelinciServer:
+    def __init__(self, build_dir: str, timeout_ms: int = 300000):
+        self.port = get_local_open_port()
+        self.process = subprocess.Popen(
+            [
+                "java",
+                "-cp",
+                f"{KELINCI_JAR}:{build_dir}",
+                "KelinciPool",
+                self.port,
+                str(timeout_ms),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def load(self, class_dir: str, class_name: str) -> bool:
+        """
+        Make `class_name` of `class_dir` the target of the next requests,
+        a server that doesn't answer is closed.
+        """
+        try:
+            self.process.stdin.write(f"load {class_dir} {class_name}\n")
+            self.process.stdin.flush()
+            reply = self.process.stdout.readline().strip()
+        except (BrokenPipeError, OSError):
+            reply = ""
+        if reply == "":
+            warning(f"Kelinci server on {self.port} died loading {class_name}")
+            self.close()
+            return False
+        if reply != "ok":
+            warning(f"Kelinci server on {self.port} can't load {class_name}: {reply}")
+        return reply == "ok"
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class KelinciServerPool:
+    """
+    `size` servers started on first use, a server that died
+    is replaced by a new one when it is acquired next.
+    """
+
+    def __init__(self, size: int, build_dir: str):
+        self.build_dir = build_pool_server(build_dir)
+        self.free: List[KelinciServer] = []
+        self.size = size
+        self.started = 0
+
+    def acquire(self) -> KelinciServer:
+        while self.free:
+            server = self.free.pop()
+            if server.alive():
+                return server
+            server.close()
+            self.started -= 1
+        if self.started >= self.size:
+            raise RuntimeError("All Kelinci servers are taken")
+        self.started += 1
+        return KelinciServer(self.build_dir)
+
+    def release(self, server: KelinciServer):
+        self.free.append(server)
+
+    def close(self):
+        for server in self.free:
+            server.close()
+        self.free = []
+        self.started = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
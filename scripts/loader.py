@@ -0,0 +1,187 @@
+# Read the replayed fuzzing results of a workdir for training.
+#
+# Programs are selected from <workdir>/manifest.db, with the fuzz stats
+# `ExprimentInfo` reads recorded there, so filtering by coverage doesn't
+# open a fuzzer_stats per program. Results packed by `pack.py` are read
+# through one mmap per program and handed out as `memoryview`s into it,
+# results still in output/ and input_csv/ are read file by file.
+# Usage: python3 scripts/loader.py <workdir> [--min-cvg 40] [--shard 0/4]
+import argparse
+import logging
+from logging import info
+import os
+from os import path
+import sys
+import time
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from manifest import Manifest
+from pack import PackReader, get_pack_path, read_file
+
+Bytes = Union[bytes, memoryview]
+# (variable name, scanf type or "" for cin, value) of each input the program read
+Trace = List[Tuple[str, str, str]]
+
+
+class Sample(NamedTuple):
+    problem: str
+    program: str
+    name: str
+    input: Bytes
+    stdout: Optional[Bytes]
+    trace: Optional[Trace]
+
+
+def decode_trace(data: Bytes) -> Trace:
+    """Decode the `name,type,value` lines `encode2stderr.hpp` writes to stderr."""
+    trace = []
+    for line in bytes(data).decode(errors="replace").splitlines():
+        fields = line.split(",", 2)
+        # anything else the program wrote to stderr
+        if len(fields) == 3:
+            trace.append((fields[0], fields[1], fields[2]))
+    return trace
+
+
+def read_fuzz_out(
+    fuzz_out: str,
+) -> Iterator[Tuple[str, Bytes, Optional[Bytes], Optional[Bytes]]]:
+    """
+    (queue entry, input, stdout, input_csv) of an AFL output dir,
+    the mmap of a pack stays open as long as any of its `memoryview`s.
+    """
+    pack_path = get_pack_path(fuzz_out)
+    if path.isfile(pack_path):
+        with PackReader(pack_path) as pack:
+            for name, (input, input_csv, stdout) in pack.items():
+                yield name, input, stdout, input_csv
+        return
+
+    queue_dir = path.join(fuzz_out, "queue")
+    if not path.isdir(queue_dir):
+        return
+    for name in sorted(os.listdir(queue_dir)):
+        if name.startswith(".") or path.isdir(path.join(queue_dir, name)):
+            continue
+        yield (
+            name,
+            read_file(path.join(queue_dir, name)),
+            read_file(path.join(fuzz_out, "output", name)),
+            read_file(path.join(fuzz_out, "input_csv", name + ".csv")),
+        )
+
+
+class ResultLoader:
+    """
+    Iterable of the `Sample`s of every replayed program in `workdir` whose
+    fuzz stats pass the thresholds. With `num_shards` only every
+    `num_shards`-th program starting at `shard` is read; without, the
+    shard is taken from the torch `DataLoader` worker iterating it, if any.
+    """
+
+    def __init__(
+        self,
+        workdir: str,
+        problems: Optional[Iterable] = None,
+        min_bitmap_cvg: Optional[float] = None,
+        min_run_time: Optional[int] = None,
+        sufficiently_fuzzed: bool = False,
+        with_duplicates: bool = False,
+        decode: bool = True,
+        shard: int = 0,
+        num_shards: Optional[int] = None,
+    ):
+        self.workdir = path.abspath(workdir)
+        self.outdir = path.join(self.workdir, "fuzz")
+        manifest = Manifest(self.workdir)
+        if not path.isfile(manifest.db_path):
+            raise FileNotFoundError(
+                f"{manifest.db_path} doesn't exist, "
+                "run `dataset.py -p summarize` on the workdir first"
+            )
+        if problems is not None:
+            manifest.select_problems(problems)
+        self.programs: List[Tuple[str, str, str]] = [
+            # the workdir may have moved since it was recorded
+            (i, p, path.join(self.outdir, *fuzz_out.split(os.sep)[-2:], "default"))
+            for i, p, fuzz_out in manifest.get_fuzz_outs(
+                min_bitmap_cvg=min_bitmap_cvg,
+                min_run_time=min_run_time,
+                sufficiently_fuzzed=sufficiently_fuzzed,
+                with_duplicates=with_duplicates,
+                only_selected=problems is not None,
+            )
+        ]
+        manifest.db.close()
+        self.decode = decode
+        self.shard = shard
+        self.num_shards = num_shards
+
+    def get_shard(self) -> Tuple[int, int]:
+        if self.num_shards is not None:
+            return self.shard, self.num_shards
+        # only look for a worker if the training code imported torch
+        torch = sys.modules.get("torch")
+        worker = None if torch is None else torch.utils.data.get_worker_info()
+        if worker is None:
+            return 0, 1
+        return worker.id, worker.num_workers
+
+    def __len__(self) -> int:
+        """Number of programs in this shard."""
+        shard, num_shards = self.get_shard()
+        return len(self.programs[shard::num_shards])
+
+    def __iter__(self) -> Iterator[Sample]:
+        shard, num_shards = self.get_shard()
+        for i, p, fuzz_out in self.programs[shard::num_shards]:
+            for name, input, stdout, input_csv in read_fuzz_out(fuzz_out):
+                trace = None
+                if self.decode and input_csv is not None:
+                    trace = decode_trace(input_csv)
+                yield Sample(i, p, name, input, stdout, trace)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read the replayed results of a workdir")
+    parser.add_argument("workdir", type=str)
+    parser.add_argument("--min-cvg", type=float, help="Minimum bitmap coverage in percent")
+    parser.add_argument("--min-run-time", type=int, help="Minimum fuzzing time in seconds")
+    parser.add_argument(
+        "--sufficiently-fuzzed",
+        action="store_true",
+        help="Only programs `ExprimentInfo.sufficiently_fuzzed` accepts",
+    )
+    parser.add_argument(
+        "--shard", type=str, help="Read only shard i of n, given as i/n", default="0/1"
+    )
+    parser.add_argument("--no-decode", action="store_true", help="Skip decoding the traces")
+    args = parser.parse_args()
+
+    shard, num_shards = map(int, args.shard.split("/"))
+    loader = ResultLoader(
+        args.workdir,
+        min_bitmap_cvg=args.min_cvg,
+        min_run_time=args.min_run_time,
+        sufficiently_fuzzed=args.sufficiently_fuzzed,
+        decode=not args.no_decode,
+        shard=shard,
+        num_shards=num_shards,
+    )
+    start = time.perf_counter()
+    num_samples = 0
+    num_bytes = 0
+    for sample in loader:
+        num_samples += 1
+        num_bytes += len(sample.input) + (len(sample.stdout) if sample.stdout else 0)
+    elapsed = time.perf_counter() - start
+    info(
+        f"Read {num_samples} samples of {len(loader)} programs, {num_bytes} bytes "
+        f"in {elapsed:.2f}s ({num_samples / max(elapsed, 1e-9):.2f} samples/sec)"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    main()
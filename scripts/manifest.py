@@ -0,0 +1,273 @@
+# Per workdir record of every program and how far it got through the pipeline.
+#
+# Stages select their work with indexed queries on <workdir>/manifest.db
+# instead of walking src/, build/ and fuzz/ with os.listdir and path.isfile.
+import os
+from os import path
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PREPROCESSED = 0
+BUILT = 1
+FUZZED = 2
+POSTPROCESSED = 3
+
+FUZZ_STATS = ["bitmap_cvg", "execs_per_sec", "run_time", "execs_done"]
+
+# the rule of `ExprimentInfo.sufficiently_fuzzed`, or stopped at a coverage
+# plateau or the end of its time by the fuzz supervisor
+SUFFICIENTLY_FUZZED = "(fuzz_completed OR bitmap_cvg > 50.0 OR run_time > 30)"
+
+Program = Tuple[str, str]
+
+
+class Manifest:
+    def __init__(self, workdir: str):
+        self.db_path = path.join(workdir, "manifest.db")
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        # the workdir may only be created by `download`
+        if self._db is None:
+            os.makedirs(path.dirname(self.db_path), exist_ok=True)
+            self._db = sqlite3.connect(self.db_path)
+            self._db.executescript(
+                """
+                PRAGMA journal_mode = WAL;
+                PRAGMA synchronous = NORMAL;
+                CREATE TABLE IF NOT EXISTS programs (
+                    problem TEXT NOT NULL,
+                    program TEXT NOT NULL,
+                    stage INTEGER NOT NULL,
+                    src TEXT NOT NULL,
+                    bin TEXT,
+                    fuzz_out TEXT,
+                    src_hash TEXT,
+                    duplicate_of TEXT,
+                    bitmap_cvg REAL,
+                    execs_per_sec REAL,
+                    run_time INTEGER,
+                    execs_done INTEGER,
+                    fuzz_completed INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (problem, program)
+                );
+                CREATE INDEX IF NOT EXISTS programs_stage ON programs (problem, stage);
+                CREATE TEMP TABLE selected (problem TEXT PRIMARY KEY);
+                """
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(programs)")]
+            # manifests from before fuzz_completed
+            if "fuzz_completed" not in columns:
+                self._db.execute(
+                    "ALTER TABLE programs ADD COLUMN fuzz_completed INTEGER NOT NULL DEFAULT 0"
+                )
+                self._db.commit()
+        return self._db
+
+    def clear(self):
+        self.db.execute("DELETE FROM programs")
+        self.db.commit()
+
+    def select_problems(self, problems: Iterable):
+        """Restrict all following queries to `problems`."""
+        self.db.execute("DELETE FROM selected")
+        self.db.executemany(
+            "INSERT OR IGNORE INTO selected VALUES (?)", [(str(i),) for i in problems]
+        )
+
+    def get_unrecorded_problems(self) -> List[str]:
+        """Selected problems without any program in the manifest."""
+        rows = self.db.execute(
+            "SELECT problem FROM selected WHERE NOT EXISTS "
+            "(SELECT 1 FROM programs WHERE programs.problem = selected.problem)"
+        )
+        return [problem for (problem,) in rows.fetchall()]
+
+    def add_programs(self, rows: Iterable[Tuple[str, str, str, Optional[str], Optional[str]]]):
+        """
+        Record (problem, program, src, src_hash, duplicate_of) as preprocessed,
+        programs that are already recorded keep their stage unless their hash
+        or the representative whose artifacts they share changed.
+        """
+        unchanged = (
+            "(src_hash IS NULL OR src_hash IS excluded.src_hash)"
+            " AND duplicate_of IS excluded.duplicate_of"
+        )
+        self.db.executemany(
+            f"""
+            INSERT INTO programs (problem, program, stage, src, src_hash, duplicate_of)
+            VALUES (?, ?, 0, ?, ?, ?)
+            ON CONFLICT (problem, program) DO UPDATE SET
+                stage = CASE WHEN {unchanged} THEN stage ELSE 0 END,
+                fuzz_completed = CASE WHEN {unchanged} THEN fuzz_completed ELSE 0 END,
+                src = excluded.src,
+                src_hash = excluded.src_hash,
+                duplicate_of = excluded.duplicate_of
+            """,
+            rows,
+        )
+        self.db.commit()
+
+    def forget_hashes(self):
+        """Forget the source hashes, e.g. after the way they are computed changed."""
+        self.db.execute("UPDATE programs SET src_hash = NULL")
+        self.db.commit()
+
+    def set_stage(
+        self,
+        stage: int,
+        rows: Iterable[Tuple[str, str, Optional[str]]],
+        only_forward: bool = False,
+    ):
+        """
+        Move (problem, program, artifact) to `stage`, the artifact is
+        the binary for `BUILT` and the fuzzer output dir for `FUZZED`.
+        With `only_forward` programs that got further keep their stage.
+        """
+        new_stage = "MAX(stage, ?)" if only_forward else "?"
+        column = {BUILT: "bin", FUZZED: "fuzz_out"}.get(stage)
+        if column is None:
+            self.db.executemany(
+                f"UPDATE programs SET stage = {new_stage} "
+                "WHERE problem = ? AND program = ?",
+                [(stage, i, p) for i, p, _ in rows],
+            )
+        else:
+            self.db.executemany(
+                f"UPDATE programs SET stage = {new_stage}, {column} = ? "
+                "WHERE problem = ? AND program = ?",
+                [(stage, artifact, i, p) for i, p, artifact in rows],
+            )
+        self.db.commit()
+
+    def reset_stage(self, stage: int, programs: Iterable[Program]):
+        """Move `programs` back to the stage before `stage` if they got further."""
+        self.db.executemany(
+            "UPDATE programs SET stage = ? WHERE problem = ? AND program = ? AND stage >= ?",
+            [(stage - 1, i, p, stage) for i, p in programs],
+        )
+        self.db.commit()
+
+    def set_fuzz_stats(self, rows: Iterable[Tuple[str, str, Dict[str, float]]]):
+        self.db.executemany(
+            "UPDATE programs SET "
+            + ", ".join(f"{s} = ?" for s in FUZZ_STATS)
+            + " WHERE problem = ? AND program = ?",
+            [(*[stats.get(s) for s in FUZZ_STATS], i, p) for i, p, stats in rows],
+        )
+        self.db.commit()
+
+    def set_fuzz_completed(self, rows: Iterable[Tuple[str, str, bool]]):
+        """Record whether the last fuzzing of (problem, program) ran to its end."""
+        self.db.executemany(
+            "UPDATE programs SET fuzz_completed = ? WHERE problem = ? AND program = ?",
+            [(int(completed), i, p) for i, p, completed in rows],
+        )
+        self.db.commit()
+
+    def propagate_to_duplicates(self):
+        """Duplicates share the artifacts of their representative, so do they the stage."""
+        self.db.execute(
+            """
+            UPDATE programs AS d SET
+                stage = r.stage,
+                bitmap_cvg = r.bitmap_cvg,
+                execs_per_sec = r.execs_per_sec,
+                run_time = r.run_time,
+                execs_done = r.execs_done,
+                fuzz_completed = r.fuzz_completed
+            FROM programs AS r
+            WHERE d.duplicate_of = r.problem || '/' || r.program
+            """
+        )
+        self.db.commit()
+
+    def get_stage(self, i, p) -> Optional[int]:
+        row = self.db.execute(
+            "SELECT stage FROM programs WHERE problem = ? AND program = ?", (str(i), p)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def is_sufficiently_fuzzed(self, i, p) -> bool:
+        row = self.db.execute(
+            f"SELECT {SUFFICIENTLY_FUZZED} FROM programs WHERE problem = ? AND program = ?",
+            (str(i), p),
+        ).fetchone()
+        return row is not None and bool(row[0])
+
+    def get_programs(
+        self,
+        min_stage: int = PREPROCESSED,
+        max_stage: int = POSTPROCESSED,
+        with_duplicates: bool = True,
+        unless_sufficiently_fuzzed: bool = False,
+    ) -> List[Program]:
+        """(problem, program) of the selected problems within the stage range."""
+        query = (
+            "SELECT problem, program FROM programs JOIN selected USING (problem) "
+            "WHERE stage BETWEEN ? AND ?"
+        )
+        if not with_duplicates:
+            query += " AND duplicate_of IS NULL"
+        if unless_sufficiently_fuzzed:
+            query += f" AND (bitmap_cvg IS NULL OR NOT {SUFFICIENTLY_FUZZED})"
+        query += " ORDER BY problem, program"
+        return self.db.execute(query, (min_stage, max_stage)).fetchall()
+
+    def get_fuzz_outs(
+        self,
+        min_stage: int = POSTPROCESSED,
+        min_bitmap_cvg: Optional[float] = None,
+        min_run_time: Optional[int] = None,
+        sufficiently_fuzzed: bool = False,
+        with_duplicates: bool = False,
+        only_selected: bool = False,
+    ) -> List[Tuple[str, str, str]]:
+        """
+        (problem, program, fuzz_out) of the programs at `min_stage` or further
+        whose fuzz stats pass the given thresholds, duplicates come with the
+        fuzz_out of their representative.
+        """
+        duplicate_of = "programs.duplicate_of"
+        representative = (
+            "(SELECT r.fuzz_out FROM programs AS r WHERE "
+            f"r.problem = substr({duplicate_of}, 1, instr({duplicate_of}, '/') - 1) AND "
+            f"r.program = substr({duplicate_of}, instr({duplicate_of}, '/') + 1))"
+        )
+        fuzz_out = f"COALESCE(fuzz_out, {representative})"
+        query = f"SELECT problem, program, {fuzz_out} FROM programs "
+        if only_selected:
+            query += "JOIN selected USING (problem) "
+        query += f"WHERE stage >= ? AND {fuzz_out} IS NOT NULL"
+        params: List = [min_stage]
+        if min_bitmap_cvg is not None:
+            query += " AND bitmap_cvg >= ?"
+            params.append(min_bitmap_cvg)
+        if min_run_time is not None:
+            query += " AND run_time >= ?"
+            params.append(min_run_time)
+        if sufficiently_fuzzed:
+            query += f" AND {SUFFICIENTLY_FUZZED}"
+        if not with_duplicates:
+            query += " AND duplicate_of IS NULL"
+        query += " ORDER BY problem, program"
+        return self.db.execute(query, params).fetchall()
+
+    def summary(self) -> Dict[str, int]:
+        (num_programs, num_built, num_fuzzed, num_above_40) = self.db.execute(
+            """
+            SELECT
+                COUNT(*),
+                COALESCE(SUM(stage >= 1), 0),
+                COALESCE(SUM(bitmap_cvg IS NOT NULL), 0),
+                COALESCE(SUM(bitmap_cvg > 40), 0)
+            FROM programs JOIN selected USING (problem)
+            """
+        ).fetchone()
+        return {
+            "programs": num_programs,
+            "built": num_built,
+            "fuzzed": num_fuzzed,
+            "above_40": num_above_40,
+        }
@@ -0,0 +1,242 @@
+# Packed replay results of one program.
+#
+# Instead of `output/<id>` and `input_csv/<id>.csv` per queue entry, all
+# (input, input_csv, output) of a program go into <fuzz_out>/results.pack:
+#
+#   magic | record ... | index | index offset, index length, magic
+#
+# Records are stored as is or each zstd compressed, the JSON index maps each
+# queue entry to the (offset, length, raw length) of its records, so a reader
+# can mmap the pack and get any record without reading the others.
+# Usage: python3 scripts/pack.py [--zstd] [--keep] [-j N] <workdir or fuzz_out>...
+import argparse
+import json
+import logging
+from logging import info
+import mmap
+import os
+from os import path
+import shutil
+import struct
+from functools import partial
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"FEPACK\x00\x01"
+FOOTER = struct.Struct("<QQ8s")
+KINDS = ["input", "input_csv", "output"]
+PACK_NAME = "results.pack"
+
+# (offset, length, raw length) of a record, None if there is none
+Record = Optional[Tuple[int, int, int]]
+
+
+def get_pack_path(fuzz_out: str) -> str:
+    return path.join(fuzz_out, PACK_NAME)
+
+
+class PackWriter:
+    """Write a pack, it only appears at `pack_path` once closed."""
+
+    def __init__(self, pack_path: str, compress: bool = False, level: int = 3):
+        if compress and zstandard is None:
+            raise RuntimeError("zstandard is not installed, cannot compress the pack")
+        self.pack_path = pack_path
+        self.tmp_path = f"{pack_path}.{os.getpid()}.tmp"
+        self.file = open(self.tmp_path, "wb")
+        self.file.write(MAGIC)
+        self.compressor = zstandard.ZstdCompressor(level=level) if compress else None
+        self.entries: Dict[str, List[Record]] = {}
+
+    def add(self, name: str, kind: str, data: Optional[bytes]):
+        records = self.entries.setdefault(name, [None] * len(KINDS))
+        if data is None:
+            return
+        stored = data if self.compressor is None else self.compressor.compress(data)
+        records[KINDS.index(kind)] = (self.file.tell(), len(stored), len(data))
+        self.file.write(stored)
+
+    def close(self):
+        index = json.dumps(
+            {
+                "compression": None if self.compressor is None else "zstd",
+                "kinds": KINDS,
+                "entries": self.entries,
+            },
+            separators=(",", ":"),
+        ).encode()
+        index_offset = self.file.tell()
+        self.file.write(index)
+        self.file.write(FOOTER.pack(index_offset, len(index), MAGIC))
+        self.file.close()
+        os.replace(self.tmp_path, self.pack_path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class PackReader:
+    """
+    Memory mapped reader of a pack, records of uncompressed packs are
+    returned as `memoryview`s into the mapping instead of copies.
+    """
+
+    def __init__(self, pack_path: str):
+        with open(pack_path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        if len(self.mm) < len(MAGIC) + FOOTER.size or self.mm[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{pack_path} is not a pack")
+        index_offset, index_length, magic = FOOTER.unpack_from(
+            self.mm, len(self.mm) - FOOTER.size
+        )
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{pack_path} is truncated")
+        index = json.loads(self.mm[index_offset : index_offset + index_length])
+        self.kinds: List[str] = index["kinds"]
+        self.entries: Dict[str, List[Record]] = index["entries"]
+        self.decompressor = None
+        if index["compression"] == "zstd":
+            if zstandard is None:
+                self.close()
+                raise RuntimeError(f"zstandard is not installed, cannot read {pack_path}")
+            self.decompressor = zstandard.ZstdDecompressor()
+
+    def names(self) -> List[str]:
+        return list(self.entries.keys())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def has(self, name: str, kind: str) -> bool:
+        return self.entries[name][self.kinds.index(kind)] is not None
+
+    def get(self, name: str, kind: str) -> Optional[Union[memoryview, bytes]]:
+        record = self.entries[name][self.kinds.index(kind)]
+        if record is None:
+            return None
+        offset, length, raw_length = record
+        data = self.view[offset : offset + length]
+        if self.decompressor is None:
+            return data
+        return self.decompressor.decompress(data, max_output_size=raw_length)
+
+    def get_triple(self, name: str) -> Tuple[Optional[Union[memoryview, bytes]], ...]:
+        """(input, input_csv, output) of queue entry `name`"""
+        return tuple(self.get(name, kind) for kind in KINDS)
+
+    def items(self) -> Iterator[Tuple[str, Tuple[Optional[Union[memoryview, bytes]], ...]]]:
+        for name in self.entries:
+            yield name, self.get_triple(name)
+
+    def close(self):
+        self.view.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            # records are still referenced, the mapping goes away with the last of them
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def read_file(file_path: str) -> Optional[bytes]:
+    try:
+        with open(file_path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def pack_fuzz_out(fuzz_out: str, compress: bool = False, remove: bool = True) -> int:
+    """
+    Pack `output/` and `input_csv/` of `fuzz_out` with the queue entries
+    they belong to, and remove both directories unless `remove` is False.
+    Returns the number of packed queue entries.
+    """
+    queue_dir = path.join(fuzz_out, "queue")
+    output_dir = path.join(fuzz_out, "output")
+    input_csv_dir = path.join(fuzz_out, "input_csv")
+    if not path.isdir(output_dir) and not path.isdir(input_csv_dir):
+        return 0
+    names = sorted(
+        q for q in os.listdir(queue_dir) if not path.isdir(path.join(queue_dir, q))
+    )
+    with PackWriter(get_pack_path(fuzz_out), compress=compress) as pack:
+        for q in names:
+            pack.add(q, "input", read_file(path.join(queue_dir, q)))
+            pack.add(q, "input_csv", read_file(path.join(input_csv_dir, q + ".csv")))
+            pack.add(q, "output", read_file(path.join(output_dir, q)))
+    if remove:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        shutil.rmtree(input_csv_dir, ignore_errors=True)
+    return len(names)
+
+
+def find_fuzz_outs(root: str) -> List[str]:
+    """AFL output dirs, i.e. those with a queue/, under `root`."""
+    fuzz_outs = []
+    for dirpath, dirnames, _ in os.walk(root):
+        if "queue" in dirnames:
+            fuzz_outs.append(dirpath)
+            dirnames.clear()
+    return sorted(fuzz_outs)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pack output/ and input_csv/ of replayed AFL queues"
+    )
+    parser.add_argument(
+        "dirs", nargs="+", type=str, help="Workdirs, fuzz/ dirs or AFL output dirs"
+    )
+    parser.add_argument("--zstd", action="store_true", help="Compress each record")
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep output/ and input_csv/ after packing"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="Number of processes", default=os.cpu_count()
+    )
+    args = parser.parse_args()
+
+    fuzz_outs = []
+    for d in args.dirs:
+        fuzz = path.join(d, "fuzz")
+        fuzz_outs += find_fuzz_outs(fuzz if path.isdir(fuzz) else d)
+    # duplicates share their representative's outputs through a symlink
+    fuzz_outs = sorted(set(map(path.realpath, fuzz_outs)))
+    info(f"Packing {len(fuzz_outs)} AFL output dirs")
+    with Pool(args.jobs) as pool:
+        packed = pool.map(
+            partial(pack_fuzz_out, compress=args.zstd, remove=not args.keep),
+            fuzz_outs,
+            chunksize=16,
+        )
+    info(f"Packed {sum(packed)} queue entries of {sum(n > 0 for n in packed)} programs")
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    main()
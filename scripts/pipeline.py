@@ -0,0 +1,122 @@
+# Move items through a chain of subprocess stages independently of each other.
+#
+# An item enters its next stage as soon as its current one is done, so the
+# first items are fuzzed while the rest is still being preprocessed and
+# compiled. Every stage has its own concurrency limit and all of them share
+# one budget of cores, later stages get free cores first.
+from common import *
+from collections import deque
+from typing import Deque, Iterator, TypeVar
+
+_Item = TypeVar("_Item")
+
+
+class Stage(Generic[_Item]):
+    """
+    `start` launches the subprocess of an item in this stage,
+    `finish` collects its result and returns the name of the next stage,
+    or None if the item is done. At most `limit` items run this stage at once.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        start: Callable[[_Item], subprocess.Popen],
+        finish: Callable[[_Item, subprocess.Popen], Optional[str]],
+        limit: int,
+    ):
+        self.name = name
+        self.start = start
+        self.finish = finish
+        self.limit = max(limit, 1)
+        self.queue: Deque[_Item] = deque()
+        self.running = 0
+        self.finished = 0
+
+
+class StreamPipeline(Generic[_Item]):
+    def __init__(self, stages: List[Stage], budget: int, report_interval: float = 60.0):
+        self.stages = stages
+        self.stages_by_name = {s.name: s for s in stages}
+        self.budget = max(budget, 1)
+        self.report_interval = report_interval
+        self.reaper: ChildReaper[Tuple[Stage, _Item]] = ChildReaper()
+        self.started_at = time.monotonic()
+        # called every `poll_interval` seconds while items are running
+        self.poll: Optional[Callable[[], None]] = None
+        self.poll_interval = report_interval
+
+    def submit(self, stage_name: str, item: _Item):
+        """Queue `item` for a stage, e.g. from the `finish` of another item."""
+        self.stages_by_name[stage_name].queue.append(item)
+
+    def queued(self) -> int:
+        return sum(len(s.queue) for s in self.stages)
+
+    def start_ready(self):
+        for stage in reversed(self.stages):
+            while (
+                stage.queue
+                and stage.running < stage.limit
+                and len(self.reaper) < self.budget
+            ):
+                item = stage.queue.popleft()
+                self.reaper.add(stage.start(item), (stage, item))
+                stage.running += 1
+
+    def collect(self, exited: List[Tuple[subprocess.Popen, Tuple[Stage, _Item]]]):
+        for p, (stage, item) in exited:
+            stage.running -= 1
+            stage.finished += 1
+            if stage.finished == 1:
+                info(
+                    f"First {stage.name} finished "
+                    f"{time.monotonic() - self.started_at:.0f}s after start"
+                )
+            next_stage = stage.finish(item, p)
+            if next_stage is not None:
+                self.submit(next_stage, item)
+
+    def report(self):
+        info(
+            f"{time.monotonic() - self.started_at:.0f}s: "
+            + ", ".join(
+                f"{s.name} {s.running} running/{len(s.queue)} queued/{s.finished} done"
+                for s in self.stages
+            )
+        )
+
+    def run(self, source: Iterator[Tuple[str, _Item]]) -> Dict[str, int]:
+        """
+        Run the items `source` yields with the name of their first stage,
+        `source` is only advanced while there are free cores to keep busy.
+        Returns how many items finished each stage.
+        """
+        next_report = time.monotonic() + self.report_interval
+        next_poll = time.monotonic() + self.poll_interval
+        exhausted = False
+        try:
+            while True:
+                self.start_ready()
+                if not exhausted and self.queued() < self.budget:
+                    try:
+                        name, item = next(source)
+                        self.submit(name, item)
+                    except StopIteration:
+                        exhausted = True
+                    self.collect(self.reaper.wait(timeout=0))
+                elif len(self.reaper) > 0:
+                    timeout = min(next_report, next_poll) - time.monotonic()
+                    self.collect(self.reaper.wait(timeout=max(timeout, 0)))
+                elif exhausted and self.queued() == 0:
+                    break
+                if self.poll is not None and time.monotonic() >= next_poll:
+                    self.poll()
+                    next_poll = time.monotonic() + self.poll_interval
+                if time.monotonic() >= next_report:
+                    self.report()
+                    next_report = time.monotonic() + self.report_interval
+        finally:
+            self.reaper.close()
+        self.report()
+        return {s.name: s.finished for s in self.stages}
@@ -0,0 +1,137 @@
+# Persistent-mode AFL harness for Python800 programs.
+#
+# The program is compiled to a `.pyc` at build time and run by this harness as
+#
+#     py-afl-fuzz ... -- python3 py_harness.py <program.pyc>
+#
+# Each `afl.loop` iteration executes the program's code object in a fresh
+# namespace with a fresh `sys.stdin`, so one interpreter serves many inputs
+# while every run still starts from a clean module scope. `replay.py --python`
+# forks each run from a warmed interpreter with the same helpers.
+import builtins
+import dis
+import importlib
+import importlib.util
+import io
+import marshal
+import os
+import struct
+import sys
+import traceback
+from types import CodeType
+from typing import Optional, Tuple
+
+# inputs per interpreter before AFL forks a new one
+PERSISTENT_ITERATIONS = 1000
+# what `preprocess_one` used to wrap the programs in
+LEGACY_HEADER = "import afl\nafl.init()\nimport os\n"
+LEGACY_FOOTER = "\nos._exit(0)\n"
+
+
+def strip_legacy_harness(code: str) -> str:
+    """
+    Remove the per-file `afl.init()` wrapper of sources preprocessed before,
+    keeping the line numbers of the program.
+    """
+    if code.startswith(LEGACY_HEADER) and code.endswith(LEGACY_FOOTER):
+        return "\n" * LEGACY_HEADER.count("\n") + code[len(LEGACY_HEADER) : -len(LEGACY_FOOTER)]
+    return code
+
+
+def compile_program(p: Tuple[str, str]) -> Optional[str]:
+    """
+    Compile `(src_path, pyc_path)` into a timestamp-based `.pyc` (PEP 552).
+    Returns the error if the source doesn't compile, for Pool workers.
+    """
+    src_path, pyc_path = p
+    try:
+        with open(src_path, "r", errors="replace") as f:
+            source = strip_legacy_harness(f.read())
+        code = compile(source, src_path, "exec", dont_inherit=True)
+    except (SyntaxError, ValueError, OSError) as e:
+        return f"{src_path}: {e}"
+    stat = os.stat(src_path)
+    header = importlib.util.MAGIC_NUMBER + struct.pack(
+        "<III", 0, int(stat.st_mtime) & 0xFFFFFFFF, stat.st_size & 0xFFFFFFFF
+    )
+    os.makedirs(os.path.dirname(pyc_path), exist_ok=True)
+    tmp_path = f"{pyc_path}.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(header + marshal.dumps(code))
+    os.replace(tmp_path, pyc_path)
+    return None
+
+
+def load_code(pyc_path: str) -> CodeType:
+    with open(pyc_path, "rb") as f:
+        # magic, flags and the source's mtime and size
+        f.read(16)
+        return marshal.load(f)
+
+
+def warm_up(code: CodeType):
+    """Import the modules `code` imports at its top level ahead of the runs."""
+    for instruction in dis.get_instructions(code):
+        if instruction.opname == "IMPORT_NAME":
+            try:
+                importlib.import_module(instruction.argval)
+            except Exception:
+                pass
+
+
+def reopen_stdio():
+    """Fresh `sys.stdin/stdout/stderr` over fds 0, 1 and 2, nothing buffered from before."""
+    sys.stdin = io.TextIOWrapper(
+        io.BufferedReader(io.FileIO(0, "r", closefd=False)), errors="replace"
+    )
+    sys.stdout = io.TextIOWrapper(io.BufferedWriter(io.FileIO(1, "w", closefd=False)))
+    sys.stderr = io.TextIOWrapper(
+        io.BufferedWriter(io.FileIO(2, "w", closefd=False)), errors="backslashreplace"
+    )
+
+
+def run_code(code: CodeType) -> int:
+    """Run `code` as `__main__` in a fresh namespace, returns its exit status."""
+    namespace = {"__name__": "__main__", "__builtins__": builtins}
+    status = 0
+    try:
+        exec(code, namespace)
+    except SystemExit as e:
+        if e.code is None:
+            status = 0
+        elif isinstance(e.code, int):
+            status = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            status = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return status
+
+
+def print_program_exception(code: CodeType, e: BaseException):
+    """Print the traceback of `e` from the frames of the program on, like python3 would."""
+    tb = e.__traceback__
+    while tb is not None and tb.tb_frame.f_code.co_filename != code.co_filename:
+        tb = tb.tb_next
+    traceback.print_exception(type(e), e, tb or e.__traceback__)
+
+
+def main():
+    import afl
+
+    code = load_code(sys.argv[1])
+    warm_up(code)
+    sys.argv = sys.argv[1:]
+    while afl.loop(PERSISTENT_ITERATIONS):
+        # AFL rewrites the input in place and rewinds it
+        os.lseek(0, 0, os.SEEK_SET)
+        reopen_stdio()
+        # exceptions propagate, so AFL sees them as crashes
+        run_code(code)
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+# Replay every input in an AFL queue through one program.
+#
+# One long-lived driver process per program spawns the target directly for each
+# queue entry (no `bash -c timeout ...` wrapper), enforces the timeout itself and
+# writes the same `output/` and `input_csv/` files `run_one_file` used to,
+# or with `--pack` a single `results.pack` (see pack.py) instead.
+# With `--jvm` a Java class is run by one JavaReplay JVM (see JavaReplay.java)
+# for all inputs instead of a new JVM per input, with `--python` a Python
+# program is loaded once and each input runs in a fork of this driver.
+#
+# Usage: python3 replay.py [-t 1m] [--pack raw|zstd] [--jvm <driver dir> | --python]
+#                          <fuzz_out>/default -- <cmd...>
+# The names of timed out inputs are printed to stdout, one per line.
+import argparse
+import os
+from os import path
+import select
+import signal
+import subprocess
+import sys
+import time
+from types import CodeType
+from typing import Callable, List, Optional
+from pack import PackWriter, get_pack_path, read_file
+from py_harness import (
+    load_code,
+    print_program_exception,
+    reopen_stdio,
+    run_code,
+    strip_legacy_harness,
+    warm_up,
+)
+
+SECONDS_PER_UNIT = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+# built by dataset.py, which requires EMBDING_HOME
+JVM_DRIVER_SRC = path.join(os.getenv("EMBDING_HOME", "."), "JavaReplay.java")
+# seconds a JVM gets to start, and to answer on top of the timeout of a run
+JVM_GRACE = 60
+
+
+def parse_timeout(s: str) -> float:
+    """parse a duration in the format of coreutils `timeout`, e.g. 30, 30s, 1m"""
+    if s[-1] in SECONDS_PER_UNIT:
+        return float(s[:-1]) * SECONDS_PER_UNIT[s[-1]]
+    return float(s)
+
+
+def wait_with_timeout(pid: int, timeout: float) -> Optional[int]:
+    """
+    Wait for `pid` to exit and return its wait status.
+    Returns None if it is still running after `timeout` seconds.
+    """
+    if hasattr(os, "pidfd_open"):
+        try:
+            fd = os.pidfd_open(pid)
+        except OSError:
+            fd = -1
+        if fd >= 0:
+            try:
+                poller = select.poll()
+                poller.register(fd, select.POLLIN)
+                if not poller.poll(timeout * 1000):
+                    return None
+            finally:
+                os.close(fd)
+            return os.waitpid(pid, 0)[1]
+
+    deadline = time.monotonic() + timeout
+    delay = 0.0001
+    while True:
+        waited, status = os.waitpid(pid, os.WNOHANG)
+        if waited == pid:
+            return status
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.01)
+
+
+def spawn(cmd: List[str], fin: int, fout: int, ferr: int) -> int:
+    return os.posix_spawnp(
+        cmd[0],
+        cmd,
+        os.environ,
+        file_actions=[
+            (os.POSIX_SPAWN_DUP2, fin, 0),
+            (os.POSIX_SPAWN_DUP2, fout, 1),
+            (os.POSIX_SPAWN_DUP2, ferr, 2),
+        ],
+    )
+
+
+def fork_python(code: CodeType, fin: int, fout: int, ferr: int) -> int:
+    """Run `code` in a fork of this interpreter, which has its imports loaded already."""
+    pid = os.fork()
+    if pid != 0:
+        return pid
+    status = 1
+    try:
+        os.dup2(fin, 0)
+        os.dup2(fout, 1)
+        os.dup2(ferr, 2)
+        reopen_stdio()
+        status = run_code(code)
+    except BaseException as e:
+        print_program_exception(code, e)
+        sys.stderr.flush()
+    finally:
+        os._exit(status & 0xFF)
+
+
+def load_python(bin_path: str) -> CodeType:
+    """The code of a `.pyc`, or of a source preprocessed before there were `.pyc`."""
+    if bin_path.endswith(".pyc"):
+        return load_code(bin_path)
+    with open(bin_path, "r", errors="replace") as f:
+        return compile(strip_legacy_harness(f.read()), bin_path, "exec", dont_inherit=True)
+
+
+def kill_and_reap(pid: int):
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    os.waitpid(pid, 0)
+
+
+def run_one_input(
+    launch: Callable[[int, int, int], int],
+    fuzz_in: str,
+    output: str,
+    input_csv: str,
+    timeout: float,
+) -> bool:
+    """
+    Run one input through the program launched by `launch(stdin, stdout, stderr)`.
+    Returns False and removes `output` if the run timed out.
+    """
+    fin = os.open(fuzz_in, os.O_RDONLY)
+    fout = os.open(output, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    ferr = os.open(input_csv, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        pid = launch(fin, fout, ferr)
+    finally:
+        os.close(fin)
+        os.close(fout)
+        os.close(ferr)
+
+    if wait_with_timeout(pid, timeout) is None:
+        kill_and_reap(pid)
+        os.remove(output)
+        return False
+    return True
+
+
+def build_jvm_driver(build_dir: str) -> str:
+    """Compile JavaReplay.java into `build_dir` unless it is up to date."""
+    class_path = path.join(build_dir, "JavaReplay.class")
+    if not path.isfile(class_path) or path.getmtime(class_path) < path.getmtime(JVM_DRIVER_SRC):
+        os.makedirs(build_dir, exist_ok=True)
+        subprocess.run(
+            ["javac", "-d", build_dir, JVM_DRIVER_SRC], check=True, stdout=subprocess.DEVNULL
+        )
+    return build_dir
+
+
+class JvmRunner:
+    """
+    Runs `class_name` of `class_dir` with one JavaReplay JVM,
+    which is started again if a run took it down.
+    """
+
+    def __init__(self, driver_dir: str, class_dir: str, class_name: str):
+        self.cmd = ["java", "-cp", driver_dir, "JavaReplay", class_dir, class_name]
+        self.process: Optional[subprocess.Popen] = None
+        self.start()
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0
+        )
+        if self.read_reply(JVM_GRACE) != "ready":
+            self.close()
+            raise RuntimeError(f"{' '.join(self.cmd)} didn't start")
+
+    def read_reply(self, timeout: float) -> Optional[str]:
+        """The next line of the driver, None if there is none within `timeout`."""
+        deadline = time.monotonic() + timeout
+        reply = b""
+        fd = self.process.stdout.fileno()
+        while not reply.endswith(b"\n"):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                return None
+            chunk = os.read(fd, 64)
+            if not chunk:
+                return None
+            reply += chunk
+        return reply.decode().strip()
+
+    def run(self, fuzz_in: str, output: str, input_csv: str, timeout: float) -> bool:
+        """Like `run_one_input`, False and no `output` if the run timed out."""
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        # created here like `run_one_input` does, even if the driver dies
+        for f in [output, input_csv]:
+            open(f, "wb").close()
+        request = f"{int(timeout * 1000)}\t{fuzz_in}\t{output}\t{input_csv}\n"
+        try:
+            self.process.stdin.write(request.encode())
+            reply = self.read_reply(timeout + JVM_GRACE)
+        except BrokenPipeError:
+            reply = None
+        if reply is None:
+            # the driver died or hangs, the next run starts a new one
+            self.close()
+        if reply is None or reply == "timeout":
+            if path.exists(output):
+                os.remove(output)
+            return False
+        return True
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+
+def replay_queue(
+    fuzz_out: str,
+    run: Callable[[str, str, str], bool],
+    pack: Optional[str] = None,
+) -> List[str]:
+    """
+    Replay all inputs in `fuzz_out/queue` with `run(input, output, input_csv)`,
+    which returns False if the input timed out. With `pack` ("raw" or "zstd")
+    the results are packed instead of written to `output/` and `input_csv/`.
+    Returns the names of the inputs that timed out.
+    """
+    queue_dir = path.join(fuzz_out, "queue")
+    input_csv_dir = path.join(fuzz_out, "input_csv")
+    output_dir = path.join(fuzz_out, "output")
+    writer = None
+    if pack is None:
+        os.makedirs(input_csv_dir, exist_ok=True)
+        os.makedirs(output_dir, exist_ok=True)
+    else:
+        writer = PackWriter(get_pack_path(fuzz_out), compress=pack == "zstd")
+        # every input runs into the same scratch files, which are packed after it
+        output = path.join(fuzz_out, ".replay_output")
+        input_csv = path.join(fuzz_out, ".replay_input_csv")
+
+    timeouts = []
+    try:
+        for q in sorted(os.listdir(queue_dir)):
+            fuzz_input_path = path.join(queue_dir, q)
+            if path.isdir(fuzz_input_path):
+                continue
+            if writer is None:
+                output = path.join(output_dir, q)
+                input_csv = path.join(input_csv_dir, q + ".csv")
+            finished = run(fuzz_input_path, output, input_csv)
+            if not finished:
+                timeouts.append(q)
+            if writer is not None:
+                writer.add(q, "input", read_file(fuzz_input_path))
+                writer.add(q, "input_csv", read_file(input_csv))
+                writer.add(q, "output", read_file(output) if finished else None)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is not None:
+        writer.close()
+        for scratch in [output, input_csv]:
+            if path.exists(scratch):
+                os.remove(scratch)
+    return timeouts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay an AFL queue through one program"
+    )
+    parser.add_argument(
+        "-t", "--timeout", type=str, help="Time to run one input", default="1m"
+    )
+    parser.add_argument(
+        "--pack",
+        type=str,
+        choices=["raw", "zstd"],
+        help="Pack the results into results.pack, optionally zstd compressed",
+    )
+    parser.add_argument(
+        "--jvm",
+        type=str,
+        metavar="DRIVER_DIR",
+        help="Run `java -cp <dir> <class>` in one JVM with JavaReplay.class of DRIVER_DIR",
+    )
+    parser.add_argument(
+        "--python",
+        action="store_true",
+        help="Run `python3 <program>` in forks of this driver with the program loaded",
+    )
+    parser.add_argument("fuzz_out", type=str, help="AFL output dir with queue/")
+    parser.add_argument("cmd", nargs=argparse.REMAINDER, help="-- cmd to run")
+    args = parser.parse_args()
+
+    cmd = args.cmd[1:] if args.cmd[:1] == ["--"] else args.cmd
+    if len(cmd) == 0:
+        parser.error("no command to replay given")
+
+    if args.jvm is not None and (len(cmd) != 4 or cmd[:2] != ["java", "-cp"]):
+        parser.error("--jvm needs a `java -cp <dir> <class>` command")
+    if args.python and (len(cmd) != 2 or not cmd[0].startswith("python")):
+        parser.error("--python needs a `python3 <program>` command")
+
+    timeout = parse_timeout(args.timeout)
+    jvm = None
+    if args.jvm is not None:
+        try:
+            jvm = JvmRunner(args.jvm, cmd[2], cmd[3])
+        except (OSError, RuntimeError) as e:
+            # the class fails to load the same way in a JVM per input
+            print(f"{e}, falling back to a JVM per input", file=sys.stderr)
+    if jvm is not None:
+        run = lambda fin, fout, ferr: jvm.run(fin, fout, ferr, timeout)
+    else:
+        launch = lambda fin, fout, ferr: spawn(cmd, fin, fout, ferr)
+        if args.python:
+            code = load_python(cmd[1])
+            warm_up(code)
+            sys.argv = cmd[1:]
+            launch = lambda fin, fout, ferr: fork_python(code, fin, fout, ferr)
+        run = lambda fin, fout, ferr: run_one_input(launch, fin, fout, ferr, timeout)
+    try:
+        timeouts = replay_queue(args.fuzz_out, run, pack=args.pack)
+    finally:
+        if jvm is not None:
+            jvm.close()
+    for q in timeouts:
+        print(q)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# Stop AFL instances once their coverage stops growing.
+#
+# Every running instance's plot_data is polled, an instance whose coverage
+# didn't grow for `window` seconds is stopped with SIGINT, so AFL still
+# writes its final fuzzer_stats. The core time it didn't use goes to a shared
+# bank, instances that are still gaining coverage when their own time is up
+# draw from it to keep going. A global `budget` stops everything at a
+# wall-clock deadline. Instances stopped at a plateau or at the end of their
+# time are `completed`, the ones cut short by the budget or that never reported
+# any coverage aren't.
+from common import *
+import signal
+
+_Input = TypeVar("_Input")
+_Output = TypeVar("_Output")
+
+# seconds AFL gets to exit after SIGINT before it is killed
+STOP_GRACE = 10
+
+
+def read_coverage(
+    plot_data_path: str, column: Optional[int] = None
+) -> Tuple[Optional[int], Optional[str]]:
+    """
+    (coverage column, coverage) of the last row of `plot_data`, the column is
+    looked up in the header unless given. Coverage is None without any rows.
+    """
+    try:
+        with open(plot_data_path, "rb") as f:
+            if column is None:
+                header = f.readline().decode().lstrip("#").split(",")
+                columns = [c.strip() for c in header]
+                # edges_found is only in AFL++ 3.0+, map_size in all of them
+                column = columns.index(
+                    "edges_found" if "edges_found" in columns else "map_size"
+                )
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - 4096))
+            lines = f.read().decode(errors="replace").splitlines()
+    except (OSError, ValueError):
+        return column, None
+    for line in reversed(lines):
+        fields = line.split(",")
+        if not line.startswith("#") and len(fields) > column:
+            return column, fields[column].strip()
+    return column, None
+
+
+class Instance:
+    def __init__(self, process: subprocess.Popen, fuzz_out: str, allotted: float):
+        self.process = process
+        self.fuzz_out = fuzz_out
+        self.plot_data = path.join(fuzz_out, "default", "plot_data")
+        self.started = time.monotonic()
+        # the plateau window starts once AFL reports coverage, a slow target
+        # may take longer than the window to get through its seeds
+        self.last_growth: Optional[float] = None
+        self.allotted = allotted
+        self.column: Optional[int] = None
+        self.coverage: Optional[str] = None
+        self.stopped_at: Optional[float] = None
+
+
+class FuzzSupervisor:
+    """
+    Each instance is allotted `timeout` seconds, it is stopped earlier once
+    its coverage didn't grow for `window` seconds, and extended by `window`
+    at a time from the unused time of others while it is still growing,
+    up to `max_extension` times `timeout` in total.
+    """
+
+    def __init__(
+        self,
+        timeout: int,
+        window: Optional[int] = None,
+        budget: Optional[int] = None,
+        max_extension: float = 4.0,
+        poll_interval: float = 5.0,
+    ):
+        self.timeout = timeout
+        self.window = window
+        self.deadline = None if budget is None else time.monotonic() + budget
+        self.max_extension = max_extension if window is not None else 1.0
+        # AFL++ appends to plot_data every 5 seconds
+        self.poll_interval = poll_interval if window is None else min(poll_interval, window / 2)
+        self.instances: Dict[int, Instance] = {}
+        self.bank = 0.0
+        self.num_plateaued = 0
+        self.num_extended = 0
+        self.saved = 0.0
+        # fuzz_out of the instances that don't need to be fuzzed again
+        self.completed: Set[str] = set()
+
+    def get_time_limit(self) -> int:
+        """The `-V` to run AFL with, the supervisor stops it before that."""
+        return int(self.timeout * self.max_extension) + STOP_GRACE
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def add(self, process: subprocess.Popen, fuzz_out: str):
+        self.instances[process.pid] = Instance(process, fuzz_out, self.timeout)
+
+    def remove(self, process: subprocess.Popen):
+        instance = self.instances.pop(process.pid, None)
+        if instance is None:
+            return
+        unused = instance.allotted - (time.monotonic() - instance.started)
+        if unused > 0:
+            self.bank += unused
+            self.saved += unused
+
+    def stop(self, instance: Instance, completed: bool = False):
+        if completed:
+            self.completed.add(instance.fuzz_out)
+        if instance.stopped_at is None:
+            instance.stopped_at = time.monotonic()
+            instance.process.send_signal(signal.SIGINT)
+        elif time.monotonic() - instance.stopped_at > STOP_GRACE:
+            instance.process.kill()
+
+    def poll(self):
+        """Stop or extend the running instances, call every `poll_interval`."""
+        now = time.monotonic()
+        for instance in list(self.instances.values()):
+            if instance.process.poll() is not None:
+                continue
+            if instance.stopped_at is not None or self.expired():
+                self.stop(instance)
+                continue
+            if self.window is None:
+                if now - instance.started >= instance.allotted:
+                    self.stop(instance, completed=self.has_coverage(instance))
+                continue
+
+            instance.column, coverage = read_coverage(instance.plot_data, instance.column)
+            if coverage is not None and coverage != instance.coverage:
+                instance.coverage = coverage
+                instance.last_growth = now
+            if instance.last_growth is not None and now - instance.last_growth >= self.window:
+                self.num_plateaued += 1
+                self.stop(instance, completed=True)
+            elif now - instance.started >= instance.allotted:
+                limit = self.timeout * self.max_extension
+                if (
+                    instance.last_growth is not None
+                    and self.bank >= self.window
+                    and instance.allotted + self.window <= limit
+                ):
+                    if instance.allotted == self.timeout:
+                        self.num_extended += 1
+                    self.bank -= self.window
+                    instance.allotted += self.window
+                else:
+                    self.stop(instance, completed=instance.last_growth is not None)
+
+    def has_coverage(self, instance: Instance) -> bool:
+        instance.column, coverage = read_coverage(instance.plot_data, instance.column)
+        return coverage is not None
+
+    def run(
+        self,
+        iter: Iterable[_Input],
+        jobs: int,
+        subprocess_creator: Callable[[_Input], subprocess.Popen],
+        fuzz_out_of: Callable[[_Input], str],
+        on_exit: Optional[Callable[[subprocess.Popen], _Output]] = None,
+    ) -> Dict[_Input, _Output]:
+        """`parallel_subprocess` of AFL instances under supervision."""
+        ret = {}
+        reaper: ChildReaper[_Input] = ChildReaper()
+
+        def collect(exited: List[Tuple[subprocess.Popen, _Input]]):
+            for p, i in exited:
+                self.remove(p)
+                if on_exit is not None:
+                    ret[i] = on_exit(p)
+
+        next_poll = time.monotonic() + self.poll_interval
+
+        def wait():
+            nonlocal next_poll
+            collect(reaper.wait(timeout=max(next_poll - time.monotonic(), 0)))
+            if time.monotonic() >= next_poll:
+                self.poll()
+                next_poll = time.monotonic() + self.poll_interval
+
+        try:
+            for input in tqdm(iter):
+                if self.expired():
+                    info("Fuzzing budget used up, not starting the remaining programs")
+                    break
+                p = subprocess_creator(input)
+                reaper.add(p, input)
+                self.add(p, fuzz_out_of(input))
+                while len(reaper) >= max(jobs, 1):
+                    wait()
+            while len(reaper) > 0:
+                wait()
+        finally:
+            reaper.close()
+        info(self.summary())
+        return ret
+
+    def summary(self) -> str:
+        return (
+            f"{self.num_plateaued} instances stopped at a plateau, "
+            f"{self.num_extended} extended, {self.saved:.0f} core seconds freed, "
+            f"{self.bank:.0f} left unused"
+        )
@@ -0,0 +1,68 @@
+import sys
+
+sys.path.append(".")
+sys.path.append("scripts")
+import json
+import os
+from os import path
+import tempfile
+from scripts.dedup import HASH_VERSION, DuplicateIndex, normalize_c
+
+
+# whitespace and comments don't matter
+assert normalize_c("int  main() {\n  return 0; // done\n}\n") == normalize_c(
+    "int main()\n{ /* start */ return 0;\n}"
+)
+assert normalize_c("#include <cstdio>\nint a;") == "# include < cstdio >\nint a ;"
+
+# operators are single tokens, splitting them changes the program
+assert normalize_c("a+++b;") == "a ++ + b ;"
+assert normalize_c("a+++b;") != normalize_c("a + ++b;")
+assert normalize_c("x---y;") != normalize_c("x - --y;")
+assert normalize_c("a+=b;") != normalize_c("a+ =b;")
+assert normalize_c("a>>=1;") == "a >>= 1 ;"
+assert normalize_c("p->x && q != r || s <= t;") == "p -> x && q != r || s <= t ;"
+assert normalize_c("std::cout << x;") == "std :: cout << x ;"
+# strings are kept as they are
+assert normalize_c('puts("a  +  b");') != normalize_c('puts("a + b");')
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    sources = {
+        "a": "int main(){int a=1,b=2;return a+++b;}",
+        "b": "int main() {\n  int a = 1, b = 2;\n  return a++ + b; // same\n}",
+        "c": "int main(){int a=1,b=2;return a + ++b;}",
+        "d": "int main(){return sqrt(4);}",
+        "e": "int main() { return sqrt(4); }",
+    }
+    programs = []
+    for p, code in sources.items():
+        src = path.join(tmp, "src", "1", p + ".cpp")
+        os.makedirs(path.dirname(src), exist_ok=True)
+        with open(src, "w") as f:
+            f.write(code)
+        programs.append(("1", p, src))
+
+    # e is compiled without math.h
+    macros = lambda src: ["_NO_MATH_H_"] if src.endswith("e.cpp") else []
+    index = DuplicateIndex(path.join(tmp, "duplicates.json"))
+    hashes = index.build(programs, "C/C++", 2, macros)
+    assert index.representatives == {"1/b": "1/a"}
+    assert hashes["1/a"] == hashes["1/b"] != hashes["1/c"]
+    assert hashes["1/d"] != hashes["1/e"]
+    assert not index.outdated
+
+    # an index of older hashes is flagged, its groups are kept until indexed again
+    with open(path.join(tmp, "duplicates.json")) as f:
+        saved = json.load(f)
+    assert saved["hash_version"] == HASH_VERSION
+    saved["representatives"]["1/c"] = "1/a"
+    del saved["hash_version"]
+    with open(path.join(tmp, "duplicates.json"), "w") as f:
+        json.dump(saved, f)
+    index = DuplicateIndex(path.join(tmp, "duplicates.json"))
+    assert index.outdated
+    assert index.get_representative("1", "c") == "1/a"
+    index.build(programs, "C/C++", 2, macros)
+    assert not index.outdated
+    assert index.representatives == {"1/b": "1/a"}
@@ -0,0 +1,89 @@
+import sys
+
+sys.path.append(".")
+sys.path.append("scripts")
+import tempfile
+from os import path
+from scripts.compile_report import CompilerReport
+from scripts.diagnostics import (
+    DiagnosticStore,
+    classify_error,
+    classify_shard,
+    get_shards,
+    parse_diagnostics,
+    program_of,
+)
+
+stderr = """src/3/17.cpp:4:5: error: use of undeclared identifier 'x'
+    x = 1;
+    ^
+src/3/17.cpp:9:1: warning: control reaches end of non-void function [-Wreturn-type]
+}
+^
+1 warning and 1 error generated.
+"""
+assert program_of("/w/src/3/17.cpp") == ("3", "17")
+diagnostics, summary = parse_diagnostics(stderr)
+assert summary == "1 warning and 1 error generated."
+assert [(d.severity, d.line, d.column) for d in diagnostics] == [("error", 4, 5), ("warning", 9, 1)]
+assert diagnostics[0].text.split("\n")[1] == "    x = 1;"
+
+with tempfile.TemporaryDirectory() as tmp:
+    store = DiagnosticStore(tmp)
+    store.record(("3", "17"), stderr)
+    store.record(("3", "18"), "")
+    assert store.get_errors() == [(("3", "17"), "use of undeclared identifier 'x'")]
+    assert store.get_programs_with_errors() == [("3", "17")]
+    assert store.get_report_lines(("3", "17")) == ["3/17.cpp:"] + stderr.splitlines()
+    assert store.get_report_lines(("3", "18")) is None
+    # a later compile replaces the earlier diagnostics
+    store.record(("3", "17"), "")
+    assert list(store.reports()) == []
+
+# the first error is in a header, its include stack belongs to it
+header_first = """In file included from /w/src/3/19.cpp:1:
+/e/header.hpp:7:1: error: unknown type name 'foo'
+foo bar;
+^
+/w/src/3/19.cpp:12:3: error: redefinition of 'max'
+int max;
+    ^
+In file included from /w/src/3/19.cpp:1:
+/e/header.hpp:3:5: note: previous definition is here
+2 errors generated.
+"""
+diagnostics, summary = parse_diagnostics(header_first)
+assert [(d.line, d.message) for d in diagnostics] == [
+    (7, "unknown type name 'foo'"),
+    (12, "redefinition of 'max'"),
+]
+assert diagnostics[0].text.startswith("In file included from /w/src/3/19.cpp:1:\n/e/header.hpp")
+assert diagnostics[1].text.endswith("/e/header.hpp:3:5: note: previous definition is here")
+
+with tempfile.TemporaryDirectory() as tmp:
+    store = DiagnosticStore(tmp)
+    store.record(("3", "19"), header_first, "/w/src/3/19.cpp")
+    lines = store.get_report_lines(("3", "19"))
+    assert lines[0] == "/w/src/3/19.cpp:"
+    report = CompilerReport(lines)
+    assert (report.p, report.i) == (3, 19)
+    assert [r.get_loc() for r in report.error_list] == [(7, 1), (12, 3)]
+
+assert classify_error("non-void function 'main' should return a value") == "main_no_return_value"
+assert classify_error("non-void function 'f' should return a value") == "no_return_value"
+assert classify_error("'main' must return 'int'") == "main_returned_non_int"
+assert classify_error("odd 'x' at 3") == "unmatched: odd _ at _"
+
+# the shards of a dump classify the same errors as the whole of it
+with tempfile.TemporaryDirectory() as tmp:
+    errfile = path.join(tmp, "O")
+    with open(errfile, "w") as f:
+        f.write(stderr.replace("3/17", "3/18") + stderr)
+    whole = classify_shard((errfile, 0, path.getsize(errfile)))
+    assert whole.counts == {"undeclared_identifier": 2}
+    assert whole.programs == {"undeclared_identifier": {"3/17", "3/18"}}
+    for num_shards in range(1, 20):
+        total = 0
+        for shard in get_shards(errfile, num_shards):
+            total += classify_shard(shard).total()
+        assert total == 2
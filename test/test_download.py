@@ -0,0 +1,119 @@
+import sys
+
+sys.path.append(".")
+import hashlib
+import io
+import os
+from os import path
+import tarfile
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from scripts.download import download, download_and_extract
+
+
+def make_tarball() -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        for problem in ["p00002", "p00000", "p00001"]:
+            for program in ["s0.cpp", "s1.cpp"]:
+                data = os.urandom(4096) + f"{problem}/{program}".encode()
+                info = tarfile.TarInfo(f"Project_CodeNet_C++1000/{problem}/{program}")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+TARBALL = make_tarball()
+SHA256 = hashlib.sha256(TARBALL).hexdigest()
+requests_seen = []
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves TARBALL, honoring `Range: bytes=N-`."""
+
+    def do_GET(self):
+        requests_seen.append(self.headers.get("Range"))
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+        if start >= len(TARBALL):
+            self.send_response(416)
+            self.end_headers()
+            return
+        self.send_response(206 if start > 0 else 200)
+        self.send_header("Content-Length", str(len(TARBALL) - start))
+        self.end_headers()
+        self.wfile.write(TARBALL[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = f"http://127.0.0.1:{server.server_address[1]}/data.tar.gz"
+
+with tempfile.TemporaryDirectory() as tmp:
+    # resume a partial download with a Range request
+    tar_path = path.join(tmp, "data.tar.gz")
+    with open(tar_path + ".part", "wb") as f:
+        f.write(TARBALL[:1000])
+    download(url, tar_path, sha256=SHA256)
+    assert requests_seen[-1] == "bytes=1000-"
+    with open(tar_path, "rb") as f:
+        assert f.read() == TARBALL
+    assert not path.exists(tar_path + ".part")
+
+    # a mismatching checksum removes the download
+    bad_path = path.join(tmp, "bad.tar.gz")
+    try:
+        download(url, bad_path, sha256="0" * 64)
+        assert False
+    except ValueError:
+        pass
+    assert not path.exists(bad_path) and not path.exists(bad_path + ".part")
+
+    # only the selected problems are extracted, in the order of the archive
+    for follow in [False, True]:
+        out = path.join(tmp, f"out-{follow}")
+        extracted = download_and_extract(
+            url,
+            path.join(tmp, f"follow-{follow}.tar.gz"),
+            out,
+            sha256=SHA256,
+            problems={0, 2},
+            follow=follow,
+        )
+        assert extracted == ["p00002", "p00001"]
+        assert sorted(os.listdir(path.join(out, "Project_CodeNet_C++1000"))) == [
+            "p00001",
+            "p00002",
+        ]
+        with open(path.join(out, "Project_CodeNet_C++1000", "p00001", "s1.cpp"), "rb") as f:
+            assert f.read().endswith(b"p00001/s1.cpp")
+
+    # a mismatching checksum found after following the download extracts nothing
+    out = path.join(tmp, "out-bad")
+    try:
+        download_and_extract(
+            url, path.join(tmp, "follow-bad.tar.gz"), out, sha256="0" * 64, follow=True
+        )
+        assert False
+    except ValueError:
+        pass
+    assert not path.exists(path.join(out, "Project_CodeNet_C++1000"))
+
+    # later problems are merged into the ones extracted before
+    out = path.join(tmp, "out-merged")
+    for problems in [{0}, {1}]:
+        download_and_extract(
+            url, path.join(tmp, "merged.tar.gz"), out, sha256=SHA256, problems=problems
+        )
+    assert sorted(os.listdir(path.join(out, "Project_CodeNet_C++1000"))) == [
+        "p00000",
+        "p00002",
+    ]
+    assert not path.exists(path.join(tmp, "merged.tar.gz.extracting"))
+
+server.shutdown()
@@ -0,0 +1,67 @@
+import sys
+
+sys.path.append(".")
+sys.path.append("scripts")
+import os
+from os import path
+import tempfile
+import numpy as np
+from scripts.fuzz_stats import collect_stats, load_stats, per_problem, save_stats
+
+
+def write_fuzz_out(fuzz_out, bitmap_cvg, plot_rows):
+    os.makedirs(path.join(fuzz_out, "default"))
+    with open(path.join(fuzz_out, "default", "fuzzer_stats"), "w") as f:
+        f.write("run_time          : 60\nexecs_per_sec     : 100.50\n")
+        f.write(f"bitmap_cvg        : {bitmap_cvg:.2f}%\nstability         : 99.00%\n")
+        f.write("paths_total       : 7\ncommand_line      : afl-fuzz -i a:b\n")
+    with open(path.join(fuzz_out, "default", "plot_data"), "w") as f:
+        f.write("# unix_time, cycles_done, cur_path, paths_total, pending_total, ")
+        f.write("pending_favs, map_size, unique_crashes, unique_hangs, max_depth, execs_per_sec\n")
+        for t, map_size in plot_rows:
+            f.write(f"{t}, 0, 0, 1, 0, 0, {map_size:.2f}%, 0, 0, 1, 100.00\n")
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    fuzz_outs = []
+    for i, p, cvg in [("1", "a", 10.0), ("1", "b", 30.0), ("2", "c", 50.0)]:
+        fuzz_out = path.join(tmp, i, p)
+        # coverage stops growing 20s after the start
+        write_fuzz_out(fuzz_out, cvg, [(1000, 1.0), (1010, 2.0), (1020, 3.0), (1030, 3.0)])
+        fuzz_outs.append((i, p, fuzz_out))
+    # never fuzzed
+    fuzz_outs.append(("2", "d", path.join(tmp, "2", "d")))
+
+    stats = collect_stats(fuzz_outs, jobs=2)
+    assert stats["program"].tolist() == ["a", "b", "c"]
+    assert stats["bitmap_cvg"].tolist() == [10.0, 30.0, 50.0]
+    assert stats["corpus_count"].tolist() == [7, 7, 7]
+    assert stats["edges_found"].tolist() == [-1, -1, -1]
+    assert stats["time_to_plateau"].tolist() == [20.0, 20.0, 20.0]
+    assert np.allclose(stats["stability"], 99.0)
+
+    problems = per_problem(stats)
+    assert problems["problem"].tolist() == ["1", "2"]
+    assert problems["count"].tolist() == [2, 1]
+    assert problems["bitmap_cvg_p50"].tolist() == [20.0, 50.0]
+    assert np.isnan(problems["execs_per_sec_mean"]).sum() == 0
+
+    stats_path = path.join(tmp, "fuzz_stats.npz")
+    save_stats(stats_path, stats, problems)
+    loaded, loaded_problems = load_stats(stats_path)
+    assert loaded.tolist() == stats.tolist()
+    assert loaded_problems.tolist() == problems.tolist()
+
+    # unchanged programs are taken from the saved stats
+    write_fuzz_out(path.join(tmp, "2", "d"), 70.0, [(0, 1.0)])
+    with open(path.join(tmp, "1", "a", "default", "plot_data"), "w") as f:
+        f.write("# relative_time, map_size\n")
+    stats = collect_stats(fuzz_outs, jobs=2, stats_path=stats_path)
+    assert stats["program"].tolist() == ["a", "b", "c", "d"]
+    assert stats["time_to_plateau"].tolist() == [20.0, 20.0, 20.0, 0.0]
+
+    # collecting only problem 2 keeps the saved stats of problem 1
+    save_stats(stats_path, stats, per_problem(stats))
+    stats = collect_stats(fuzz_outs[2:], jobs=2, stats_path=stats_path, problems=[2])
+    assert stats["program"].tolist() == ["a", "b", "c", "d"]
+    assert stats["bitmap_cvg"].tolist() == [10.0, 30.0, 50.0, 70.0]
@@ -0,0 +1,22 @@
+import sys
+
+sys.path.append(".")
+from scripts.harness import is_rerun_safe, main_takes_args
+
+
+# no global state
+assert is_rerun_safe("int main(){int n;cin>>n;cout<<n;return 0;}")
+assert is_rerun_safe("struct node{int x;};\nint f(int x){return x;}\nint main(){}")
+assert is_rerun_safe("const int N=100;\n#define M 10\nint main(){char s[]=\"a;b{\";}")
+assert is_rerun_safe("int cmp(const void *a, const void *b){return 0;}int main(){}")
+
+# mutable globals
+assert not is_rerun_safe("int a[100];int main(){return 0;}")
+assert not is_rerun_safe("struct node{int x;} nodes[10];int main(){}")
+assert not is_rerun_safe("vector<int> v(10);int main(){}")
+assert not is_rerun_safe("int main(){static int c=0;}")
+assert not is_rerun_safe("int main(){ios::sync_with_stdio(false);}")
+
+assert not main_takes_args("int main(){}")
+assert not main_takes_args("int main( void ){}")
+assert main_takes_args("int main(int argc, char **argv){}")
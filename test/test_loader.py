@@ -0,0 +1,78 @@
+import sys
+
+sys.path.append(".")
+sys.path.append("scripts")
+import os
+from os import path
+import tempfile
+from scripts.loader import ResultLoader, decode_trace
+from scripts.manifest import FUZZED, POSTPROCESSED, Manifest
+from scripts.pack import PackWriter, get_pack_path
+
+
+assert decode_trace(b"n,d,3\ns,s,a,b\nx,,1.5\nsome warning\n") == [
+    ("n", "d", "3"),
+    ("s", "s", "a,b"),
+    ("x", "", "1.5"),
+]
+
+with tempfile.TemporaryDirectory() as workdir:
+    manifest = Manifest(workdir)
+    manifest.add_programs(
+        [
+            ("1", "10", "src/1/10.cpp", "h0", None),
+            ("1", "11", "src/1/11.cpp", "h1", None),
+            ("1", "12", "src/1/12.cpp", "h0", "1/10"),
+            ("2", "20", "src/2/20.cpp", "h2", None),
+        ]
+    )
+    # recorded at another location, before the workdir was moved
+    fuzz_out = lambda i, p: path.join("/elsewhere/fuzz", i, p)
+    manifest.set_stage(FUZZED, [(i, p, fuzz_out(i, p)) for i, p in [("1", "10"), ("1", "11"), ("2", "20")]])
+    manifest.set_fuzz_stats(
+        [
+            ("1", "10", {"bitmap_cvg": 60.0, "run_time": 10}),
+            ("1", "11", {"bitmap_cvg": 10.0, "run_time": 10}),
+            ("2", "20", {"bitmap_cvg": 45.0, "run_time": 60}),
+        ]
+    )
+    manifest.set_stage(POSTPROCESSED, [(i, p, None) for i, p in [("1", "10"), ("1", "11"), ("2", "20")]])
+    manifest.propagate_to_duplicates()
+
+    # 1/10 is packed, 2/20 still has a file per queue entry
+    out = path.join(workdir, "fuzz", "1", "10", "default")
+    os.makedirs(out)
+    with PackWriter(get_pack_path(out)) as pack:
+        pack.add("id:000000", "input", b"3\n")
+        pack.add("id:000000", "input_csv", b"n,d,3\n")
+        pack.add("id:000000", "output", b"6\n")
+    out = path.join(workdir, "fuzz", "2", "20", "default")
+    for d in ["queue", "output", "input_csv"]:
+        os.makedirs(path.join(out, d))
+    os.makedirs(path.join(out, "queue", ".state"))
+    for name, data in [("queue/id:000000", b"x"), ("output/id:000000", b"y"), ("input_csv/id:000000.csv", b"c,c,x\n")]:
+        with open(path.join(out, name), "wb") as f:
+            f.write(data)
+
+    samples = [
+        (s.problem, s.program, s.name, bytes(s.input), bytes(s.stdout), s.trace)
+        for s in ResultLoader(workdir)
+    ]
+    assert samples == [
+        ("1", "10", "id:000000", b"3\n", b"6\n", [("n", "d", "3")]),
+        ("2", "20", "id:000000", b"x", b"y", [("c", "c", "x")]),
+    ]
+    # 1/11 has no results on disk
+    assert [s.program for s in ResultLoader(workdir, min_bitmap_cvg=5.0)] == ["10", "20"]
+    assert [s.program for s in ResultLoader(workdir, min_bitmap_cvg=50.0)] == ["10"]
+    assert [s.program for s in ResultLoader(workdir, min_run_time=30)] == ["20"]
+    assert [s.program for s in ResultLoader(workdir, sufficiently_fuzzed=True)] == ["10", "20"]
+    assert [s.program for s in ResultLoader(workdir, problems=[2])] == ["20"]
+    # duplicates read the results of their representative
+    assert [s.program for s in ResultLoader(workdir, min_bitmap_cvg=50.0, with_duplicates=True)] == [
+        "10",
+        "12",
+    ]
+    shards = [ResultLoader(workdir, shard=k, num_shards=2) for k in range(2)]
+    assert [len(s) for s in shards] == [2, 1]
+    assert [s.program for s in shards[0]] + [s.program for s in shards[1]] == ["10", "20"]
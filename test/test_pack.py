@@ -0,0 +1,49 @@
+import sys
+
+sys.path.append(".")
+import os
+from os import path
+import tempfile
+from scripts.pack import PackReader, PackWriter, find_fuzz_outs, pack_fuzz_out, zstandard
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    for compress in [False, True] if zstandard is not None else [False]:
+        pack_path = path.join(tmp, f"{compress}.pack")
+        with PackWriter(pack_path, compress=compress) as pack:
+            pack.add("id:000000", "input", b"3\n")
+            pack.add("id:000000", "input_csv", b"int,3\n")
+            pack.add("id:000000", "output", b"6\n")
+            # timed out, no output
+            pack.add("id:000001", "input", b"9" * 10000)
+            pack.add("id:000001", "output", None)
+        with PackReader(pack_path) as pack:
+            assert pack.names() == ["id:000000", "id:000001"]
+            assert [bytes(r) for r in pack.get_triple("id:000000")] == [
+                b"3\n",
+                b"int,3\n",
+                b"6\n",
+            ]
+            assert bytes(pack.get("id:000001", "input")) == b"9" * 10000
+            assert not pack.has("id:000001", "output")
+            assert pack.get("id:000001", "input_csv") is None
+
+    # convert output/ and input_csv/ of an existing AFL output dir
+    fuzz_out = path.join(tmp, "fuzz", "1", "10", "default")
+    for d in ["queue", "output", "input_csv"]:
+        os.makedirs(path.join(fuzz_out, d))
+    for q, stdout in [("id:000000", b"6\n"), ("id:000001", None)]:
+        with open(path.join(fuzz_out, "queue", q), "wb") as f:
+            f.write(q.encode())
+        with open(path.join(fuzz_out, "input_csv", q + ".csv"), "wb") as f:
+            f.write(b"csv")
+        if stdout is not None:
+            with open(path.join(fuzz_out, "output", q), "wb") as f:
+                f.write(stdout)
+    assert find_fuzz_outs(path.join(tmp, "fuzz")) == [fuzz_out]
+    assert pack_fuzz_out(fuzz_out) == 2
+    assert sorted(os.listdir(fuzz_out)) == ["queue", "results.pack"]
+    with PackReader(path.join(fuzz_out, "results.pack")) as pack:
+        assert bytes(pack.get("id:000001", "input")) == b"id:000001"
+        assert bytes(pack.get("id:000000", "output")) == b"6\n"
+        assert pack.get("id:000001", "output") is None
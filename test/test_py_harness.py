@@ -0,0 +1,27 @@
+import sys
+
+sys.path.append(".")
+from os import path
+import tempfile
+from scripts.py_harness import compile_program, load_code, run_code, strip_legacy_harness
+
+legacy = "import afl\nafl.init()\nimport os\nprint(1)\nos._exit(0)\n"
+assert strip_legacy_harness(legacy) == "\n\n\nprint(1)"
+assert strip_legacy_harness("print(1)\n") == "print(1)\n"
+
+with tempfile.TemporaryDirectory() as tmp:
+    src = path.join(tmp, "a.py")
+    with open(src, "w") as f:
+        f.write("counter = globals().get('counter', 0) + 1\nimport sys\nsys.exit(counter)\n")
+    pyc = path.join(tmp, "build", "a.pyc")
+    assert compile_program((src, pyc)) is None
+    code = load_code(pyc)
+    assert code.co_filename == src
+    # every run starts from a fresh namespace
+    assert run_code(code) == 1
+    assert run_code(code) == 1
+
+    with open(src, "w") as f:
+        f.write("print(\n")
+    assert compile_program((src, path.join(tmp, "bad.pyc"))) is not None
+    assert not path.exists(path.join(tmp, "bad.pyc"))
@@ -0,0 +1,44 @@
+import sys
+
+sys.path.append(".")
+import os
+from os import path
+import subprocess
+import tempfile
+import time
+
+# prints its input, a "slow" input hangs after printing part of its output
+TARGET = """read x
+echo "out $x"
+echo "csv,$x" >&2
+if [ "$x" = slow ]; then sleep 30; fi
+"""
+
+with tempfile.TemporaryDirectory() as tmp:
+    target = path.join(tmp, "target.sh")
+    with open(target, "w") as f:
+        f.write(TARGET)
+    fuzz_out = path.join(tmp, "default")
+    os.makedirs(path.join(fuzz_out, "queue"))
+    for name, content in [("id:000000", "fast\n"), ("id:000001", "slow\n"), ("id:000002", "end\n")]:
+        with open(path.join(fuzz_out, "queue", name), "w") as f:
+            f.write(content)
+
+    start = time.monotonic()
+    p = subprocess.run(
+        [sys.executable, "scripts/replay.py", "-t", "1s", fuzz_out, "--", "sh", target],
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    # the hanging input is killed at its timeout, not after it is done
+    assert time.monotonic() - start < 20
+    # only the timed out input is reported
+    assert p.stdout.decode().split() == ["id:000001"]
+
+    output_dir = path.join(fuzz_out, "output")
+    # the partial output of the timed out input is removed
+    assert sorted(os.listdir(output_dir)) == ["id:000000", "id:000002"]
+    with open(path.join(output_dir, "id:000000")) as f:
+        assert f.read() == "out fast\n"
+    with open(path.join(fuzz_out, "input_csv", "id:000002.csv")) as f:
+        assert f.read() == "csv,end\n"
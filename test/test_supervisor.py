@@ -0,0 +1,66 @@
+import sys
+
+sys.path.append(".")
+sys.path.append("scripts")
+import os
+from os import path
+import subprocess
+import tempfile
+import time
+from scripts.supervisor import FuzzSupervisor
+
+
+def write_plot_data(fuzz_out, rows):
+    os.makedirs(path.join(fuzz_out, "default"), exist_ok=True)
+    with open(path.join(fuzz_out, "default", "plot_data"), "w") as f:
+        f.write("# relative_time, cycles_done, cur_item, corpus_count, pending_total, ")
+        f.write("pending_favs, map_size, saved_crashes, saved_hangs, max_depth, ")
+        f.write("execs_per_sec, total_execs, edges_found\n")
+        for t, edges in rows:
+            f.write(f"{t}, 0, 0, 1, 0, 0, 1.00%, 0, 0, 1, 100.00, 100, {edges}\n")
+
+
+def start(supervisor, fuzz_out):
+    p = subprocess.Popen(["sleep", "60"])
+    supervisor.add(p, fuzz_out)
+    return supervisor.instances[p.pid]
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    supervisor = FuzzSupervisor(timeout=60, window=1, poll_interval=0.1)
+    # still in its seeds, plot_data has only the header
+    slow = start(supervisor, path.join(tmp, "slow"))
+    write_plot_data(slow.fuzz_out, [])
+    growing = start(supervisor, path.join(tmp, "growing"))
+    write_plot_data(growing.fuzz_out, [(0, 10)])
+    supervisor.poll()
+    time.sleep(0.6)
+    write_plot_data(growing.fuzz_out, [(0, 10), (5, 20)])
+    supervisor.poll()
+    time.sleep(0.6)
+    supervisor.poll()
+    # no coverage yet is no plateau, growing is 0.6s past its last growth
+    assert slow.stopped_at is None
+    assert growing.stopped_at is None
+
+    # the window starts at the first coverage
+    write_plot_data(slow.fuzz_out, [(0, 5)])
+    supervisor.poll()
+    time.sleep(1.1)
+    supervisor.poll()
+    assert slow.stopped_at is not None and growing.stopped_at is not None
+    assert supervisor.completed == {slow.fuzz_out, growing.fuzz_out}
+    assert supervisor.num_plateaued == 2
+    for instance in [slow, growing]:
+        instance.process.wait(timeout=5)
+
+    # out of time without any coverage isn't completed, with or without a window
+    for window in [1, None]:
+        supervisor = FuzzSupervisor(timeout=1, window=window, poll_interval=0.1)
+        silent = start(supervisor, path.join(tmp, f"silent{window}"))
+        time.sleep(1.1)
+        supervisor.poll()
+        assert silent.stopped_at is not None
+        assert supervisor.completed == set()
+        assert supervisor.num_extended == 0
+        silent.process.wait(timeout=5)